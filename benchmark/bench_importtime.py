@@ -0,0 +1,71 @@
+"""
+用python -X importtime统计导入各模块的耗时（微秒，多次取中位数），超过预算时退出码为1，可以放进CI防止启动变慢
+
+python benchmark/bench_importtime.py --repeat 5 --budget fast_torrent_trackers.trackerbuilder=50000
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = [
+    'fast_torrent_trackers.trackerbuilder',
+    'fast_torrent_trackers.basetracker',
+    'fast_torrent_trackers.tracker.spidertracker',
+    'fast_torrent_trackers.tracker.rarbg',
+]
+_LINE_RE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)')
+
+
+def import_times(module=None):
+    """
+    在新进程里导入模块
+    :param module: 为空时只统计解释器启动时导入的模块
+    :return: {模块名: 累计耗时微秒}
+    """
+    code = f'import {module}' if module else 'pass'
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=ROOT_DIR,
+                            capture_output=True, text=True, check=True).stderr
+    result = {}
+    for line in output.splitlines():
+        m = _LINE_RE.match(line)
+        if m:
+            result[m.group(4)] = int(m.group(2))
+    return result
+
+
+def measure(module, repeat):
+    times = [import_times(module) for _ in range(repeat)]
+    return statistics.median(t.get(module, 0) for t in times), times[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--budget', action='append', default=[], help='模块名=微秒，超过时退出码为1')
+    args = parser.parse_args()
+    budgets = dict((k, int(v)) for k, v in (b.split('=') for b in args.budget))
+    # 解释器启动时就会导入的模块不算在被测模块头上
+    startup = set(import_times())
+    exceeded = []
+    for module in MODULES + [m for m in budgets if m not in MODULES]:
+        cost, detail = measure(module, args.repeat)
+        heavy = sorted(((v, k) for k, v in detail.items() if k != module and k not in startup and '.' not in k),
+                       reverse=True)[:3]
+        line = f'{module:<45}{cost / 1000:>10.1f} ms'
+        if heavy:
+            line += '  最慢的依赖：' + ', '.join(f'{k} {v / 1000:.1f} ms' for v, k in heavy)
+        print(line)
+        if module in budgets and cost > budgets[module]:
+            exceeded.append(module)
+    if exceeded:
+        print('超过预算：' + ', '.join(exceeded))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
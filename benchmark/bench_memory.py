@@ -0,0 +1,90 @@
+"""
+比较TorrentInfo、CompactTorrentInfo、TorrentBatch每个种子常驻内存占用的字节数
+
+python benchmark/bench_memory.py --count 100000
+"""
+import argparse
+import copy
+import gc
+import logging
+import os
+import sys
+import tracemalloc
+
+import yaml
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from fast_torrent_trackers.models import CompactTorrentInfo
+from fast_torrent_trackers.torrentbatch import TorrentBatch
+from fast_torrent_trackers.tracker.spidertracker import TrackerParser
+
+FIXTURE_DIR = os.path.join(ROOT_DIR, 'test', 'fixtures')
+CONFIG_DIR = os.path.join(ROOT_DIR, 'trackers_config')
+
+
+def load_samples():
+    """用测试页面解析出各站点真实结构的种子作为样本"""
+    samples = []
+    for site_id in sorted(os.listdir(FIXTURE_DIR)):
+        with open(os.path.join(CONFIG_DIR, f'{site_id}.yml'), 'r', encoding='utf-8') as f:
+            site_config = yaml.safe_load(f)
+        with open(os.path.join(FIXTURE_DIR, site_id, 'search.html'), 'r', encoding='utf-8') as f:
+            html_text = f.read()
+        parser = TrackerParser(site_config, 'lxml')
+        samples += parser.parse_torrents(html_text, {'userinfo': parser.parse_userinfo(html_text)})
+    return samples
+
+
+def generate(samples, count, fresh_strings=True):
+    """
+    按样本生成count个种子，时间是新对象；fresh_strings时字符串也是新对象，和真实抓取到的数据一样不共享，
+    否则共用样本的字符串，只统计对象结构本身的开销
+    """
+    for i in range(count):
+        t = copy.copy(samples[i % len(samples)])
+        t.id = t.id + i
+        if fresh_strings:
+            for name in ('name', 'subject', 'details_url', 'download_url', 'poster_url', 'imdb_id'):
+                value = getattr(t, name, None)
+                if isinstance(value, str):
+                    setattr(t, name, f'{value}#{i}')
+        if t.publish_date:
+            t.publish_date = t.publish_date.replace(microsecond=i % 1000000)
+        yield t
+
+
+def measure(build, samples, count, fresh_strings=True):
+    gc.collect()
+    tracemalloc.start()
+    container = build(generate(samples, count, fresh_strings))
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del container
+    return current / count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=100000)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    samples = load_samples()
+    builders = [
+        ('TorrentInfo', list),
+        ('CompactTorrentInfo', lambda it: [CompactTorrentInfo.from_object(t) for t in it]),
+        ('TorrentBatch', TorrentBatch),
+    ]
+    results = [(name, measure(build, samples, args.count), measure(build, samples, args.count, False))
+               for name, build in builders]
+    print(f'{args.count}个种子，每个种子常驻内存（字节）：')
+    print(f'{"":<20}{"含字符串":>10}{"":>8}{"不含字符串":>10}')
+    for name, total, overhead in results:
+        print(f'{name:<20}{total:>12.0f}{total / results[0][1]:>8.0%}{overhead:>12.0f}'
+              f'{overhead / results[0][2]:>8.0%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+比较逐个转换（DictWrapper.get_int、trans_size_str_to_mb、strptime）和同一页共用Normalizer逐行转换尺寸、数量、日期的耗时
+
+python benchmark/bench_normalize.py --repeat 200
+"""
+import argparse
+import datetime
+import logging
+import os
+import sys
+import time
+
+import yaml
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from fast_torrent_trackers.htmlparser import HtmlParser, get_backend
+from fast_torrent_trackers.normalize import Normalizer, parse_datetime
+from fast_torrent_trackers.utils import DictWrapper, trans_size_str_to_mb
+
+FIXTURE_DIR = os.path.join(ROOT_DIR, 'test', 'fixtures')
+CONFIG_DIR = os.path.join(ROOT_DIR, 'trackers_config')
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def load_pages():
+    """每个站点测试页面解析出的原始字段，一个站点一页"""
+    pages = []
+    for site_id in sorted(os.listdir(FIXTURE_DIR)):
+        with open(os.path.join(CONFIG_DIR, f'{site_id}.yml'), 'r', encoding='utf-8') as f:
+            site_config = yaml.safe_load(f)
+        with open(os.path.join(FIXTURE_DIR, site_id, 'search.html'), 'r', encoding='utf-8') as f:
+            html_text = f.read()
+        plan = HtmlParser.compile(site_config['torrents']['fields'], get_backend('lxml'))
+        soup = plan.backend.parse_document(html_text)
+        rows = plan.backend.select(soup, site_config['torrents']['list']['selector'])
+        pages.append([plan.parse(tag) for tag in rows])
+    return pages
+
+
+def load_dates(pages):
+    """把解析出的发布时间还原成站点上最常见的格式，作为日期转换的输入"""
+    dates = []
+    for items in pages:
+        page = []
+        for item in items:
+            value = item.get('date')
+            if isinstance(value, datetime.datetime):
+                page.append(value.strftime(DATE_FORMAT))
+        dates.append(page)
+    return dates
+
+
+def convert_before(pages, dates):
+    for items, page_dates in zip(pages, dates):
+        for item in items:
+            item = DictWrapper(item)
+            trans_size_str_to_mb(str(item.get_value('size', 0)))
+            item.get_int('seeders', 0)
+            item.get_int('leechers', 0)
+            item.get_int('grabs', 0)
+        for value in page_dates:
+            datetime.datetime.strptime(value, DATE_FORMAT)
+
+
+def convert_after(pages, dates):
+    for items, page_dates in zip(pages, dates):
+        # 和TorrentInfo.build_by_parse_item一样，同一页的种子共用一个Normalizer
+        normalizer = Normalizer()
+        for item in items:
+            normalizer.size_mb(item.get('size'))
+            normalizer.to_int(item.get('seeders'), 0)
+            normalizer.to_int(item.get('leechers'), 0)
+            normalizer.to_int(item.get('grabs'), 0)
+        for value in page_dates:
+            parse_datetime(value, DATE_FORMAT)
+
+
+def timing(func, pages, dates, repeat):
+    parse_datetime.cache_clear()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(pages, dates)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    pages = load_pages()
+    dates = load_dates(pages)
+    rows = sum(len(items) for items in pages) * args.repeat
+    before = timing(convert_before, pages, dates, args.repeat)
+    after = timing(convert_after, pages, dates, args.repeat)
+    # 每轮都换新的日期缓存，只看固定格式快速路径本身
+    after_cold = 0.0
+    for _ in range(args.repeat):
+        after_cold += timing(convert_after, pages, dates, 1)
+    print(f'{len(pages)}页，共转换{rows}行：')
+    print(f'{"逐个转换":<12}{before * 1e6 / rows:>10.2f} us/行')
+    print(f'{"共用Normalizer":<12}{after * 1e6 / rows:>10.2f} us/行{before / after:>8.1f}x')
+    print(f'{"共用Normalizer无日期缓存":<10}{after_cold * 1e6 / rows:>10.2f} us/行{before / after_cold:>8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+"""
+离线解析性能测试：用test/fixtures下保存的各站点搜索页、用户信息页，统计每个解析后端
+TrackerParser.parse_torrents、parse_userinfo、HtmlParser.parse_item_fields、TorrentInfo.build_by_parse_item
+每秒处理的行数（用户信息页为页数）以及解析一页种子的内存峰值；
+lxml后端还统计按块流式解析的内存峰值和拿到第一个种子时已收到的页面比例。
+
+python benchmark/bench_parse.py --output result.json
+python benchmark/bench_parse.py --backend lxml --compare result.json --threshold 0.2
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import yaml
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from fast_torrent_trackers.htmlparser import HtmlParser, get_backend
+from fast_torrent_trackers.models import TorrentInfo
+from fast_torrent_trackers.normalize import Normalizer
+from fast_torrent_trackers.tracker.spidertracker import TrackerParser
+
+FIXTURE_DIR = os.path.join(ROOT_DIR, 'test', 'fixtures')
+CONFIG_DIR = os.path.join(ROOT_DIR, 'trackers_config')
+BACKENDS = ['bs4', 'lxml']
+# 数值越大越好的指标，其余（内存）越小越好
+RATE_METRICS = ['parse_torrents_rows_per_sec', 'parse_userinfo_pages_per_sec', 'parse_item_fields_rows_per_sec',
+                'build_by_parse_item_rows_per_sec']
+MEMORY_METRICS = ['parse_torrents_peak_kb', 'stream_torrents_peak_kb']
+# 流式解析每次喂入的字节数
+STREAM_CHUNK_SIZE = 16 * 1024
+
+
+def load_site(site_id):
+    with open(os.path.join(CONFIG_DIR, f'{site_id}.yml'), 'r', encoding='utf-8') as f:
+        site_config = yaml.safe_load(f)
+    pages = {}
+    for page in ('search', 'userinfo'):
+        with open(os.path.join(FIXTURE_DIR, site_id, f'{page}.html'), 'r', encoding='utf-8') as f:
+            pages[page] = f.read()
+    return site_config, pages
+
+
+def timed(func, repeat, setup=None):
+    """
+    执行repeat次，setup的结果作为func的参数且不计入耗时
+    :return: 总耗时秒
+    """
+    elapsed = 0.0
+    for _ in range(repeat):
+        args = setup() if setup else ()
+        start = time.perf_counter()
+        func(*args)
+        elapsed += time.perf_counter() - start
+    return elapsed
+
+
+def bench_site(site_id, backend_name, repeat):
+    site_config, pages = load_site(site_id)
+    backend = get_backend(backend_name)
+    parser = TrackerParser(site_config, backend_name)
+    search_html = pages['search']
+    context = {'userinfo': parser.parse_userinfo(pages['userinfo'])}
+    fields_rule = site_config['torrents']['fields']
+    list_selector = site_config['torrents']['list']['selector']
+    torrents = parser.parse_torrents(search_html, context)
+    rows = len(torrents)
+    result = {'site': site_id, 'backend': backend_name, 'rows': rows}
+
+    elapsed = timed(lambda: parser.parse_torrents(search_html, context), repeat)
+    result['parse_torrents_rows_per_sec'] = rows * repeat / elapsed
+    elapsed = timed(lambda: parser.parse_userinfo(pages['userinfo']), repeat)
+    result['parse_userinfo_pages_per_sec'] = repeat / elapsed
+
+    def select_rows():
+        # 字段规则里的remove会修改文档，每轮重新解析文档，只统计字段解析
+        return backend.select(backend.parse_document(search_html), list_selector),
+
+    def parse_fields(tags):
+        for tag in tags:
+            HtmlParser.parse_item_fields(tag, fields_rule, context, backend)
+
+    elapsed = timed(parse_fields, repeat, select_rows)
+    result['parse_item_fields_rows_per_sec'] = len(select_rows()[0]) * repeat / elapsed
+
+    plan = HtmlParser.compile(fields_rule, backend)
+    items = [plan.parse(tag, context) for tag in select_rows()[0]]
+
+    def build():
+        normalizer = Normalizer()
+        for item in items:
+            TorrentInfo.build_by_parse_item(site_config, item, normalizer, parser.category_index)
+
+    elapsed = timed(build, repeat)
+    result['build_by_parse_item_rows_per_sec'] = len(items) * repeat / elapsed
+
+    gc.collect()
+    tracemalloc.start()
+    parser.parse_torrents(search_html, context)
+    result['parse_torrents_peak_kb'] = tracemalloc.get_traced_memory()[1] / 1024
+    tracemalloc.stop()
+    if hasattr(backend, 'stream_document'):
+        result.update(bench_stream(parser, search_html.encode('utf-8'), context))
+    return result
+
+
+def bench_stream(parser, data, context):
+    """
+    按块喂入页面字节流式解析，统计拿到第一个种子时已经收到的字节比例和内存峰值（不含页面本身）
+    """
+    chunks = [data[i:i + STREAM_CHUNK_SIZE] for i in range(0, len(data), STREAM_CHUNK_SIZE)]
+    gc.collect()
+    tracemalloc.start()
+    stream = parser.stream_torrents('utf-8', context)
+    first_bytes = None
+    received = 0
+    for chunk in chunks:
+        received += len(chunk)
+        if stream.feed(chunk) and first_bytes is None:
+            first_bytes = received
+    stream.close()
+    peak = tracemalloc.get_traced_memory()[1] / 1024
+    tracemalloc.stop()
+    return {'stream_torrents_peak_kb': peak, 'stream_first_row_at': (first_bytes or len(data)) / len(data)}
+
+
+def compare(results, baseline, threshold):
+    """
+    和之前保存的结果比较，吞吐下降或内存上涨超过threshold的指标视为退化
+    :return: 退化项说明列表
+    """
+    old = {(r['site'], r['backend']): r for r in baseline['results']}
+    regressions = []
+    for r in results:
+        b = old.get((r['site'], r['backend']))
+        if not b:
+            continue
+        for metric in RATE_METRICS:
+            if metric in b and r[metric] < b[metric] * (1 - threshold):
+                regressions.append(f'{r["site"]}/{r["backend"]} {metric}: {b[metric]:.0f} -> {r[metric]:.0f}')
+        for metric in MEMORY_METRICS:
+            if metric in b and r[metric] > b[metric] * (1 + threshold):
+                regressions.append(f'{r["site"]}/{r["backend"]} {metric}: {b[metric]:.0f} -> {r[metric]:.0f}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--backend', action='append', choices=BACKENDS, help='默认测试全部后端')
+    parser.add_argument('--site', action='append', help='默认测试test/fixtures下的全部站点')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='结果保存为JSON文件')
+    parser.add_argument('--compare', help='之前保存的JSON结果，有退化时退出码为1')
+    parser.add_argument('--threshold', type=float, default=0.2)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    sites = args.site or sorted(os.listdir(FIXTURE_DIR))
+    results = [bench_site(site_id, backend, args.repeat) for backend in (args.backend or BACKENDS)
+               for site_id in sites]
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'results': results,
+    }
+    print(f'{"站点":<12}{"后端":<6}{"行数":>5}{"种子行/秒":>12}{"用户页/秒":>10}{"字段行/秒":>12}'
+          f'{"构建行/秒":>12}{"峰值KB":>10}{"流式峰值KB":>12}')
+    for r in results:
+        print(f'{r["site"]:<14}{r["backend"]:<8}{r["rows"]:>5}{r["parse_torrents_rows_per_sec"]:>14.0f}'
+              f'{r["parse_userinfo_pages_per_sec"]:>14.0f}{r["parse_item_fields_rows_per_sec"]:>14.0f}'
+              f'{r["build_by_parse_item_rows_per_sec"]:>14.0f}{r["parse_torrents_peak_kb"]:>12.0f}'
+              f'{r.get("stream_torrents_peak_kb", float("nan")):>14.0f}')
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print('性能退化：')
+            for line in regressions:
+                print(line)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""
+用回放测试页面的本地站点（FixtureReplayer）压测完整的搜索、下载流程，不访问真实站点。
+统计搜索、下载的吞吐、分位延迟，重试放大倍数（实际尝试次数 / 发起的操作数）以及平均每个操作打到站点的请求数
+
+python benchmark/loadtest.py --site mteam --sites 20 --searches 2000 --downloads 20 --concurrency 500 \
+    --latency 0.05 --jitter 0.1 --overload 0.01 --rate-limit 0.01 --download-notice 0.2
+"""
+import argparse
+import asyncio
+import copy
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import yaml
+from tenacity import AsyncRetrying, retry_if_not_exception_type, stop_after_attempt, wait_fixed
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from fast_torrent_trackers.exceptions import LoginRequired
+from fast_torrent_trackers.simulator import FaultConfig, LatencyRecorder, FixtureReplayer
+from fast_torrent_trackers.tracker.spidertracker import SpiderTracker
+
+FIXTURE_DIR = os.path.join(ROOT_DIR, 'test', 'fixtures')
+CONFIG_DIR = os.path.join(ROOT_DIR, 'trackers_config')
+
+
+def load_site(site_id):
+    with open(os.path.join(CONFIG_DIR, f'{site_id}.yml'), 'r', encoding='utf-8') as f:
+        site_config = yaml.safe_load(f)
+    pages = {}
+    for page in ('search', 'userinfo'):
+        with open(os.path.join(FIXTURE_DIR, site_id, f'{page}.html'), 'r', encoding='utf-8') as f:
+            pages[page] = f.read()
+    return site_config, pages
+
+
+def build_sites(args, faults):
+    """
+    按同一个站点配置克隆出多个站点编号不同的站点，每个站点一个回放服务端；
+    限流器按站点实例创建，站点越多总吞吐越高
+    """
+    site_config, pages = load_site(args.site)
+    sites = []
+    for i in range(args.sites):
+        config = copy.deepcopy(site_config)
+        config['id'] = f'{site_config["id"]}-{i}'
+        if args.client_rate:
+            config['search']['parallel'] = {'max_concurrency': args.concurrency}
+            config['rate_limit'] = dict(config.get('rate_limit') or {},
+                                        search={'rate': args.client_rate, 'per': 1, 'burst': args.concurrency})
+        simulator = FixtureReplayer(config, pages['search'], pages['userinfo'], faults)
+        tracker = SpiderTracker(config, 'c_secure_uid=1', user_agent='loadtest', parallel_search=True,
+                                parser_backend=args.parser_backend)
+        sites.append((simulator.attach(tracker), simulator))
+    return sites
+
+
+async def run_with_retry(recorder, func, attempts, backoff):
+    """和TrackerSearcher一样，除了需要重新登录外的错误都重试，等待时间缩短到backoff秒"""
+    async for attempt in AsyncRetrying(retry=retry_if_not_exception_type(LoginRequired), reraise=True,
+                                       stop=stop_after_attempt(attempts), wait=wait_fixed(backoff)):
+        with attempt:
+            recorder.attempts += 1
+            return await func()
+
+
+async def timed(recorder, semaphore, func, attempts, backoff):
+    async with semaphore:
+        start = time.perf_counter()
+        try:
+            result = await run_with_retry(recorder, func, attempts, backoff)
+            recorder.record(time.perf_counter() - start)
+            return result
+        except Exception as e:
+            recorder.record(time.perf_counter() - start, e)
+
+
+async def run(args):
+    faults = FaultConfig(latency=args.latency, jitter=args.jitter, max_rps=args.max_rps, rate_limit=args.rate_limit,
+                         overload=args.overload, cloudflare=args.cloudflare, download_notice=args.download_notice,
+                         seed=args.seed)
+    sites = build_sites(args, faults)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    search_recorder = LatencyRecorder()
+    download_recorder = LatencyRecorder()
+
+    search_recorder.start()
+    tasks = []
+    for i in range(args.searches):
+        tracker, _ = sites[i % len(sites)]
+        func = lambda tracker=tracker, i=i: tracker.search(keyword=f'keyword {i}')
+        tasks.append(timed(search_recorder, semaphore, func, args.attempts, args.backoff))
+    results = await asyncio.gather(*tasks)
+    search_recorder.finish()
+    search_requests = sum(s.stats.get('requests', 0) for _, s in sites)
+
+    urls = [t.download_url for r in results if r for t in r if t.download_url]
+    with tempfile.TemporaryDirectory() as tmp:
+        download_recorder.start()
+        tasks = []
+        for i in range(min(args.downloads, len(urls) * len(sites))):
+            tracker, _ = sites[i % len(sites)]
+            # 站点download自带的重试间隔以分钟计，压测时只请求一次，由外层按backoff重试
+            download = type(tracker).download.retry_with(stop=stop_after_attempt(1))
+            filepath = os.path.join(tmp, f'{i}.torrent')
+            url = urls[i % len(urls)]
+            func = lambda tracker=tracker, url=url, filepath=filepath: download(tracker, url, filepath)
+            tasks.append(timed(download_recorder, semaphore, func, args.attempts, args.backoff))
+        await asyncio.gather(*tasks)
+        download_recorder.finish()
+    download_requests = sum(s.stats.get('requests', 0) for _, s in sites) - search_requests
+
+    stats = {}
+    for _, simulator in sites:
+        for k, v in simulator.stats.items():
+            stats[k] = stats.get(k, 0) + v
+    for tracker, _ in sites:
+        await tracker.aclose()
+    search = search_recorder.summary()
+    download = download_recorder.summary()
+    search['requests_per_op'] = search_requests / search['count'] if search['count'] else 0.0
+    download['requests_per_op'] = download_requests / download['count'] if download['count'] else 0.0
+    return {'search': search, 'download': download, 'server': stats}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--site', default='mteam', help='test/fixtures下的站点')
+    parser.add_argument('--sites', type=int, default=10, help='克隆出的模拟站点数量')
+    parser.add_argument('--searches', type=int, default=1000)
+    parser.add_argument('--downloads', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--attempts', type=int, default=3, help='每个操作最多尝试次数')
+    parser.add_argument('--backoff', type=float, default=0.1, help='重试前等待秒数')
+    parser.add_argument('--client-rate', type=float, default=None,
+                        help='覆盖站点配置的rate_limit.search，每秒搜索次数，为空时按站点配置限速')
+    parser.add_argument('--parser-backend', default='lxml', choices=['bs4', 'lxml'])
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--max-rps', type=float, default=None)
+    parser.add_argument('--rate-limit', type=float, default=0.0)
+    parser.add_argument('--overload', type=float, default=0.0)
+    parser.add_argument('--cloudflare', type=float, default=0.0)
+    parser.add_argument('--download-notice', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--output', help='结果保存为JSON文件')
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    report = asyncio.run(run(args))
+    for name in ('search', 'download'):
+        r = report[name]
+        print(f'{name}: {r["count"]}次，{r["throughput"]:.1f}次/秒，p50 {r["p50"] * 1000:.0f}ms，'
+              f'p95 {r["p95"] * 1000:.0f}ms，p99 {r["p99"] * 1000:.0f}ms，'
+              f'重试放大{r["retry_amplification"]:.2f}倍，每次{r["requests_per_op"]:.2f}个请求，错误{r["errors"]}')
+    print(f'模拟站点：{report["server"]}')
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
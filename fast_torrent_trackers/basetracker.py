@@ -1,23 +1,202 @@
+import asyncio
+import contextlib
+import datetime
+import importlib.util
+import inspect
+import logging
+import threading
+import time
 from abc import ABCMeta, abstractmethod
 from typing import List
 
-from random_user_agent.params import SoftwareName
-from random_user_agent.user_agent import UserAgent
+import httpx
 
-from fast_torrent_trackers.models import CateLevel1, TrackerUserinfo, TorrentList
+from fast_torrent_trackers.metrics import TrackerMetrics
+from fast_torrent_trackers.models import CateLevel1, CategoryIndex, TrackerUserinfo, TorrentList
+from fast_torrent_trackers.ratelimiter import AdaptiveRateLimiter
 from fast_torrent_trackers.utils import render_text
 
-user_agent_rotator = UserAgent(
-    software_names=[SoftwareName.CHROME.value, SoftwareName.FIREFOX.value, SoftwareName.ANDROID.value,
-                    SoftwareName.OPERA.value, SoftwareName.OPERA_MINI.value, SoftwareName.UC_BROWSER.value,
-                    SoftwareName.SAFARI.value],
-    limit=100)
+_LOGGER = logging.getLogger(__name__)
+
+
+class LazyUserAgentRotator:
+    """
+    随机UA池，第一次取UA时才导入random_user_agent并生成，只导入模块、指定了user_agent的场景不用付出这个开销
+    """
+
+    def __init__(self, limit=100):
+        self.limit = limit
+        self._rotator = None
+        self._lock = threading.Lock()
+
+    def _create(self):
+        from random_user_agent.params import SoftwareName
+        from random_user_agent.user_agent import UserAgent
+        return UserAgent(
+            software_names=[SoftwareName.CHROME.value, SoftwareName.FIREFOX.value, SoftwareName.ANDROID.value,
+                            SoftwareName.OPERA.value, SoftwareName.OPERA_MINI.value, SoftwareName.UC_BROWSER.value,
+                            SoftwareName.SAFARI.value],
+            limit=self.limit)
+
+    def get_random_user_agent(self) -> str:
+        if self._rotator is None:
+            with self._lock:
+                if self._rotator is None:
+                    self._rotator = self._create()
+        return self._rotator.get_random_user_agent()
+
+
+user_agent_rotator = LazyUserAgentRotator()
+# 长连接池默认规格，每个站点一个客户端，连接数不需要太多
+DEFAULT_POOL_LIMITS = httpx.Limits(max_connections=10, max_keepalive_connections=5, keepalive_expiry=30)
+
+
+def is_http2_available():
+    return importlib.util.find_spec('h2') is not None
 
 
 class BaseTracker(metaclass=ABCMeta):
     category_mappings = None
+    # 分类配置的只读索引，category_mappings初始化后建立
+    category_index: CategoryIndex = None
     site_config = None
     cookies = None
+    proxies = None
+    http2 = None
+    pool_limits = None
+    # 自定义的httpx传输层，默认为空走网络
+    transport = None
+    client = None
+    _client_loop = None
+    # 搜索结果缓存，SearchCache实例，为空时不缓存
+    search_cache = None
+    # 按请求类型的自适应限流器，_init_rate_limiters初始化
+    search_limiter: AdaptiveRateLimiter = None
+    userinfo_limiter: AdaptiveRateLimiter = None
+    download_limiter: AdaptiveRateLimiter = None
+    # 分阶段耗时和计数，TrackerMetrics实例，为空时不记录
+    metrics: TrackerMetrics = None
+    # 搜索结果第一页的页码，NexusPHP从0开始；站点不支持翻页时为None
+    first_page = 0
+    # 站点搜索是否支持多个关键字"或"匹配（比如NexusPHP的search_mode=1），支持时search_any只请求一次
+    keyword_or = False
+
+    @classmethod
+    def from_config(cls, site_config, **options):
+        """
+        TrackerBuilder构建站点时调用，默认只把构造方法接受的参数传进去；参数名和TrackerBuilder.build不一致的站点自行重写
+        :param site_config:
+        :param options: TrackerBuilder.build的参数，比如cookie、proxies、user_agent、search_cache、metrics
+        :return:
+        """
+        params = inspect.signature(cls.__init__).parameters
+        if not any(p.kind == inspect.Parameter.VAR_KEYWORD for p in params.values()):
+            options = dict((k, v) for k, v in options.items() if k in params)
+        return cls(site_config, **options)
+
+    def _init_http_options(self, http2=None, pool_limits=None):
+        """
+        初始化长连接客户端的参数，http2未指定时，以站点配置文件中的http2为准
+        :param http2:
+        :param pool_limits: httpx.Limits，连接池规格
+        :return:
+        """
+        if http2 is None:
+            http2 = bool(self.site_config.get('http2', False))
+        if http2 and not is_http2_available():
+            _LOGGER.warning(f'{self.get_name()}配置了http2，但是没有安装h2，自动降级为http1.1')
+            http2 = False
+        self.http2 = http2
+        self.pool_limits = pool_limits if pool_limits else DEFAULT_POOL_LIMITS
+
+    def _init_rate_limiters(self, defaults: dict):
+        """
+        按站点配置文件的rate_limit给每类请求建立自适应限流器，比如：
+        rate_limit:
+          search: {rate: 1, per: 3, max_rate: 2}
+          download: {rate: 1, per: 15}
+        :param defaults: {请求类型: 限流参数}，站点没有配置的参数取这里的值
+        :return:
+        """
+        config = self.site_config.get('rate_limit') or {}
+        for operation, default in defaults.items():
+            setattr(self, f'{operation}_limiter', AdaptiveRateLimiter.from_config(config.get(operation), default))
+
+    def _observe(self, stage, seconds):
+        if self.metrics is not None:
+            self.metrics.observe(self.get_id(), stage, seconds)
+
+    def record_metric(self, name, value=1):
+        """
+        计数加value，没有metrics时什么也不做；结果补充阶段这类站点实例外的代码也通过它记录
+        :param name: 计数名
+        :param value:
+        :return:
+        """
+        if self.metrics is not None:
+            self.metrics.incr(self.get_id(), name, value)
+
+    def _timer(self, stage):
+        """
+        :param stage: 阶段名
+        :return: 记录耗时的上下文，没有metrics时什么也不做
+        """
+        if self.metrics is None:
+            return contextlib.nullcontext()
+        return self.metrics.timer(self.get_id(), stage)
+
+    @contextlib.asynccontextmanager
+    async def _limit(self, limiter: AdaptiveRateLimiter, stage):
+        """
+        进入限流器，等令牌的时间记为stage阶段的耗时
+        :param limiter:
+        :param stage:
+        :return:
+        """
+        start = time.perf_counter()
+        async with limiter:
+            self._observe(stage, time.perf_counter() - start)
+            yield
+
+    def _create_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            cookies=self.cookies,
+            http2=bool(self.http2),
+            limits=self.pool_limits or DEFAULT_POOL_LIMITS,
+            proxies=self.proxies,
+            transport=self.transport,
+            follow_redirects=True
+        )
+
+    def get_client(self) -> httpx.AsyncClient:
+        """
+        获取站点的长连接客户端，整个站点生命周期内复用连接池，免去每次请求的DNS、TCP、TLS握手开销
+        :return:
+        """
+        loop = asyncio.get_running_loop()
+        if self.client is None or self.client.is_closed or self._client_loop is not loop:
+            # 连接池绑定在事件循环上，换了事件循环（比如多次asyncio.run）必须重建
+            self.client = self._create_client()
+            self._client_loop = loop
+        return self.client
+
+    async def aclose(self):
+        client = self.client
+        loop = self._client_loop
+        self.client = None
+        self._client_loop = None
+        if client is None or client.is_closed:
+            return
+        if loop is not asyncio.get_running_loop():
+            # 创建客户端的事件循环已经结束，连接随之失效，直接丢弃
+            return
+        await client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
 
     def get_id(self):
         return self.site_config.get('id')
@@ -53,7 +232,11 @@ class BaseTracker(metaclass=ABCMeta):
         return payload
 
     def _get_response_text(self, r):
-        return str(r.content, self.get_encoding())
+        if self.metrics is None:
+            return str(r.content, self.get_encoding())
+        self.record_metric('bytes_received', len(r.content))
+        with self._timer('decode'):
+            return str(r.content, self.get_encoding())
 
     @staticmethod
     def _init_category_mappings(category_mappings):
@@ -63,13 +246,13 @@ class BaseTracker(metaclass=ABCMeta):
             cates.append(c)
         return category_mappings
 
+    def _init_category_index(self):
+        self.category_index = CategoryIndex(self.category_mappings, self.site_config.get('category_id_mapping'))
+
     def _get_cate_id_from_level2(self, level2):
         if not level2:
             return
-        for c in self.category_mappings:
-            if c.get('cate_level2') == level2:
-                return c.get('id')
-        return
+        return self.category_index.id_by_level2.get(level2)
 
     def _get_cate_level2_ids(self, cate_level1_list: List[CateLevel1] = None):
         """
@@ -77,37 +260,10 @@ class BaseTracker(metaclass=ABCMeta):
         :param cate_level1_list:
         :return:
         """
-        if not cate_level1_list:
-            ids = []
-            # 为空不查成人
-            for c in self.category_mappings:
-                if c['cate_level1'] == CateLevel1.AV.name:
-                    continue
-                ids.append(c['id'])
-            return ids
-        cate_level1_str_arr = [i.name for i in cate_level1_list]
-        cate2_ids = []
-        # 找到一级分类下所有的二级分类编号
-        for c in self.category_mappings:
-            if c.get('cate_level1') in cate_level1_str_arr or c.get('cate_level1') == '*':
-                cate2_ids.append(c.get('id'))
-        return cate2_ids
+        return self.category_index.get_ids_by_level1(cate_level1_list)
 
     def _trans_search_cate_id(self, ids):
-        if not ids:
-            return ids
-        id_mapping = self.site_config.get('category_id_mapping')
-        if not id_mapping:
-            return ids
-        new_ids = []
-        for id in ids:
-            for mid in id_mapping:
-                if mid.get('id') == id:
-                    if isinstance(mid.get('mapping'), list):
-                        new_ids += mid.get('mapping')
-                    else:
-                        new_ids.append(mid.get('mapping'))
-        return list(filter(None, new_ids))
+        return self.category_index.get_search_ids(ids)
 
     @abstractmethod
     async def get_userinfo(self, refresh=False) -> TrackerUserinfo:
@@ -119,6 +275,109 @@ class BaseTracker(metaclass=ABCMeta):
                      timeout=None) -> TorrentList:
         pass
 
+    async def search_any(self, keywords: List[str], cate_level1_list: list = None, free: bool = False,
+                         timeout=None) -> TorrentList:
+        """
+        搜索包含任一关键字的种子，默认逐个关键字搜索后去重合并，支持"或"搜索的站点自行重写
+        :param keywords:
+        :param cate_level1_list:
+        :param free:
+        :param timeout:
+        :return:
+        """
+        result: TorrentList = []
+        ids = set()
+        for keyword in keywords:
+            for t in await self.search(keyword=keyword, cate_level1_list=cate_level1_list, free=free,
+                                       timeout=timeout) or []:
+                if t.id in ids:
+                    continue
+                ids.add(t.id)
+                result.append(t)
+        return result
+
+    async def list_since(self, watermark=None, cate_level1_list: list = None, timeout=None) -> TorrentList:
+        """
+        增量拉取最新种子列表，只返回水位线之后的新种子；默认拉取整页后过滤，能在解析时提前停止的站点自行重写
+        :param watermark: Watermark，为空时返回整页
+        :param cate_level1_list:
+        :param timeout:
+        :return:
+        """
+        torrents = await self.search(cate_level1_list=cate_level1_list, timeout=timeout)
+        if not torrents or watermark is None:
+            return torrents
+        return [t for t in torrents if not watermark.is_seen(t.id, t.publish_date)]
+
+    async def iter_pages(self, keyword=None, imdb_id=None, cate_level1_list: list = None, free: bool = False,
+                         timeout=None, max_pages: int = 10, max_rows: int = None,
+                         oldest_date: datetime.datetime = None, prefetch: bool = True):
+        """
+        逐页搜索，调用方处理第N页时后台已经在请求第N+1页，预取的请求同样要经过站点的搜索限流。
+        翻到max_pages页、遇到空页（或整页都是前面出现过的种子）、页面里的种子早于oldest_date、累计产出max_rows个种子时停止
+        :param keyword:
+        :param imdb_id:
+        :param cate_level1_list:
+        :param free:
+        :param timeout:
+        :param max_pages: 最多请求的页数
+        :param max_rows: 最多产出的种子数
+        :param oldest_date: 只要这之后发布的种子，翻到更早的种子就不再往后翻
+        :param prefetch: 是否预取下一页
+        :return: 异步迭代每一页的种子列表，已经出现过的种子会去掉
+        """
+        if self.first_page is None:
+            max_pages = min(max_pages, 1)
+        first_page = self.first_page or 0
+
+        def fetch(n):
+            page = first_page + n
+            return asyncio.ensure_future(self.search(keyword=keyword, imdb_id=imdb_id,
+                                                     cate_level1_list=cate_level1_list, free=free,
+                                                     page=page if page else None, timeout=timeout))
+
+        seen = set()
+        rows = 0
+        task = fetch(0) if max_pages > 0 else None
+        try:
+            n = 0
+            while task is not None:
+                torrents = await task
+                task = None
+                n += 1
+                page = []
+                for t in torrents or []:
+                    # 翻页期间有新种子发布时，后一页开头会是前一页末尾的种子
+                    if (t.site_id, t.id) in seen:
+                        continue
+                    seen.add((t.site_id, t.id))
+                    page.append(t)
+                if not page:
+                    return
+                stop = n >= max_pages
+                if oldest_date is not None:
+                    last = page[-1].publish_date
+                    # 置顶种子排在页首，可能很旧，按页尾的种子判断是否已经翻过头
+                    if isinstance(last, datetime.datetime) and last < oldest_date:
+                        stop = True
+                    page = [t for t in page if not isinstance(t.publish_date, datetime.datetime)
+                            or t.publish_date >= oldest_date]
+                if max_rows is not None and rows + len(page) >= max_rows:
+                    page = page[:max_rows - rows]
+                    stop = True
+                rows += len(page)
+                if not stop and prefetch:
+                    task = fetch(n)
+                if page:
+                    yield page
+                if not stop and task is None:
+                    task = fetch(n)
+        finally:
+            if task is not None and not task.done():
+                # 调用方提前结束迭代时取消预取
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+
     @abstractmethod
     async def download(self, url, filepath):
         pass
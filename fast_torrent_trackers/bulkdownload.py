@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import shutil
+import time
+from enum import Enum
+from typing import Dict, Iterable, List, Tuple, Union
+
+from tenacity import retry_if_not_exception_type, stop_after_attempt, wait_fixed
+
+from fast_torrent_trackers.basetracker import BaseTracker
+from fast_torrent_trackers.exceptions import LoginRequired
+from fast_torrent_trackers.models import TorrentInfo
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class DownloadStatus(str, Enum):
+    Success = 'success'
+    NotFound = 'not_found'
+    Error = 'error'
+    LoginRequired = 'login_required'
+
+
+class BulkDownloader:
+    """
+    批量下载种子，每个站点一个下载队列，站点之间互不等待，单个站点按site_concurrency并发下载；
+    同一站点相同下载链接的种子只请求一次，其余保存路径直接复制已下载的文件
+    """
+
+    def __init__(self, trackers: Union[List[BaseTracker], Dict[str, BaseTracker]], site_concurrency: int = 2,
+                 max_attempts: int = 3, retry_wait: float = 30):
+        """
+        :param trackers: TrackerBuilder.build构建出来的站点列表，或者站点编号到站点的字典
+        :param site_concurrency: 每个站点同时下载的种子数，实际请求频率还受站点自身的下载限流约束
+        :param max_attempts: 每个种子最多尝试次数（需要重新登录时不重试）
+        :param retry_wait: 失败后重试前等待秒数
+        """
+        if isinstance(trackers, dict):
+            self.trackers = dict(trackers)
+        else:
+            self.trackers = dict((t.get_id(), t) for t in trackers if t)
+        self.site_concurrency = max(1, site_concurrency)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_wait = retry_wait
+
+    @staticmethod
+    def _build_result(index: int, torrent: TorrentInfo, filepath: str, status: DownloadStatus, message=None,
+                      run_time: float = 0, deduplicated=False):
+        return {
+            'index': index,
+            'site_id': torrent.site_id,
+            'torrent': torrent,
+            'filepath': filepath,
+            'status': status,
+            'message': message,
+            'run_time': run_time,
+            'deduplicated': deduplicated
+        }
+
+    def _get_download(self, tracker: BaseTracker):
+        """站点download自带的重试按单个种子设计（最长5分钟），批量下载时换成按次数重试"""
+        download = type(tracker).download
+        if not hasattr(download, 'retry_with'):
+            return tracker.download
+        download = download.retry_with(retry=retry_if_not_exception_type(LoginRequired),
+                                       stop=stop_after_attempt(self.max_attempts), wait=wait_fixed(self.retry_wait))
+        return lambda url, filepath: download(tracker, url, filepath)
+
+    async def _download_group(self, download, jobs: List[Tuple[int, TorrentInfo, str]]):
+        """
+        下载一组下载链接相同的任务，第一个任务真正请求站点，其他任务复制文件
+        :return: 每个任务的结果
+        """
+        index, torrent, filepath = jobs[0]
+        start = time.perf_counter()
+        try:
+            ok = await download(torrent.download_url, filepath)
+            status = DownloadStatus.NotFound if ok is False else DownloadStatus.Success
+            message = None
+        except LoginRequired as e:
+            status, message = DownloadStatus.LoginRequired, str(e)
+        except Exception as e:
+            _LOGGER.error('从%s下载种子 %s 失败了，错误信息: %s' % (torrent.site_id, torrent.download_url, e))
+            status, message = DownloadStatus.Error, str(e)
+        results = [self._build_result(index, torrent, filepath, status, message, time.perf_counter() - start)]
+        loop = asyncio.get_running_loop()
+        for index, torrent, path in jobs[1:]:
+            s, m = status, message
+            if status == DownloadStatus.Success and path != filepath:
+                try:
+                    await loop.run_in_executor(None, shutil.copyfile, filepath, path)
+                except OSError as e:
+                    s, m = DownloadStatus.Error, str(e)
+            results.append(self._build_result(index, torrent, path, s, m, time.perf_counter() - start, True))
+        return results
+
+    async def _site_worker(self, download, queue: asyncio.Queue, output: asyncio.Queue):
+        while True:
+            try:
+                jobs = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            for r in await self._download_group(download, jobs):
+                await output.put(r)
+
+    async def iter_download(self, jobs: Iterable[Tuple[TorrentInfo, str]]):
+        """
+        异步迭代每个种子的下载结果，按完成的先后顺序产出
+        :param jobs: (种子, 保存路径)列表
+        :return:
+        """
+        jobs = list(jobs)
+        output = asyncio.Queue()
+        groups: Dict[str, Dict[str, list]] = {}
+        for index, (torrent, filepath) in enumerate(jobs):
+            if torrent.site_id not in self.trackers:
+                await output.put(self._build_result(index, torrent, filepath, DownloadStatus.Error,
+                                                    f'没有站点{torrent.site_id}'))
+                continue
+            groups.setdefault(torrent.site_id, {}).setdefault(torrent.download_url, []).append(
+                (index, torrent, filepath))
+        workers = []
+        for site_id, site_groups in groups.items():
+            queue = asyncio.Queue()
+            for group in site_groups.values():
+                queue.put_nowait(group)
+            download = self._get_download(self.trackers[site_id])
+            for _ in range(min(self.site_concurrency, len(site_groups))):
+                workers.append(asyncio.ensure_future(self._site_worker(download, queue, output)))
+        try:
+            for _ in range(len(jobs)):
+                yield await output.get()
+        finally:
+            # 调用方提前结束迭代时，把还在下载的任务取消掉
+            for task in workers:
+                task.cancel()
+            if workers:
+                await asyncio.gather(*workers, return_exceptions=True)
+
+    async def download(self, jobs: Iterable[Tuple[TorrentInfo, str]]):
+        """
+        等所有种子下载完成后一次性返回
+        :param jobs: (种子, 保存路径)列表
+        :return: 和jobs顺序一致的下载结果
+        """
+        results = [r async for r in self.iter_download(jobs)]
+        results.sort(key=lambda r: r['index'])
+        return results
@@ -0,0 +1,296 @@
+"""
+本地种子目录：把拉取、搜索到的种子存进SQLite，种子名和标题建FTS5全文索引，imdb编号、站点、分类、发布时间建普通索引。
+站点最近拉取过时，关键字、imdb搜索可以直接在本地回答，不用再请求站点。
+"""
+import datetime
+import re
+import sqlite3
+import threading
+import time
+from typing import Iterable
+
+from fast_torrent_trackers.models import CateLevel1, TorrentInfo, TorrentList
+
+_COLUMNS = ('site_id', 'id', 'name', 'subject', 'cate_level1', 'cate_id', 'details_url', 'download_url', 'imdb_id',
+            'publish_date', 'size_mb', 'upload_count', 'downloading_count', 'download_count', 'free_deadline',
+            'download_volume_factor', 'upload_volume_factor', 'minimum_ratio', 'minimum_seed_time', 'poster_url')
+_TIME_COLUMNS = ('publish_date', 'free_deadline')
+_TERM_RE = re.compile(r'[^\s._\-\[\]()【】（）,，:：/\\"]+')
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS torrents (
+    site_id TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    name TEXT,
+    subject TEXT,
+    cate_level1 TEXT,
+    cate_id TEXT,
+    details_url TEXT,
+    download_url TEXT,
+    imdb_id TEXT,
+    publish_date TEXT,
+    size_mb REAL,
+    upload_count INTEGER,
+    downloading_count INTEGER,
+    download_count INTEGER,
+    free_deadline TEXT,
+    download_volume_factor REAL,
+    upload_volume_factor REAL,
+    minimum_ratio REAL,
+    minimum_seed_time INTEGER,
+    poster_url TEXT,
+    seen_at REAL NOT NULL,
+    PRIMARY KEY (site_id, id)
+);
+CREATE INDEX IF NOT EXISTS idx_torrents_imdb_id ON torrents (imdb_id);
+CREATE INDEX IF NOT EXISTS idx_torrents_site_publish ON torrents (site_id, publish_date);
+CREATE INDEX IF NOT EXISTS idx_torrents_cate_level1 ON torrents (cate_level1, publish_date);
+CREATE INDEX IF NOT EXISTS idx_torrents_publish_date ON torrents (publish_date);
+CREATE TABLE IF NOT EXISTS site_sync (
+    site_id TEXT PRIMARY KEY,
+    synced_at REAL NOT NULL
+);
+'''
+# 外部内容表，全文索引只存分词结果，内容从torrents取，触发器保持同步
+_FTS_SCHEMA = '''
+CREATE VIRTUAL TABLE IF NOT EXISTS torrents_fts USING fts5(
+    name, subject, content='torrents', content_rowid='rowid', tokenize='{tokenize}'
+);
+CREATE TRIGGER IF NOT EXISTS torrents_ai AFTER INSERT ON torrents BEGIN
+    INSERT INTO torrents_fts (rowid, name, subject) VALUES (new.rowid, new.name, new.subject);
+END;
+CREATE TRIGGER IF NOT EXISTS torrents_ad AFTER DELETE ON torrents BEGIN
+    INSERT INTO torrents_fts (torrents_fts, rowid, name, subject) VALUES ('delete', old.rowid, old.name, old.subject);
+END;
+CREATE TRIGGER IF NOT EXISTS torrents_au AFTER UPDATE OF name, subject ON torrents BEGIN
+    INSERT INTO torrents_fts (torrents_fts, rowid, name, subject) VALUES ('delete', old.rowid, old.name, old.subject);
+    INSERT INTO torrents_fts (rowid, name, subject) VALUES (new.rowid, new.name, new.subject);
+END;
+'''
+
+
+def _has_trigram(conn) -> bool:
+    # trigram分词器SQLite 3.34才有，可以按子串匹配中文
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp._trigram_probe USING fts5(a, tokenize='trigram')")
+        conn.execute('DROP TABLE temp._trigram_probe')
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def _time_to_db(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(sep=' ')
+    if value is None:
+        return None
+    return str(value)
+
+
+def _time_from_db(value):
+    if not value:
+        return value
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        return value
+
+
+class TorrentCatalog:
+    def __init__(self, path: str = ':memory:', batch_size: int = 500, max_age: float = 1800):
+        """
+        :param path: 数据库文件路径，默认只放内存
+        :param batch_size: 攒够多少个种子写一次库，每次写入在一个事务里批量执行
+        :param max_age: 站点超过这个秒数没有拉取过，本地目录视为过期
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self._lock = threading.RLock()
+        self._pending = {}
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        if path != ':memory:':
+            # 写日志模式下读写互不阻塞，同步级别降到NORMAL，批量写入快很多
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.trigram = _has_trigram(self.conn)
+        self.conn.executescript(_SCHEMA)
+        self.conn.executescript(_FTS_SCHEMA.format(tokenize='trigram' if self.trigram else 'unicode61'))
+        placeholders = ', '.join('?' for _ in range(len(_COLUMNS) + 1))
+        updates = ', '.join(f'{c} = excluded.{c}' for c in _COLUMNS[2:] + ('seen_at',))
+        self._upsert_sql = f'INSERT INTO torrents ({", ".join(_COLUMNS)}, seen_at) VALUES ({placeholders}) ' \
+                           f'ON CONFLICT (site_id, id) DO UPDATE SET {updates}'
+
+    @staticmethod
+    def _to_row(torrent, seen_at):
+        row = []
+        for name in _COLUMNS:
+            value = getattr(torrent, name, None)
+            if name in _TIME_COLUMNS:
+                value = _time_to_db(value)
+            elif name == 'cate_level1':
+                value = value.name if isinstance(value, CateLevel1) else value
+            row.append(value)
+        row.append(seen_at)
+        return row
+
+    @staticmethod
+    def _from_row(row) -> TorrentInfo:
+        t = TorrentInfo()
+        for name, value in zip(_COLUMNS, row):
+            if name in _TIME_COLUMNS:
+                value = _time_from_db(value)
+            elif name == 'cate_level1' and value:
+                value = CateLevel1.get_type(value)
+            setattr(t, name, value)
+        return t
+
+    def add(self, torrents: Iterable[TorrentInfo]):
+        """
+        记下看到的种子，攒够batch_size个才写库，同一站点的同一个种子以最后一次为准
+        :param torrents:
+        :return:
+        """
+        with self._lock:
+            for t in torrents or ():
+                if t is None or not t.site_id or not t.id:
+                    continue
+                self._pending[(t.site_id, t.id)] = t
+            if len(self._pending) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        """把缓冲的种子写进数据库"""
+        with self._lock:
+            if not self._pending:
+                return
+            seen_at = time.time()
+            rows = [self._to_row(t, seen_at) for t in self._pending.values()]
+            self._pending = {}
+            self.conn.execute('BEGIN')
+            try:
+                self.conn.executemany(self._upsert_sql, rows)
+                self.conn.execute('COMMIT')
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+
+    def add_poll(self, site_id, torrents: Iterable[TorrentInfo], synced_at: float = None):
+        """
+        记下一次拉取最新种子的结果，并把站点标记为刚同步过
+        :param site_id:
+        :param torrents:
+        :param synced_at: 同步时间戳，默认当前时间
+        :return:
+        """
+        with self._lock:
+            self.add(torrents)
+            self.flush()
+            self.conn.execute('INSERT INTO site_sync (site_id, synced_at) VALUES (?, ?) '
+                              'ON CONFLICT (site_id) DO UPDATE SET synced_at = excluded.synced_at',
+                              (site_id, synced_at if synced_at is not None else time.time()))
+
+    def get_synced_at(self, site_id):
+        with self._lock:
+            row = self.conn.execute('SELECT synced_at FROM site_sync WHERE site_id = ?', (site_id,)).fetchone()
+        return row[0] if row else None
+
+    def is_stale(self, site_id, max_age: float = None) -> bool:
+        """
+        :param site_id:
+        :param max_age: 为空时取构造时的max_age
+        :return: 站点从没拉取过，或者上次拉取超过max_age秒时为True
+        """
+        synced_at = self.get_synced_at(site_id)
+        if synced_at is None:
+            return True
+        return time.time() - synced_at > (self.max_age if max_age is None else max_age)
+
+    def _keyword_conditions(self, keyword):
+        conditions = []
+        params = []
+        terms = _TERM_RE.findall(keyword)
+        fts_terms = [t for t in terms if len(t) >= 3 or not self.trigram]
+        if fts_terms:
+            if self.trigram:
+                match = ' AND '.join('"%s"' % t for t in fts_terms)
+            else:
+                match = ' AND '.join('"%s"*' % t for t in fts_terms)
+            conditions.append('rowid IN (SELECT rowid FROM torrents_fts WHERE torrents_fts MATCH ?)')
+            params.append(match)
+        for t in terms:
+            if t in fts_terms:
+                continue
+            # trigram至少要3个字符，更短的词用LIKE（不区分大小写）
+            conditions.append("(name LIKE ? ESCAPE '\\' OR subject LIKE ? ESCAPE '\\')")
+            like = '%' + t.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            params += [like, like]
+        return conditions, params
+
+    def search(self, keyword=None, imdb_id=None, site_ids: list = None, cate_level1_list: list = None,
+               since: datetime.datetime = None, limit: int = 100) -> TorrentList:
+        """
+        在本地目录里搜索，按发布时间倒序
+        :param keyword: 关键字按空白、分隔符拆成多个词，每个词都要出现在种子名或标题里
+        :param imdb_id:
+        :param site_ids: 只搜这些站点
+        :param cate_level1_list:
+        :param since: 只返回这之后发布的种子
+        :param limit:
+        :return:
+        """
+        conditions = []
+        params = []
+        if keyword:
+            c, p = self._keyword_conditions(keyword)
+            conditions += c
+            params += p
+        if imdb_id:
+            conditions.append('imdb_id = ?')
+            params.append(imdb_id)
+        if site_ids:
+            conditions.append('site_id IN (%s)' % ', '.join('?' for _ in site_ids))
+            params += list(site_ids)
+        if cate_level1_list:
+            conditions.append('cate_level1 IN (%s)' % ', '.join('?' for _ in cate_level1_list))
+            params += [c.name if isinstance(c, CateLevel1) else str(c) for c in cate_level1_list]
+        if since:
+            conditions.append('publish_date >= ?')
+            params.append(_time_to_db(since))
+        sql = f'SELECT {", ".join(_COLUMNS)} FROM torrents'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY publish_date DESC'
+        if limit:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        with self._lock:
+            # 查询前把缓冲的种子也写进去，刚看到的种子马上能搜到
+            self.flush()
+            rows = self.conn.execute(sql, params).fetchall()
+        return [self._from_row(row) for row in rows]
+
+    def get(self, site_id, torrent_id) -> TorrentInfo:
+        with self._lock:
+            self.flush()
+            row = self.conn.execute(f'SELECT {", ".join(_COLUMNS)} FROM torrents WHERE site_id = ? AND id = ?',
+                                    (site_id, torrent_id)).fetchone()
+        return self._from_row(row) if row else None
+
+    def count(self, site_id=None) -> int:
+        with self._lock:
+            self.flush()
+            if site_id is None:
+                return self.conn.execute('SELECT COUNT(*) FROM torrents').fetchone()[0]
+            return self.conn.execute('SELECT COUNT(*) FROM torrents WHERE site_id = ?', (site_id,)).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
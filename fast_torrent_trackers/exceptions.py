@@ -11,6 +11,10 @@ class LoginRequired(Exception):
         self.site_id = site_id
         self.site_name = site_name
 
+    def __reduce__(self):
+        # 构造参数和args不一致，自定义pickle，解析放在进程池时异常才能传回主进程
+        return self.__class__, (self.site_id, self.site_name, str(self))
+
 
 class RequestOverloadException(Exception):
     stop_secs = 120
@@ -22,3 +26,6 @@ class RequestOverloadException(Exception):
         self.site_id = site_id
         self.site_name = site_name
         self.stop_secs = stop_secs
+
+    def __reduce__(self):
+        return self.__class__, (str(self), self.site_id, self.site_name, self.stop_secs)
@@ -3,8 +3,12 @@ import logging
 import re
 import urllib
 
+import soupsieve as sv
+from bs4 import BeautifulSoup
 from jinja2 import Template
 
+from fast_torrent_trackers.normalize import parse_datetime
+
 
 def filter_querystring(value, args):
     if value.startswith('?'):
@@ -81,7 +85,7 @@ def filter_regexp(value, args):
 def filter_dateparse(value, args):
     if not value:
         return datetime.datetime.now()
-    return datetime.datetime.strptime(value, args)
+    return parse_datetime(value, args)
 
 
 filter_handler = {
@@ -102,108 +106,402 @@ filter_handler = {
 }
 
 
-class HtmlParser:
+class SoupBackend:
+    """
+    BeautifulSoup + soupsieve解析后端，字段规则里对标签的操作都通过后端完成，换成其他解析库时实现同样的方法即可
+    """
+    name = 'bs4'
+
+    @staticmethod
+    def parse_document(html_text):
+        return BeautifulSoup(html_text, 'lxml')
+
+    @staticmethod
+    def compile_selector(selector):
+        """
+        预编译css选择器，编译不了的保留原字符串，解析时再报错，和逐行解释规则时的表现一致
+        :param selector:
+        :return:
+        """
+        try:
+            return sv.compile(selector)
+        except Exception:
+            return selector
+
+    @staticmethod
+    def select_one(tag, selector):
+        if isinstance(selector, sv.SoupSieve):
+            return selector.select_one(tag)
+        return tag.select_one(selector)
+
+    @staticmethod
+    def select(tag, selector):
+        if isinstance(selector, sv.SoupSieve):
+            return selector.select(tag)
+        return tag.select(selector)
+
     @staticmethod
-    def __select_value(tag, rule):
+    def get_attribute(tag, name):
+        if not tag.has_attr(name):
+            return None
+        attr = tag.attrs[name]
+        if isinstance(attr, list):
+            return attr[0]
+        return attr
+
+    @staticmethod
+    def next_sibling_text(tag):
+        if tag.next_sibling:
+            return tag.next_sibling.text
+        return None
+
+    @staticmethod
+    def remove(tag, selector):
+        s = SoupBackend.select(tag, selector)
+        for i in s:
+            i.extract()
+
+    @staticmethod
+    def text(tag):
+        return tag.text
+
+    @staticmethod
+    def contents_text(tag, idx):
+        return tag.contents[idx].text
+
+
+def _compile_re_search(args):
+    pattern = re.compile(args[0])
+    group = args[1]
+
+    def re_search(value):
+        result = pattern.search(value)
+        if result:
+            if group <= len(result.groups()):
+                return result.group(group)
+            else:
+                return
+        return
+
+    return re_search
+
+
+def _compile_regexp(args):
+    pattern = re.compile(args)
+    return lambda value: pattern.sub('', value)
+
+
+_filter_compilers = {
+    're_search': _compile_re_search,
+    'regexp': _compile_regexp
+}
+
+
+def _compile_filter(f):
+    """
+    把过滤器配置编译成只接收value的闭包，正则类过滤器提前编译好正则
+    :param f:
+    :return:
+    """
+    name = f['name']
+    if name not in filter_handler:
+        return None
+    args = f.get('args')
+    if name in _filter_compilers:
+        try:
+            return _filter_compilers[name](args)
+        except Exception:
+            # 参数有问题时退回原始过滤器，解析时再报错
+            pass
+    handler = filter_handler[name]
+    return lambda value: handler(value, args)
+
+
+_FIELD_REF_RE = re.compile(r"""fields\s*(?:\[\s*['"](\w+)['"]\s*\]|\.(\w+))""")
+
+
+def _find_field_refs(text):
+    if not isinstance(text, str):
+        return frozenset()
+    return frozenset(a or b for a, b in _FIELD_REF_RE.findall(text))
+
+
+def _compile_template(text, mark):
+    if isinstance(text, str) and text.find(mark) != -1:
+        return Template(text)
+    return None
+
+
+class CompiledField:
+    """单个字段预编译好的解析规则：选择器、模版、正则和过滤器只在编译时构建一次"""
+
+    def __init__(self, key, rule, backend=SoupBackend):
+        self.key = key
+        self.rule = rule
+        self.backend = backend
+        self.text_template = None
+        self.selector = None
+        self.case = None
+        self.has_remove = False
+        self.remove = None
+        self.filters = None
+        self.default_template = None
+        if 'text' in rule:
+            self.mode = 'text'
+            self.text_template = _compile_template(rule['text'], '{')
+        elif 'selector' in rule:
+            self.mode = 'selector'
+            self.selector = backend.compile_selector(rule['selector'])
+        elif 'selectors' in rule:
+            self.mode = 'selectors'
+            self.selector = backend.compile_selector(rule['selectors'])
+        elif 'case' in rule:
+            self.mode = 'case'
+            self.case = [(ck, None if ck == '*' else backend.compile_selector(ck), rule['case'][ck]) for ck in rule['case']]
+        else:
+            self.mode = None
+        if 'attribute' not in rule and 'method' not in rule and 'remove' in rule:
+            self.has_remove = True
+            # 不是字符串时保持为空，解析这个字段时报错，和逐行解释规则时的表现一致
+            if isinstance(rule['remove'], str):
+                self.remove = [backend.compile_selector(rt) for rt in rule['remove'].split(',')]
+        if 'filters' in rule:
+            self.filters = list(filter(None, [_compile_filter(f) for f in rule['filters']]))
+        self.has_default = 'default_value' in rule
+        if self.has_default:
+            self.default_template = _compile_template(rule['default_value'], '{{')
+        # 模版里引用到的其他字段
+        self.refs = _find_field_refs(rule.get('text')) | _find_field_refs(rule.get('default_value'))
+
+    def select_value(self, tag):
+        rule = self.rule
+        backend = self.backend
         val = None
-        if tag:
+        if tag is not None:
             if 'attribute' in rule:
-                if tag.has_attr(rule['attribute']):
-                    attr = tag.attrs[rule['attribute']]
-                    if isinstance(attr, list):
-                        val = attr[0]
-                    else:
-                        val = attr
+                val = backend.get_attribute(tag, rule['attribute'])
             elif 'method' in rule:
-                if rule['method'] == 'next_sibling' and tag and tag.next_sibling:
-                    val = tag.next_sibling.text
-            elif 'remove' in rule:
-                remove_tag_name = rule['remove'].split(',')
-                for rt in remove_tag_name:
-                    s = tag.select(rt)
-                    if not s:
-                        continue
-                    for i in s:
-                        i.extract()
-                val = tag.text
+                if rule['method'] == 'next_sibling':
+                    val = backend.next_sibling_text(tag)
+            elif self.has_remove:
+                if self.remove is None:
+                    raise TypeError(f'{self.key}的remove必须是逗号分隔的css选择器: {rule["remove"]!r}')
+                for rt in self.remove:
+                    backend.remove(tag, rt)
+                val = backend.text(tag)
             elif 'contents' in rule:
-                idx = rule['contents']
-                val = tag.contents[idx].text
+                val = backend.contents_text(tag, rule['contents'])
             else:
-                val = tag.text
+                val = backend.text(tag)
         if val:
             val = val.strip()
         return val
 
-    @staticmethod
-    def __case_value(r, case):
+    def case_value(self, tag):
         val = None
-        for ck in case:
+        for ck, selector, case_val in self.case:
             if ck == '*':
-                val = case[ck]
+                val = case_val
                 break
-            if r.select_one(ck):
-                val = case[ck]
+            if self.backend.select_one(tag, selector) is not None:
+                val = case_val
                 break
         return val
 
-    @staticmethod
-    def __filter_value(value, filters):
+    def filter_value(self, value):
         if not value:
             return value
-        for f in filters:
-            if f['name'] in filter_handler:
-                value = filter_handler[f['name']](value, f.get('args'))
+        for f in self.filters:
+            value = f(value)
         return value
 
-    @staticmethod
-    def parse_item_fields(item_tag, item_rule, context=None):
-        if not item_tag:
-            return {}
-        self = HtmlParser
-        values = {}
+    def parse(self, item_tag, values, context=None):
+        rule = self.rule
+        val = None
+        if self.mode == 'text':
+            if self.text_template is not None:
+                ctx = {'fields': values, 'now': datetime.datetime.now()}
+                if context:
+                    ctx.update(context)
+                val = self.text_template.render(ctx)
+            else:
+                val = rule.get('text')
+        elif self.mode == 'selector':
+            val = self.select_value(self.backend.select_one(item_tag, self.selector))
+        elif self.mode == 'selectors':
+            tag_list = self.backend.select(item_tag, self.selector)
+            if rule.get('index'):
+                if tag_list and rule['index'] < len(tag_list):
+                    tag = tag_list[rule['index']]
+                    val = self.select_value(tag)
+            else:
+                val = []
+                for t in tag_list:
+                    val.append(self.select_value(t))
+        elif self.mode == 'case':
+            val = self.case_value(item_tag)
+        if self.filters is not None:
+            val = self.filter_value(val)
+        if (val is None or val == '') and self.has_default:
+            if self.default_template is not None:
+                ctx = {'fields': values, 'now': datetime.datetime.now(), 'max_time': datetime.datetime.max}
+                if context:
+                    ctx.update(context)
+                val = self.default_template.render(ctx)
+            else:
+                val = rule['default_value']
+            if val and 'default_value_format' in rule:
+                val = datetime.datetime.strptime(val, rule['default_value_format'])
+        return val
+
+
+class BrokenField:
+    """编译失败的字段，解析时抛出编译时的错误，保持逐行解析时跳过该字段的表现"""
+
+    def __init__(self, key, error):
+        self.key = key
+        self.error = error
+        self.refs = frozenset()
+
+    def parse(self, item_tag, values, context=None):
+        raise self.error
+
+
+class ParsePlan:
+    """一组字段规则（torrents.fields、userinfo.fields）编译后的解析计划"""
+
+    def __init__(self, item_rule, backend=SoupBackend):
+        self.item_rule = item_rule
+        self.backend = backend
+        self.fields = []
         for key in item_rule:
-            rule = item_rule[key]
-            val = None
             try:
-                if 'text' in rule:
-                    if isinstance(rule['text'], str) and rule['text'].find('{') != -1:
-                        tmpl = Template(rule['text'])
-                        ctx = {'fields': values, 'now': datetime.datetime.now()}
-                        if context:
-                            ctx.update(context)
-                        val = tmpl.render(ctx)
-                    else:
-                        val = rule.get('text')
-                elif 'selector' in rule:
-                    val = self.__select_value(item_tag.select_one(rule['selector']), rule)
-                elif 'selectors' in rule:
-                    tag_list = item_tag.select(rule['selectors'])
-                    if rule.get('index'):
-                        if tag_list and rule['index'] < len(tag_list):
-                            tag = tag_list[rule['index']]
-                            val = self.__select_value(tag, rule)
-                    else:
-                        val = []
-                        for t in tag_list:
-                            val.append(self.__select_value(t, rule))
-                elif 'case' in rule:
-                    val = self.__case_value(item_tag, rule['case'])
-                if 'filters' in rule:
-                    val = self.__filter_value(val, rule['filters'])
-                if (val is None or val == '') and 'default_value' in rule:
-                    if isinstance(rule['default_value'], str) and rule['default_value'].find('{{') != -1:
-                        tmpl = Template(rule['default_value'])
-                        ctx = {'fields': values, 'now': datetime.datetime.now(), 'max_time': datetime.datetime.max}
-                        if context:
-                            ctx.update(context)
-                        val = tmpl.render(ctx)
-                    else:
-                        val = rule['default_value']
-                    if val and 'default_value_format' in rule:
-                        val = datetime.datetime.strptime(val, rule['default_value_format'])
+                self.fields.append(CompiledField(key, item_rule[key], backend))
             except Exception as e:
-                logging.error('%s解析出错 values: %s tag: %s' % (key, values, item_tag), exc_info=True)
+                self.fields.append(BrokenField(key, e))
+        self.index = {field.key: i for i, field in enumerate(self.fields)}
+
+    def get_field(self, key):
+        for field in self.fields:
+            if field.key == key:
+                return field
+        return None
+
+    def resolve(self, keys) -> frozenset:
+        """
+        找出解析这些字段需要先解析的所有字段（模版里引用的字段，以及它们引用的字段）
+        :param keys:
+        :return:
+        """
+        result = set()
+        stack = list(keys)
+        while stack:
+            key = stack.pop()
+            if key in result or key not in self.index:
                 continue
-            values[key] = val
+            result.add(key)
+            stack.extend(self.fields[self.index[key]].refs)
+        return frozenset(result)
+
+    def parse(self, item_tag, context=None, values: dict = None, only=None, skip=None) -> dict:
+        """
+        按规则顺序解析字段
+        :param item_tag:
+        :param context:
+        :param values: 已经解析出来的字段，分两次解析时传入第一次的结果
+        :param only: 只解析这些字段
+        :param skip: 跳过这些字段（第一次已经解析过的）
+        :return:
+        """
+        if values is None:
+            values = {}
+        for i, field in enumerate(self.fields):
+            if only is not None and field.key not in only:
+                continue
+            if skip is not None and field.key in skip:
+                continue
+            fields = values
+            if skip and any(k in values and self.index[k] > i for k in field.refs):
+                # 提前解析的字段排在当前字段后面时，模版里要看不到它，和按顺序一次解析的结果保持一致
+                fields = {k: v for k, v in values.items() if self.index[k] < i}
+            try:
+                val = field.parse(item_tag, fields, context)
+            except Exception:
+                logging.error('%s解析出错 values: %s tag: %s' % (field.key, values, item_tag), exc_info=True)
+                continue
+            values[field.key] = val
         return values
+
+
+def get_backend(name=None):
+    """
+    按名字取解析后端，bs4为默认的BeautifulSoup实现，lxml直接在lxml.html树上用编译好的XPath解析
+    :param name:
+    :return:
+    """
+    if not name or name == SoupBackend.name:
+        return SoupBackend
+    if name == 'lxml':
+        from fast_torrent_trackers.lxmlparser import LxmlBackend
+        return LxmlBackend
+    raise ValueError(f'不支持的解析后端：{name}')
+
+
+class ParsedPage:
+    """
+    一次请求拿到的页面，文档树第一次用到时才解析，登录检查、用户信息、种子列表共用同一棵树；
+    cache_userinfo为True时，解析出的用户信息也存下来，同一个页面不再重复解析
+    """
+    __slots__ = ('text', 'backend', 'cache_userinfo', 'userinfo', '_document')
+
+    def __init__(self, text, backend=SoupBackend, cache_userinfo=True):
+        self.text = text
+        self.backend = backend
+        self.cache_userinfo = cache_userinfo
+        self.userinfo = None
+        self._document = None
+
+    @property
+    def document(self):
+        if self._document is None:
+            self._document = self.backend.parse_document(self.text)
+        return self._document
+
+    def release(self):
+        """
+        释放文档树，只保留页面文本和已解析的用户信息，再用到文档树时重新解析
+        :return:
+        """
+        self._document = None
+
+
+# 按规则字典和解析后端缓存编译结果，存一份规则引用防止id被复用
+_plan_cache = {}
+
+
+class HtmlParser:
+    @staticmethod
+    def compile(item_rule, backend=SoupBackend) -> ParsePlan:
+        """
+        把字段规则编译成解析计划，同一份规则在同一个解析后端下只编译一次
+        :param item_rule:
+        :param backend:
+        :return:
+        """
+        if isinstance(item_rule, ParsePlan):
+            return item_rule
+        cache_key = (id(item_rule), backend.name)
+        cached = _plan_cache.get(cache_key)
+        if cached and cached.item_rule is item_rule:
+            return cached
+        plan = ParsePlan(item_rule, backend)
+        if len(_plan_cache) >= 256:
+            _plan_cache.clear()
+        _plan_cache[cache_key] = plan
+        return plan
+
+    @staticmethod
+    def parse_item_fields(item_tag, item_rule, context=None, backend=SoupBackend):
+        if item_tag is None:
+            return {}
+        return HtmlParser.compile(item_rule, backend).parse(item_tag, context)
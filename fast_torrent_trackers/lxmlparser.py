@@ -0,0 +1,225 @@
+import re
+from functools import lru_cache
+
+from cssselect import HTMLTranslator, parse
+from cssselect.parser import CombinedSelector
+from lxml import etree, html
+
+# BeautifulSoup会把这些属性按空白拆成列表，字段规则取attribute时拿到的是第一个值
+_CDATA_LIST_ATTRIBUTES = {
+    '*': {'class', 'accesskey', 'dropzone'},
+    'a': {'rel', 'rev'},
+    'link': {'rel', 'rev'},
+    'td': {'headers'},
+    'th': {'headers'},
+    'form': {'accept-charset'},
+    'object': {'archive'},
+    'area': {'rel'},
+    'icon': {'sizes'},
+    'iframe': {'sandbox'},
+    'output': {'for'}
+}
+_NONWHITESPACE_RE = re.compile(r'\S+')
+# BeautifulSoup取.text时不包含script、style、template里的字符串
+_RAW_TEXT_TAGS = {'script', 'style', 'template'}
+_TEXT_XPATH = etree.XPath('.//text()[not(parent::script) and not(parent::style) and not(ancestor::template)]',
+                          smart_strings=False)
+_translator = HTMLTranslator()
+# 组合符左边的部分相对当前节点所在的轴
+_COMBINATOR_AXES = {'>': 'parent::', ' ': 'ancestor::', '~': 'preceding-sibling::', '+': 'preceding-sibling::*[1]/self::'}
+
+
+class CompiledSelector:
+    """css选择器翻译成的XPath，只在编译时翻译一次"""
+    __slots__ = ('css', 'xpath')
+
+    def __init__(self, css):
+        self.css = css
+        self.xpath = etree.XPath(_translator.css_to_xpath(css, prefix='descendant-or-self::'))
+
+    def select(self, tag):
+        # soupsieve只在后代里找，不包含起点标签本身
+        return [e for e in self.xpath(tag) if e is not tag]
+
+
+@lru_cache(maxsize=1024)
+def _translate(css):
+    return CompiledSelector(css)
+
+
+def _self_step(tree):
+    """
+    把选择器翻译成以当前节点为起点的XPath步骤，组合符左边的部分变成沿父节点、祖先、前面兄弟节点的条件，
+    比如table.torrents > tr翻译成tr[parent::table[...]]
+    """
+    if isinstance(tree, CombinedSelector):
+        return f'{_self_step(tree.subselector)}[{_COMBINATOR_AXES[tree.combinator]}{_self_step(tree.selector)}]'
+    return str(_translator.xpath(tree))
+
+
+def _last_tag(tree):
+    while isinstance(tree, CombinedSelector):
+        tree = tree.subselector
+    return _translator.xpath(tree).element
+
+
+@lru_cache(maxsize=128)
+def _compile_match(css):
+    """
+    :param css:
+    :return: (判断单个节点是否匹配选择器的XPath, 可能匹配的标签名，有*时为空)
+    """
+    selectors = parse(css)
+    match = etree.XPath(' | '.join('self::' + _self_step(s.parsed_tree) for s in selectors), smart_strings=False)
+    tags = tuple(sorted(set(_last_tag(s.parsed_tree) for s in selectors)))
+    return match, None if '*' in tags else tags
+
+
+def _node_text(node):
+    if isinstance(node, str):
+        return node
+    if not isinstance(node.tag, str):
+        # 注释、处理指令在BeautifulSoup里取.text是空字符串
+        return ''
+    return LxmlBackend.text(node)
+
+
+class LxmlBackend:
+    """
+    直接在lxml.html树上解析的后端，css选择器编译成XPath执行，取值的表现和SoupBackend保持一致
+    """
+    name = 'lxml'
+
+    @staticmethod
+    def parse_document(html_text):
+        if isinstance(html_text, str):
+            # 带编码声明的unicode字符串lxml不接受，统一按utf-8字节解析
+            html_text = html_text.encode('utf-8')
+        try:
+            root = html.document_fromstring(html_text, parser=html.HTMLParser(encoding='utf-8'))
+        except etree.ParserError:
+            root = html.Element('html')
+        return root.getroottree()
+
+    @staticmethod
+    def stream_document(selector, encoding=None):
+        """
+        创建边接收边解析的文档
+        :param selector: 列表行的css选择器
+        :param encoding:
+        :return: StreamingDocument
+        """
+        return StreamingDocument(selector, encoding)
+
+    @staticmethod
+    def compile_selector(selector):
+        """
+        把css选择器编译成XPath，编译不了的保留原字符串，解析时再报错，和SoupBackend的表现一致
+        :param selector:
+        :return:
+        """
+        try:
+            return _translate(selector)
+        except Exception:
+            return selector
+
+    @staticmethod
+    def select_one(tag, selector):
+        result = LxmlBackend.select(tag, selector)
+        if result:
+            return result[0]
+        return None
+
+    @staticmethod
+    def select(tag, selector):
+        if not isinstance(selector, CompiledSelector):
+            selector = _translate(selector)
+        return selector.select(tag)
+
+    @staticmethod
+    def get_attribute(tag, name):
+        attr = tag.get(name)
+        if attr is None:
+            return None
+        if name in _CDATA_LIST_ATTRIBUTES['*'] or name in _CDATA_LIST_ATTRIBUTES.get(tag.tag, ()):
+            return _NONWHITESPACE_RE.findall(attr)[0]
+        return attr
+
+    @staticmethod
+    def next_sibling_text(tag):
+        # lxml把紧跟在标签后面的文本放在tail上，BeautifulSoup里它是下一个兄弟节点
+        if tag.tail:
+            return tag.tail
+        sibling = tag.getnext()
+        if sibling is None:
+            return None
+        return _node_text(sibling)
+
+    @staticmethod
+    def remove(tag, selector):
+        for i in LxmlBackend.select(tag, selector):
+            # drop_tree会保留标签后面的文本，和extract的表现一致
+            i.drop_tree()
+
+    @staticmethod
+    def text(tag):
+        if tag.tag in _RAW_TEXT_TAGS:
+            return tag.text_content()
+        return ''.join(_TEXT_XPATH(tag))
+
+    @staticmethod
+    def contents_text(tag, idx):
+        contents = []
+        if tag.text:
+            contents.append(tag.text)
+        for child in tag:
+            contents.append(child)
+            if child.tail:
+                contents.append(child.tail)
+        return _node_text(contents[idx])
+
+
+class StreamingDocument:
+    """
+    边接收响应边解析的文档，按块喂入原始字节，每次返回这一块里闭合的列表行，不需要先拿到整页文本；
+    只检查新闭合的标签是否匹配列表行的选择器，不会每块都重新在整个文档上查一遍。
+    列表行按闭合的顺序返回，行之间没有嵌套时就是文档顺序；选择器在行闭合时判断，
+    祖先节点上看后代的条件（比如div:has(span) > p）只能看到那时已经收到的内容。
+    调用方处理完一行后可以release释放行内的节点，整页的内存占用只和未处理的部分有关
+    """
+
+    def __init__(self, selector, encoding=None):
+        """
+        :param selector: 列表行的css选择器
+        :param encoding: 页面编码，为空时按utf-8
+        """
+        css = selector.css if isinstance(selector, CompiledSelector) else selector
+        self.match, tags = _compile_match(css)
+        self.parser = etree.HTMLPullParser(events=('end',), tag=tags, encoding=encoding or 'utf-8')
+        self.parser.set_element_class_lookup(html.HtmlElementClassLookup())
+        # 已经返回的行数，为0说明页面里还没出现列表行（比如各类提示页面）
+        self.row_count = 0
+
+    def feed(self, data: bytes) -> list:
+        self.parser.feed(data)
+        return self._collect()
+
+    def close(self) -> list:
+        try:
+            self.parser.close()
+        except etree.LxmlError:
+            pass
+        return self._collect()
+
+    def _collect(self):
+        # 标签闭合时子节点都已经收到，:has这类看后代的条件也能判断了
+        rows = [element for _, element in self.parser.read_events() if self.match(element)]
+        self.row_count += len(rows)
+        return rows
+
+    @staticmethod
+    def release(tag):
+        """清空已经处理过的行的内容，只保留标签本身，后面行的选择器（比如nth-child）不受影响"""
+        for child in list(tag):
+            tag.remove(child)
+        tag.text = None
@@ -0,0 +1,175 @@
+"""
+多站点搜索结果合并：同一个资源在多个站点出现时合并成一组，每组选一个首选种子，其他站点的种子作为备选。
+按规范化后的种子名、体积区间和imdb编号分组，每个种子只查常数个候选组，整体是线性的。
+"""
+import math
+import re
+import unicodedata
+from typing import Callable, Iterable, List
+
+from fast_torrent_trackers.models import TorrentInfo
+
+# 各站点种子名里分隔单词的写法不一样，点、下划线、空格、括号都当成同一个分隔符
+_SEPARATOR_RE = re.compile(r'[\s._\-+\[\]()【】（）,，:：/\\]+')
+
+
+def normalize_title(name: str) -> str:
+    """
+    规范化种子名，全角转半角、统一大小写和分隔符，The.Movie.2021.1080p-GRP和The Movie 2021 1080p GRP是同一个结果
+    :param name:
+    :return: 空字符串表示没法用来合并
+    """
+    if not name:
+        return ''
+    name = unicodedata.normalize('NFKC', name).lower()
+    if name.endswith('.torrent'):
+        name = name[:-8]
+    return _SEPARATOR_RE.sub(' ', name).strip()
+
+
+def default_preference(torrent) -> tuple:
+    """
+    首选种子的排序依据，越小越优先：免费的优先，其次做种人数多的
+    :param torrent:
+    :return:
+    """
+    free = 0 if torrent.download_volume_factor is not None and torrent.download_volume_factor == 0 else 1
+    return free, -(torrent.upload_count or 0)
+
+
+class MergedTorrent:
+    """合并后的一组种子"""
+
+    def __init__(self, key: str, torrent: TorrentInfo):
+        # 规范化后的种子名
+        self.key = key
+        # 首选种子
+        self.torrent = torrent
+        # 其他站点的同一资源，按首选规则排序
+        self.alternatives: List[TorrentInfo] = []
+
+    @property
+    def torrents(self) -> List[TorrentInfo]:
+        return [self.torrent] + self.alternatives
+
+    @property
+    def site_ids(self) -> List[str]:
+        return [t.site_id for t in self.torrents]
+
+    def __len__(self):
+        return 1 + len(self.alternatives)
+
+    def __repr__(self):
+        return f'MergedTorrent({self.key!r}, sites={self.site_ids})'
+
+
+class _Group:
+    __slots__ = ('key', 'size_mb', 'imdb_id', 'members', 'seen')
+
+    def __init__(self, key, size_mb, imdb_id):
+        self.key = key
+        self.size_mb = size_mb
+        self.imdb_id = imdb_id
+        self.members = []
+        # (site_id, id)，同一站点的同一个种子只留一个
+        self.seen = set()
+
+
+class TorrentMerger:
+    """
+    可以分批加入种子（比如MultiTrackerSearcher.iter_search每返回一个站点加一次），随时取合并结果
+    """
+
+    def __init__(self, size_tolerance: float = 0.02, preference: Callable = default_preference,
+                 title: Callable = None):
+        """
+        :param size_tolerance: 体积相差不超过这个比例视为同一个资源，各站点显示的体积精度不同，不能要求完全相等
+        :param preference: 选首选种子的排序函数，返回值越小越优先
+        :param title: 取用来合并的种子名，默认取name，没有时取subject
+        """
+        self.size_tolerance = size_tolerance
+        self.preference = preference
+        self.title = title if title else self._default_title
+        # 体积按对数分区间，相邻区间的比例正好是1+size_tolerance，只需要查相邻的三个区间
+        self._log_step = math.log1p(size_tolerance) if size_tolerance > 0 else None
+        self._index = {}
+        self._groups: List[_Group] = []
+
+    @staticmethod
+    def _default_title(torrent):
+        return torrent.name or torrent.subject
+
+    def _bucket(self, size_mb):
+        if not size_mb or size_mb <= 0:
+            return None
+        if self._log_step is None:
+            return size_mb
+        return int(math.floor(math.log(size_mb) / self._log_step))
+
+    def _match(self, group: _Group, size_mb, imdb_id):
+        if group.imdb_id and imdb_id and group.imdb_id != imdb_id:
+            return False
+        if group.size_mb is None or not size_mb:
+            return group.size_mb is None and not size_mb
+        return abs(group.size_mb - size_mb) <= self.size_tolerance * max(group.size_mb, size_mb)
+
+    def _find_group(self, key, bucket, size_mb, imdb_id):
+        if bucket is None or self._log_step is None:
+            candidates = (bucket,)
+        else:
+            candidates = (bucket, bucket - 1, bucket + 1)
+        for b in candidates:
+            for group in self._index.get((key, b), ()):
+                if self._match(group, size_mb, imdb_id):
+                    return group
+        return None
+
+    def add(self, torrent: TorrentInfo):
+        key = normalize_title(self.title(torrent))
+        size_mb = torrent.size_mb
+        bucket = self._bucket(size_mb)
+        imdb_id = torrent.imdb_id or None
+        group = self._find_group(key, bucket, size_mb, imdb_id) if key else None
+        if group is None:
+            group = _Group(key, size_mb if size_mb and size_mb > 0 else None, imdb_id)
+            self._groups.append(group)
+            if key:
+                self._index.setdefault((key, bucket), []).append(group)
+        ident = (torrent.site_id, torrent.id)
+        if ident in group.seen:
+            return
+        group.seen.add(ident)
+        if group.imdb_id is None and imdb_id:
+            group.imdb_id = imdb_id
+        group.members.append(torrent)
+
+    def add_all(self, torrents: Iterable[TorrentInfo]):
+        for t in torrents or ():
+            self.add(t)
+
+    def results(self) -> List[MergedTorrent]:
+        """
+        :return: 按每组第一次出现的顺序返回
+        """
+        merged = []
+        for group in self._groups:
+            # sorted是稳定的，首选规则相同时先出现的优先
+            members = sorted(group.members, key=self.preference)
+            m = MergedTorrent(group.key, members[0])
+            m.alternatives = members[1:]
+            merged.append(m)
+        return merged
+
+
+def merge_torrents(torrents: Iterable[TorrentInfo], size_tolerance: float = 0.02,
+                   preference: Callable = default_preference) -> List[MergedTorrent]:
+    """
+    合并多个站点的搜索结果
+    :param torrents:
+    :param size_tolerance: 体积相差不超过这个比例视为同一个资源
+    :param preference: 选首选种子的排序函数，返回值越小越优先
+    :return:
+    """
+    merger = TorrentMerger(size_tolerance, preference)
+    merger.add_all(torrents)
+    return merger.results()
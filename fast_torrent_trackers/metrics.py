@@ -0,0 +1,182 @@
+"""
+站点请求的分阶段耗时和计数，站点实例的metrics为空时不记录。
+耗时按(站点, 阶段)统计成直方图，计数按(站点, 名称)累加，可以导出Prometheus文本格式，也可以注册回调拿到每一条记录。
+
+阶段：search（一次搜索总耗时）、search_wait/userinfo_wait/download_wait（等限流令牌）、request（请求到拿到响应）、
+decode（响应解码成文本）、cf_check（CloudFlare跳转的额外请求）、parse（解析页面）、result_filter、download、
+query（TrackerSearcher一个查询含重试的耗时）、sleep（TrackerSearcher主动等待）
+计数：bytes_received、rows_parsed、retries、rate_limited、overloaded、cache_hits、cache_misses、
+catalog_hits（TrackerSearcher直接用本地种子目录回答的查询）、
+promotion_cache_hits（促销状态命中缓存的种子数）、promotion_requests（促销状态查询请求数）
+"""
+import contextlib
+import threading
+import time
+from typing import Callable
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class MetricEvent:
+    """回调收到的一条记录，kind为timing时value是秒数，为count时是增量"""
+    __slots__ = ('kind', 'site_id', 'name', 'value')
+
+    def __init__(self, kind, site_id, name, value):
+        self.kind = kind
+        self.site_id = site_id
+        self.name = name
+        self.value = value
+
+    def __repr__(self):
+        return f'MetricEvent({self.kind}, {self.site_id}, {self.name}, {self.value})'
+
+
+class _Histogram:
+    __slots__ = ('count', 'sum', 'buckets')
+
+    def __init__(self, size):
+        self.count = 0
+        self.sum = 0.0
+        self.buckets = [0] * size
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+class TrackerMetrics:
+    def __init__(self, buckets=DEFAULT_BUCKETS, namespace='fast_torrent_trackers'):
+        """
+        :param buckets: 耗时直方图的上界（秒），从小到大
+        :param namespace: 导出时指标名的前缀
+        """
+        self.buckets = tuple(sorted(buckets))
+        self.namespace = namespace
+        self._timings = {}
+        self._counters = {}
+        self._listeners = []
+        # 解析放到线程池时也会记录，加锁保证累加不丢
+        self._lock = threading.Lock()
+
+    def add_listener(self, callback: Callable[[MetricEvent], None]):
+        """
+        注册回调，每条记录都会同步调用一次，回调里不要做耗时操作
+        :param callback: 接收MetricEvent
+        :return:
+        """
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _notify(self, kind, site_id, name, value):
+        if not self._listeners:
+            return
+        event = MetricEvent(kind, site_id, name, value)
+        for callback in list(self._listeners):
+            callback(event)
+
+    def observe(self, site_id, stage, seconds):
+        with self._lock:
+            hist = self._timings.get((site_id, stage))
+            if hist is None:
+                hist = _Histogram(len(self.buckets))
+                self._timings[(site_id, stage)] = hist
+            hist.count += 1
+            hist.sum += seconds
+            for i, le in enumerate(self.buckets):
+                if seconds <= le:
+                    hist.buckets[i] += 1
+        self._notify('timing', site_id, stage, seconds)
+
+    def incr(self, site_id, name, value=1):
+        with self._lock:
+            key = (site_id, name)
+            self._counters[key] = self._counters.get(key, 0) + value
+        self._notify('count', site_id, name, value)
+
+    @contextlib.contextmanager
+    def timer(self, site_id, stage):
+        """
+        with metrics.timer('mteam', 'parse'):
+            ...
+        出错时也会记录耗时
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(site_id, stage, time.perf_counter() - start)
+
+    def get_timing(self, site_id, stage) -> dict:
+        hist = self._timings.get((site_id, stage))
+        if hist is None:
+            return {'count': 0, 'sum': 0.0}
+        return {'count': hist.count, 'sum': hist.sum}
+
+    def get_counter(self, site_id, name):
+        return self._counters.get((site_id, name), 0)
+
+    def snapshot(self) -> dict:
+        """
+        :return: {'timings': {站点: {阶段: {count, sum}}}, 'counters': {站点: {名称: 值}}}
+        """
+        with self._lock:
+            timings = {}
+            for (site_id, stage), hist in self._timings.items():
+                timings.setdefault(site_id, {})[stage] = {'count': hist.count, 'sum': hist.sum}
+            counters = {}
+            for (site_id, name), value in self._counters.items():
+                counters.setdefault(site_id, {})[name] = value
+        return {'timings': timings, 'counters': counters}
+
+    def reset(self):
+        with self._lock:
+            self._timings.clear()
+            self._counters.clear()
+
+    def export_prometheus(self) -> str:
+        """
+        导出Prometheus文本格式（text/plain; version=0.0.4），挂到自己的/metrics接口上即可被抓取
+        :return:
+        """
+        ns = self.namespace
+        lines = []
+        with self._lock:
+            if self._timings:
+                lines.append(f'# HELP {ns}_stage_seconds Time spent per site and stage.')
+                lines.append(f'# TYPE {ns}_stage_seconds histogram')
+                for (site_id, stage), hist in sorted(self._timings.items()):
+                    labels = f'site="{_escape(site_id)}",stage="{_escape(stage)}"'
+                    # 直方图的桶是累计值
+                    for le, count in zip(self.buckets, hist.buckets):
+                        lines.append(f'{ns}_stage_seconds_bucket{{{labels},le="{le}"}} {count}')
+                    lines.append(f'{ns}_stage_seconds_bucket{{{labels},le="+Inf"}} {hist.count}')
+                    lines.append(f'{ns}_stage_seconds_sum{{{labels}}} {_format_value(hist.sum)}')
+                    lines.append(f'{ns}_stage_seconds_count{{{labels}}} {hist.count}')
+            names = sorted(set(name for _, name in self._counters))
+            for name in names:
+                lines.append(f'# HELP {ns}_{name}_total Total {name.replace("_", " ")} per site.')
+                lines.append(f'# TYPE {ns}_{name}_total counter')
+                for (site_id, n), value in sorted(self._counters.items()):
+                    if n == name:
+                        lines.append(f'{ns}_{name}_total{{site="{_escape(site_id)}"}} {_format_value(value)}')
+        return '\n'.join(lines) + '\n' if lines else ''
+
+
+def record_retry(retry_state):
+    """
+    tenacity的before_sleep回调，站点方法重试时给站点记一次retries
+    :param retry_state:
+    :return:
+    """
+    tracker = retry_state.args[0] if retry_state.args else None
+    if tracker is not None and getattr(tracker, 'metrics', None) is not None:
+        tracker.metrics.incr(tracker.get_id(), 'retries')
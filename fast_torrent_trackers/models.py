@@ -1,8 +1,10 @@
 import datetime
 from enum import Enum
+from types import MappingProxyType
 from typing import List
 
-from fast_torrent_trackers.utils import DictWrapper, trans_size_str_to_mb
+from fast_torrent_trackers.normalize import Normalizer
+from fast_torrent_trackers.utils import DictWrapper
 
 
 class CateLevel1(str, Enum):
@@ -23,6 +25,97 @@ class CateLevel1(str, Enum):
         return None
 
 
+_index_cache = {}
+
+
+class CategoryIndex:
+    """
+    站点分类配置的只读索引，构造站点时建一次，解析每个种子、组装搜索分类时直接查表。
+    查找规则和原来逐个遍历category_mappings一致：按编号找一级分类时同编号以最后一个为准，按二级分类找编号时以第一个为准
+    """
+
+    def __init__(self, category_mappings, category_id_mapping=None):
+        """
+        :param category_mappings: 站点配置的category_mappings
+        :param category_id_mapping: 站点配置的category_id_mapping，分类编号到搜索时实际提交的编号
+        """
+        category_mappings = category_mappings or []
+        level1_by_id = {}
+        by_level2 = {}
+        positions_by_level1 = {}
+        for i, c in enumerate(category_mappings):
+            level1_by_id[c.get('id')] = CateLevel1.get_type(c.get('cate_level1'))
+            by_level2.setdefault(c.get('cate_level2'), c)
+            positions_by_level1.setdefault(c.get('cate_level1'), []).append(i)
+        self.ids = tuple(c.get('id') for c in category_mappings)
+        # 不指定一级分类时默认搜索的分类，不包含成人
+        self.default_ids = tuple(c.get('id') for c in category_mappings if c.get('cate_level1') != CateLevel1.AV.name)
+        self.level1_by_id = MappingProxyType(level1_by_id)
+        self.id_by_level2 = MappingProxyType({k: c.get('id') for k, c in by_level2.items()})
+        self.level1_by_level2 = MappingProxyType(
+            {k: CateLevel1.get_type(c.get('cate_level1')) for k, c in by_level2.items()})
+        self.positions_by_level1 = MappingProxyType({k: tuple(v) for k, v in positions_by_level1.items()})
+        self.level1_names = frozenset(positions_by_level1)
+        self.search_ids_by_id = None
+        if category_id_mapping:
+            search_ids_by_id = {}
+            for mid in category_id_mapping:
+                mapping = mid.get('mapping')
+                ids = search_ids_by_id.setdefault(mid.get('id'), [])
+                ids += mapping if isinstance(mapping, list) else [mapping]
+            self.search_ids_by_id = MappingProxyType(
+                {k: tuple(filter(None, v)) for k, v in search_ids_by_id.items()})
+
+    @staticmethod
+    def for_config(site_config) -> 'CategoryIndex':
+        """
+        取站点配置的分类索引，同一份配置只建一次；配置按只读使用，原地修改category_mappings后不会重建
+        :param site_config:
+        :return:
+        """
+        mappings = site_config.get('category_mappings')
+        id_mapping = site_config.get('category_id_mapping')
+        cache_key = (id(mappings), id(id_mapping))
+        cached = _index_cache.get(cache_key)
+        if cached and cached[0] is mappings and cached[1] is id_mapping:
+            return cached[2]
+        index = CategoryIndex(mappings, id_mapping)
+        if len(_index_cache) >= 256:
+            _index_cache.clear()
+        # 同时引用着配置，配置对象不会被回收，id也就不会被别的配置复用
+        _index_cache[cache_key] = (mappings, id_mapping, index)
+        return index
+
+    def get_level1(self, cate_id):
+        return self.level1_by_id.get(cate_id)
+
+    def get_ids_by_level1(self, cate_level1_list: List[CateLevel1] = None) -> list:
+        """
+        一级分类下所有的站点分类编号，顺序和配置一致
+        :param cate_level1_list: 为空时返回除成人外的所有分类
+        :return:
+        """
+        if not cate_level1_list:
+            return list(self.default_ids)
+        positions = set(self.positions_by_level1.get('*', ()))
+        for level1 in cate_level1_list:
+            positions.update(self.positions_by_level1.get(level1.name, ()))
+        return [self.ids[i] for i in sorted(positions)]
+
+    def get_search_ids(self, ids):
+        """
+        转换成搜索时实际提交的分类编号，站点没有配置category_id_mapping时原样返回
+        :param ids:
+        :return:
+        """
+        if not ids or self.search_ids_by_id is None:
+            return ids
+        new_ids = []
+        for id in ids:
+            new_ids += self.search_ids_by_id.get(id, ())
+        return new_ids
+
+
 class TrackerUserinfo:
     uid: int
     username: str
@@ -76,37 +169,47 @@ class TorrentInfo:
     poster_url: str
 
     @staticmethod
-    def build_by_parse_item(site_config, item):
+    def build_by_parse_item(site_config, item, normalizer: Normalizer = None, category_index: CategoryIndex = None):
+        """
+        :param site_config:
+        :param item: HtmlParser解析出的字段
+        :param normalizer: 同一页的种子共用一个，重复的原始值只转换一次
+        :param category_index: 站点的分类索引，为空时取CategoryIndex.for_config(site_config)
+        :return:
+        """
         item = DictWrapper(item or {})
+        if normalizer is None:
+            normalizer = Normalizer()
         t = TorrentInfo()
         t.site_id = site_config.get('id')
-        t.id = item.get_int('id', 0)
+        t.id = normalizer.to_int(item.get('id'), 0)
         t.name = item.get_value('title', '')
         t.subject = item.get_value('description', '')
         if t.subject:
             t.subject = t.subject.strip()
         t.free_deadline = item.get('free_deadline')
         t.imdb_id = item.get('imdbid')
-        t.upload_count = item.get_int('seeders', 0)
-        t.downloading_count = item.get_int('leechers', 0)
-        t.download_count = item.get_int('grabs', 0)
+        t.upload_count = normalizer.to_int(item.get('seeders'), 0)
+        t.downloading_count = normalizer.to_int(item.get('leechers'), 0)
+        t.download_count = normalizer.to_int(item.get('grabs'), 0)
         t.download_url = item.get('download')
         if t.download_url and not t.download_url.startswith('http'):
             t.download_url = site_config.get('domain') + t.download_url
         t.publish_date = item.get_value('date', datetime.datetime.now())
         t.cate_id = str(item.get('category')) if item.get('category') else None
-        for c in site_config.get('category_mappings'):
-            if c.get('id') == t.cate_id:
-                t.cate_level1 = CateLevel1.get_type(c.get('cate_level1'))
+        if category_index is None:
+            category_index = CategoryIndex.for_config(site_config)
+        if t.cate_id in category_index.level1_by_id:
+            t.cate_level1 = category_index.level1_by_id[t.cate_id]
         t.details_url = item.get('details')
         if t.details_url:
             t.details_url = site_config.get('domain') + t.details_url
         t.download_volume_factor = float(item.get_value('downloadvolumefactor', 1))
         t.upload_volume_factor = item.get_value('uploadvolumefactor', 1)
-        t.size_mb = trans_size_str_to_mb(str(item.get_value('size', 0)))
+        t.size_mb = normalizer.size_mb(item.get('size'))
         t.poster_url = item.get('poster')
-        t.minimum_ratio = item.get_float('minimumratio', 0.0)
-        t.minimum_seed_time = item.get_int('minimumseedtime', 0)
+        t.minimum_ratio = normalizer.to_float(item.get('minimumratio'), 0.0)
+        t.minimum_seed_time = normalizer.to_int(item.get('minimumseedtime'), 0)
         if t.poster_url:
             if t.poster_url.startswith("./"):
                 t.poster_url = site_config.get('domain') + t.poster_url[2:]
@@ -115,4 +218,76 @@ class TorrentInfo:
         return t
 
 
+class _FrozenSlots:
+    """
+    用__slots__存属性的只读对象，没有实例__dict__，大量常驻内存时占用小很多；属性名和可变版本保持一致
+    """
+    __slots__ = ()
+    _defaults = {}
+
+    def __init__(self, **kwargs):
+        for name in self.__slots__:
+            object.__setattr__(self, name, kwargs.get(name, self._defaults.get(name)))
+
+    @classmethod
+    def from_object(cls, obj):
+        """
+        从可变版本（TorrentInfo、TrackerUserinfo）转换，没有赋值过的属性取类上的默认值
+        :param obj:
+        :return:
+        """
+        if isinstance(obj, cls):
+            return obj
+        return cls(**{name: getattr(obj, name, cls._defaults.get(name)) for name in cls.__slots__})
+
+    def __setattr__(self, key, value):
+        raise AttributeError(f'{self.__class__.__name__}是只读的，不能修改{key}')
+
+    def __delattr__(self, key):
+        raise AttributeError(f'{self.__class__.__name__}是只读的，不能删除{key}')
+
+    def __reduce__(self):
+        return _rebuild_frozen, (self.__class__, self.to_dict())
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __hash__(self):
+        return hash(tuple(getattr(self, name) for name in self.__slots__))
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__,
+                           ', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__))
+
+
+def _rebuild_frozen(cls, values):
+    return cls(**values)
+
+
+class CompactTrackerUserinfo(_FrozenSlots):
+    """TrackerUserinfo的只读紧凑版本"""
+    __slots__ = ('uid', 'username', 'user_group', 'share_ratio', 'uploaded', 'downloaded', 'seeding', 'leeching',
+                 'vip_group')
+    _defaults = {'vip_group': False}
+
+
+class CompactTorrentInfo(_FrozenSlots):
+    """TorrentInfo的只读紧凑版本，属性和TorrentInfo一致"""
+    __slots__ = ('site_id', 'id', 'name', 'subject', 'cate_level1', 'cate_id', 'details_url', 'download_url',
+                 'imdb_id', 'publish_date', 'size_mb', 'upload_count', 'downloading_count', 'download_count',
+                 'free_deadline', 'download_volume_factor', 'upload_volume_factor', 'minimum_ratio',
+                 'minimum_seed_time', 'poster_url')
+    _defaults = {'minimum_ratio': 0, 'minimum_seed_time': 0}
+
+    @staticmethod
+    def build_by_parse_item(site_config, item, normalizer: Normalizer = None, category_index: CategoryIndex = None):
+        return CompactTorrentInfo.from_object(
+            TorrentInfo.build_by_parse_item(site_config, item, normalizer, category_index))
+
+
 TorrentList = List[TorrentInfo]
@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import time
+from enum import Enum
+from typing import List
+
+from fast_torrent_trackers.basetracker import BaseTracker
+from fast_torrent_trackers.exceptions import LoginRequired
+from fast_torrent_trackers.merger import merge_torrents
+from fast_torrent_trackers.trackersearcher import TrackerSearcher
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class SiteSearchStatus(str, Enum):
+    Success = 'success'
+    Error = 'error'
+    LoginRequired = 'login_required'
+    Timeout = 'timeout'
+
+
+class MultiTrackerSearcher:
+    """
+    多站点并发搜索，同一个查询同时发给所有站点，哪个站点先解析完就先返回哪个站点的结果
+    """
+    run_time = None
+
+    def __init__(self, trackers: List[BaseTracker], query=None, cate_level1_list: list = None,
+                 network_error_retry=False, timeout: int = None, search_value_type=None, max_concurrency: int = 5,
+                 deadline: float = None):
+        """
+        :param trackers: TrackerBuilder.build构建出来的站点列表
+        :param query: 同TrackerSearcher的query
+        :param cate_level1_list:
+        :param network_error_retry:
+        :param timeout: 单次请求超时时间
+        :param search_value_type: 为空时按每个站点配置的sub_search_value_type过滤query
+        :param max_concurrency: 全局同时搜索的站点数上限
+        :param deadline: 整批搜索的最长等待秒数，到时间还没返回的站点标记为超时，不影响其他站点的结果
+        """
+        self.searchers = []
+        for tracker in trackers:
+            if not tracker:
+                continue
+            value_type = search_value_type if search_value_type else tracker.get_sub_search_value_type()
+            self.searchers.append(TrackerSearcher(tracker, query=query, cate_level1_list=cate_level1_list,
+                                                  network_error_retry=network_error_retry, timeout=timeout,
+                                                  search_value_type=value_type))
+        self.max_concurrency = max_concurrency
+        self.deadline = deadline
+
+    def get_run_time(self):
+        return self.run_time
+
+    @staticmethod
+    def _build_result(searcher: TrackerSearcher, status: SiteSearchStatus, data=None, message=None):
+        return {
+            'site_id': searcher.get_site_id(),
+            'site_name': searcher.get_site_name(),
+            'status': status,
+            'data': data if data else [],
+            'message': message,
+            'run_time': searcher.get_run_time()
+        }
+
+    async def _search_site(self, searcher: TrackerSearcher, semaphore: asyncio.Semaphore):
+        async with semaphore:
+            try:
+                r = await searcher.search()
+            except LoginRequired as e:
+                return self._build_result(searcher, SiteSearchStatus.LoginRequired, message=str(e))
+            except Exception as e:
+                _LOGGER.error('从%s搜索 %s 失败了，错误信息: %s' % (searcher.get_site_name(), searcher.get_query_str(), e),
+                              exc_info=True)
+                return self._build_result(searcher, SiteSearchStatus.Error, message=str(e))
+        if r.get('code') != 0:
+            return self._build_result(searcher, SiteSearchStatus.Error, message='搜索失败')
+        return self._build_result(searcher, SiteSearchStatus.Success, r.get('data'))
+
+    async def iter_search(self):
+        """
+        异步迭代每个站点的搜索结果，按站点返回的先后顺序产出，每次产出一个站点的结果
+        :return:
+        """
+        if not self.searchers:
+            return
+        semaphore = asyncio.Semaphore(self.max_concurrency if self.max_concurrency else len(self.searchers))
+        tasks = {}
+        for s in self.searchers:
+            tasks[asyncio.ensure_future(self._search_site(s, semaphore))] = s
+        end_time = time.monotonic() + self.deadline if self.deadline else None
+        pending = set(tasks.keys())
+        try:
+            while pending:
+                wait_secs = None
+                if end_time is not None:
+                    wait_secs = end_time - time.monotonic()
+                    if wait_secs <= 0:
+                        break
+                done, pending = await asyncio.wait(pending, timeout=wait_secs, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+            for task in pending:
+                task.cancel()
+            for task in pending:
+                yield self._build_result(tasks[task], SiteSearchStatus.Timeout, message='超过整体搜索时限')
+        finally:
+            # 调用方提前结束迭代时，也要把还在跑的站点取消掉
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    async def search(self, merge: bool = False):
+        """
+        等所有站点完成（或者到达整体时限）后一次性返回，data为所有成功站点的种子，sites为每个站点的状态
+        :param merge: 为True时多返回merged，把多个站点的同一个资源合并成一组（MergedTorrent列表）
+        :return:
+        """
+        start = time.perf_counter()
+        data = []
+        sites = []
+        async for r in self.iter_search():
+            data += r['data']
+            sites.append({
+                'site_id': r['site_id'],
+                'site_name': r['site_name'],
+                'status': r['status'],
+                'count': len(r['data']),
+                'message': r['message'],
+                'run_time': r['run_time']
+            })
+        self.run_time = time.perf_counter() - start
+        code = 0 if any(s['status'] == SiteSearchStatus.Success for s in sites) or not sites else 1
+        result = {'code': code, 'data': data, 'sites': sites}
+        if merge:
+            result['merged'] = merge_torrents(data)
+        return result
@@ -0,0 +1,121 @@
+import datetime
+import re
+from functools import lru_cache
+
+from fast_torrent_trackers.utils import trans_size_str_to_mb, trans_unit_to_mb
+
+# 常见的"数字 单位"格式一次匹配出数字和单位，其他写法交给trans_size_str_to_mb，保证结果和原来一致
+_SIZE_RE = re.compile(r'(\d[\d,]*(?:\.\d*)?) ?(GB|GiB|MB|MiB|KB|KiB|TB|TiB|PB|PiB)')
+
+# 固定宽度的日期格式直接按位置取数字，匹配不上或者取值不合法时交给strptime
+_FAST_DATE_FORMATS = {
+    '%Y-%m-%d %H:%M:%S': re.compile(r'(\d{4})-(\d{2})-(\d{2}) (\d{2}):(\d{2}):(\d{2})'),
+    '%Y-%m-%d%H:%M:%S': re.compile(r'(\d{4})-(\d{2})-(\d{2})(\d{2}):(\d{2}):(\d{2})'),
+    '%Y-%m-%d %H:%M': re.compile(r'(\d{4})-(\d{2})-(\d{2}) (\d{2}):(\d{2})'),
+    '%Y-%m-%d': re.compile(r'(\d{4})-(\d{2})-(\d{2})'),
+}
+
+_FAILED = object()
+
+
+def size_to_mb(size: str) -> float:
+    """
+    和trans_size_str_to_mb结果一致的尺寸转换，常见格式只做一次正则匹配
+    :param size:
+    :return:
+    """
+    m = _SIZE_RE.fullmatch(size)
+    if m:
+        return trans_unit_to_mb(float(m.group(1).replace(',', '')), m.group(2))
+    return trans_size_str_to_mb(size)
+
+
+@lru_cache(maxsize=4096)
+def parse_datetime(value: str, fmt: str) -> datetime.datetime:
+    """
+    和datetime.strptime结果一致的日期解析，固定格式走快速路径，重复的值直接取缓存
+    :param value:
+    :param fmt:
+    :return:
+    """
+    pattern = _FAST_DATE_FORMATS.get(fmt)
+    if pattern is not None:
+        m = pattern.fullmatch(value)
+        if m:
+            try:
+                return datetime.datetime(*map(int, m.groups()))
+            except ValueError:
+                pass
+    return datetime.datetime.strptime(value, fmt)
+
+
+class Normalizer:
+    """
+    把一页种子的尺寸、做种数、下载数、完成数等原始字符串逐行转换成数字，同一页共用一个实例，同一个原始值只转换一次。
+    转换规则和DictWrapper.get_int/get_float、trans_size_str_to_mb完全一致
+    """
+
+    def __init__(self, maxsize=4096):
+        """
+        :param maxsize: 每类值最多缓存的个数，超过后清空重新缓存
+        """
+        self.maxsize = maxsize
+        self._sizes = {}
+        self._ints = {}
+        self._floats = {}
+
+    def _remember(self, cache, key, value):
+        if len(cache) >= self.maxsize:
+            cache.clear()
+        cache[key] = value
+        return value
+
+    def size_mb(self, value) -> float:
+        """
+        :param value: 解析出的size字段原值，None按0处理
+        :return:
+        """
+        size = str(0 if value is None else value)
+        result = self._sizes.get(size)
+        if result is None:
+            result = self._remember(self._sizes, size, size_to_mb(size))
+        return result
+
+    def to_int(self, value, default=None):
+        if value is None:
+            return default
+        if type(value) is int:
+            return value
+        if type(value) is not str:
+            try:
+                return int(str(value).replace(',', ''))
+            except Exception:
+                return default
+        result = self._ints.get(value)
+        if result is None:
+            try:
+                result = int(value.replace(',', ''))
+            except Exception:
+                result = _FAILED
+            self._remember(self._ints, value, result)
+        return default if result is _FAILED else result
+
+    def to_float(self, value, default=None):
+        if value is None:
+            return default
+        if type(value) is float:
+            return value
+        if type(value) is not str:
+            try:
+                return float(str(value).replace(',', ''))
+            except Exception:
+                return default
+        result = self._floats.get(value)
+        if result is None:
+            try:
+                result = float(value.replace(',', ''))
+            except Exception:
+                result = _FAILED
+            self._remember(self._floats, value, result)
+        return default if result is _FAILED else result
+
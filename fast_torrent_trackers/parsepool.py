@@ -0,0 +1,42 @@
+"""
+页面解析放到线程池或进程池执行时用的入口函数。
+进程池需要函数能按模块路径找到、参数和返回值都能pickle，所以这里只接收站点配置和页面文本，返回dict和TorrentInfo列表。
+"""
+from fast_torrent_trackers.models import TorrentList
+
+# 每个worker里按站点缓存解析器，字段规则在同一个worker里只编译一次
+_parsers = {}
+
+
+def get_parser(site_config, backend=None):
+    from fast_torrent_trackers.tracker.spidertracker import TrackerParser
+    key = (site_config.get('id'), backend)
+    parser = _parsers.get(key)
+    # 进程池每次传过来的都是新的配置对象，只能按内容判断配置是否变了
+    if parser is None or parser.site_config != site_config:
+        parser = TrackerParser(site_config, backend)
+        _parsers[key] = parser
+    return parser
+
+
+def parse_userinfo_page(site_config, html_text, backend=None) -> dict:
+    return get_parser(site_config, backend).parse_userinfo(html_text)
+
+
+def parse_search_page(site_config, html_text, userinfo=None, watermark=None, backend=None) -> (dict, TorrentList):
+    """
+    解析搜索结果页，还没有用户信息时顺便从页面解析出来
+    :param site_config:
+    :param html_text:
+    :param userinfo: 已解析的用户信息，种子字段模版里会用到
+    :param watermark: 增量拉取时的水位线
+    :param backend:
+    :return: (用户信息, 种子列表)
+    """
+    parser = get_parser(site_config, backend)
+    # 用户信息和种子列表共用一棵文档树
+    page = parser.parse_page(html_text)
+    if not userinfo:
+        userinfo = parser.parse_userinfo(page)
+    torrents = parser.parse_torrents(page, context={'userinfo': userinfo}, watermark=watermark)
+    return userinfo, torrents
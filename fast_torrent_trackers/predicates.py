@@ -0,0 +1,30 @@
+from fast_torrent_trackers.models import TorrentInfo
+
+
+class RowPredicate:
+    """
+    按行过滤种子的条件，fields为判断时用到的字段名（站点配置torrents.fields里的名字）。
+    解析时先只解析这些字段（以及它们模版里引用的字段），不满足条件的行直接跳过，不再解析其他字段
+    """
+
+    def __init__(self, fields, func):
+        """
+        :param fields: 判断用到的字段名
+        :param func: 接收只填了这些字段的TorrentInfo，返回是否保留
+        """
+        self.fields = list(fields)
+        self.func = func
+
+    def __call__(self, torrent: TorrentInfo) -> bool:
+        return self.func(torrent)
+
+    def __and__(self, other):
+        return RowPredicate(self.fields + other.fields, lambda t: self.func(t) and other.func(t))
+
+
+def free_only() -> RowPredicate:
+    return RowPredicate(['downloadvolumefactor'], lambda t: t.download_volume_factor == 0)
+
+
+def min_seeders(count: int) -> RowPredicate:
+    return RowPredicate(['seeders'], lambda t: t.upload_count >= count)
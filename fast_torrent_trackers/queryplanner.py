@@ -0,0 +1,57 @@
+"""
+搜索查询计划：TrackerSearcher的多个查询（比如中文名、英文名）原本逐个请求站点。
+站点支持关键字"或"搜索时（NexusPHP的search_mode=1），把多个单个词的关键字合并成一次请求，再在本地过滤掉只匹配到部分词的结果；
+不能合并的查询各自请求，由调用方并发执行，请求间隔交给站点的搜索限流器控制。
+"""
+from typing import Iterable, List
+
+from fast_torrent_trackers.merger import normalize_title
+from fast_torrent_trackers.models import TorrentInfo, TorrentList
+
+
+def is_single_term(keyword) -> bool:
+    """
+    :param keyword:
+    :return: 规范化后只有一个词时为True。站点"或"搜索按词匹配，多个词的关键字合并后任何一个词都能匹配，结果会被无关种子挤满
+    """
+    if not keyword or not isinstance(keyword, str):
+        return False
+    normalized = normalize_title(keyword)
+    return bool(normalized) and ' ' not in normalized
+
+
+def plan_queries(queries: List[dict], keyword_or: bool = False) -> List[List[dict]]:
+    """
+    把查询排成要执行的步骤，每一步发一次搜索
+    :param queries: TrackerSearcher的查询，{'key': 'keyword'或'imdb_id', 'value': ...}
+    :param keyword_or: 站点是否支持关键字"或"搜索
+    :return: 步骤列表，每一步是一个或多个查询；合并的那一步放在第一个被合并的查询的位置
+    """
+    steps = []
+    merged = None
+    for q in queries:
+        if keyword_or and q.get('key') == 'keyword' and is_single_term(q.get('value')):
+            if merged is None:
+                merged = []
+                steps.append(merged)
+            if q.get('value') not in [m.get('value') for m in merged]:
+                merged.append(q)
+            continue
+        steps.append([q])
+    return steps
+
+
+def match_any_keyword(torrents: Iterable[TorrentInfo], keywords: List[str]) -> TorrentList:
+    """
+    只保留种子名或标题包含某一个关键字全部词的种子
+    :param torrents:
+    :param keywords:
+    :return:
+    """
+    terms = [normalize_title(k).split(' ') for k in keywords if normalize_title(k)]
+    result = []
+    for t in torrents or []:
+        text = normalize_title(t.name) + ' ' + normalize_title(t.subject)
+        if any(all(term in text for term in kw_terms) for kw_terms in terms):
+            result.append(t)
+    return result
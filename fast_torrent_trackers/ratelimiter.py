@@ -0,0 +1,135 @@
+import asyncio
+import time
+
+from fast_torrent_trackers.exceptions import RateLimitException, RequestOverloadException
+
+
+class AsyncRateLimiter:
+    """
+    基于令牌桶的异步限流器，等待时只挂起当前协程，不会阻塞事件循环
+    """
+
+    def __init__(self, rate: float, per: float = 1.0, burst: int = 1):
+        """
+        :param rate: per秒内允许的请求数
+        :param per: 时间窗口，单位秒
+        :param burst: 桶容量，允许瞬时突发的请求数
+        """
+        if rate <= 0 or per <= 0:
+            raise ValueError('rate和per必须大于0')
+        self.rate = rate
+        self.per = per
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated_at = time.monotonic()
+
+    @property
+    def fill_rate(self):
+        return self.rate / self.per
+
+    def _refill(self, now):
+        self.tokens = min(float(self.burst), self.tokens + (now - self.updated_at) * self.fill_rate)
+        self.updated_at = now
+
+    def reserve(self) -> float:
+        """
+        预占一个令牌，返回需要等待的秒数；令牌不足时记为欠账，后来的请求排在后面
+        :return:
+        """
+        self._refill(time.monotonic())
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0
+        return -self.tokens / self.fill_rate
+
+    async def acquire(self):
+        wait_secs = self.reserve()
+        if wait_secs > 0:
+            await asyncio.sleep(wait_secs)
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+class AdaptiveRateLimiter(AsyncRateLimiter):
+    """
+    按站点反馈自动调整速率的令牌桶（AIMD）：请求成功时速率加法增加，遇到限流、负载过高时速率乘法减少，
+    负载过高时还会按站点要求的秒数暂停发请求。用async with包住请求即可自动取令牌并反馈结果
+    """
+
+    def __init__(self, rate: float, per: float = 1.0, burst: int = 1, min_rate: float = None,
+                 max_rate: float = None, increase: float = None, decrease: float = 0.5):
+        """
+        :param rate: 初始速率，per秒内允许的请求数
+        :param per: 时间窗口，单位秒
+        :param burst: 桶容量
+        :param min_rate: 速率下限，默认为初始速率的1/10
+        :param max_rate: 速率上限，默认为初始速率，即只降不升；站点配置了max_rate才会往上试探
+        :param increase: 每次成功增加的速率，默认为初始速率的1/10
+        :param decrease: 遇到限流时速率乘以的系数
+        """
+        super().__init__(rate, per, burst)
+        self.min_rate = min_rate if min_rate else rate / 10
+        self.max_rate = max_rate if max_rate else rate
+        self.increase = increase if increase else rate / 10
+        self.decrease = decrease
+        self.paused_until = 0.0
+
+    @classmethod
+    def from_config(cls, config: dict, default: dict = None):
+        """
+        按站点配置文件rate_limit下的一项创建，没有配置的参数取default
+        :param config: {rate, per, burst, min_rate, max_rate, increase, decrease}
+        :param default:
+        :return:
+        """
+        options = dict(default or {})
+        options.update(config or {})
+        return cls(float(options.get('rate', 1)), float(options.get('per', 1)), int(options.get('burst', 1)),
+                   min_rate=options.get('min_rate'), max_rate=options.get('max_rate'),
+                   increase=options.get('increase'), decrease=float(options.get('decrease', 0.5)))
+
+    def _set_rate(self, rate):
+        # 先按原速率补充令牌，再换新速率
+        self._refill(time.monotonic())
+        self.rate = min(self.max_rate, max(self.min_rate, rate))
+
+    def reserve(self) -> float:
+        wait_secs = super().reserve()
+        return max(wait_secs, self.paused_until - time.monotonic())
+
+    def on_success(self):
+        if self.rate < self.max_rate:
+            self._set_rate(self.rate + self.increase)
+
+    def on_rate_limited(self):
+        self._set_rate(self.rate * self.decrease)
+
+    def on_overload(self, stop_secs: float = 0):
+        """
+        :param stop_secs: 站点要求暂停的秒数
+        :return:
+        """
+        self.on_rate_limited()
+        if stop_secs:
+            self.paused_until = max(self.paused_until, time.monotonic() + stop_secs)
+
+    def feedback(self, exc_val):
+        """
+        按请求结果调整速率
+        :param exc_val: 请求抛出的异常，成功时为None
+        :return:
+        """
+        if exc_val is None:
+            self.on_success()
+        elif isinstance(exc_val, RequestOverloadException):
+            self.on_overload(exc_val.stop_secs)
+        elif isinstance(exc_val, RateLimitException):
+            self.on_rate_limited()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.feedback(exc_val)
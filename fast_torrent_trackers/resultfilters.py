@@ -1,63 +1,206 @@
+"""
+搜索结果的补充阶段：解析出种子之后、返回给调用方之前执行，补充搜索页面上拿不到的字段（比如hdchina的促销状态要另外用ajax查询）。
+站点配置文件的search.result_filter指定补充阶段的名称，每个站点实例创建一个，缓存和批量合并都在实例内。
+"""
+import asyncio
 import datetime
 import json
 import re
+import time
+from abc import ABCMeta, abstractmethod
+from typing import Dict, List
+
+from cacheout import Cache
 
 from fast_torrent_trackers.models import TorrentList
 
+_CSRF_RE = re.compile(r'<meta name="x-csrf" content="([^"]+)"/>')
+_PROMOTION_FIELDS = ('download_volume_factor', 'upload_volume_factor', 'free_deadline')
+
+
+class ResultEnricher(metaclass=ABCMeta):
+    @abstractmethod
+    async def enrich(self, tracker, search_html_text, torrents: TorrentList):
+        """
+        就地补充种子的字段
+        :param tracker: 发起搜索的站点实例
+        :param search_html_text: 搜索结果页文本
+        :param torrents: 从页面解析出的种子
+        :return:
+        """
+        pass
 
-async def hdchina_free_ajax_filter(client, search_html_text, torrents: TorrentList):
-    mcsrf = re.search(r'<meta name="x-csrf" content="([^"]+)"/>', search_html_text)
-    if mcsrf:
-        csrf = mcsrf.group(1)
+
+def parse_hdchina_promotion(free_info: dict) -> dict:
+    """
+    把ajax_promotion.php返回的单个种子的促销信息转换成种子字段
+    :param free_info: {'sp_state': ..., 'timeout': ...}
+    :return: 需要覆盖的种子字段，没有出现的字段保持页面上解析出的值
+    """
+    promotion = {}
+    sp_state = free_info['sp_state']
+    if sp_state.find('pro_free') != -1:
+        promotion['download_volume_factor'] = 0.0
+    elif sp_state.find('pro_free2up') != -1:
+        promotion['download_volume_factor'] = 0.0
+        promotion['upload_volume_factor'] = 2
+    elif sp_state.find('pro_50pctdown') != -1:
+        promotion['download_volume_factor'] = 0.5
+    elif sp_state.find('pro_50pctdown2up') != -1:
+        promotion['download_volume_factor'] = 0.5
+        promotion['upload_volume_factor'] = 2
+    elif sp_state.find('pro_30pctdown') != -1:
+        promotion['download_volume_factor'] = 0.3
+    elif sp_state.find('pro_2up') != -1:
+        promotion['upload_volume_factor'] = 2
     else:
-        csrf = ''
+        promotion['download_volume_factor'] = 1.0
+    if promotion.get('download_volume_factor') == 0.0:
+        if free_info['timeout'] == '':
+            # 默认为不免费，避免损失
+            promotion['download_volume_factor'] = 1.0
+        else:
+            mtime = re.search(r'\d+-\d+-\d+ \d+:\d+:\d+', free_info['timeout'])
+            if mtime:
+                promotion['free_deadline'] = datetime.datetime.strptime(mtime.group(), '%Y-%m-%d %H:%M:%S')
+    return promotion
+
+
+def apply_promotion(torrent, promotion: dict):
+    for name in _PROMOTION_FIELDS:
+        if name in promotion:
+            setattr(torrent, name, promotion[name])
+
+
+async def _post_hdchina_promotion(tracker, ids, csrf):
     post_str = ''
-    for t in torrents:
-        post_str += f'ids%5B%5D={t.id}&'
+    for i in ids:
+        post_str += f'ids%5B%5D={i}&'
     post_str += 'csrf=' + csrf
-    free_res = await client.post(
-        url='https://hdchina.org/ajax_promotion.php',
-        data=post_str,
+    return await tracker.request(
+        'POST',
+        'https://hdchina.org/ajax_promotion.php',
+        content=post_str,
         headers={
             'referer': 'https://hdchina.org/torrents.php',
             'user-agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/97.0.4692.71 Safari/537.36',
             'content-type': 'application/x-www-form-urlencoded; charset=UTF-8'
-        },
-        cookies=client.cookies
+        }
     )
-    free_info_json = json.loads(free_res.text)
-    for t in torrents:
-        if str(t.id) not in free_info_json['message']:
-            continue
-        free_info = free_info_json['message'][str(t.id)]
-        sp_state = free_info['sp_state']
-        if sp_state.find('pro_free') != -1:
-            t.download_volume_factor = 0.0
-        elif sp_state.find('pro_free2up') != -1:
-            t.download_volume_factor = 0.0
-            t.upload_volume_factor = 2
-        elif sp_state.find('pro_50pctdown') != -1:
-            t.download_volume_factor = 0.5
-        elif sp_state.find('pro_50pctdown2up') != -1:
-            t.download_volume_factor = 0.5
-            t.upload_volume_factor = 2
-        elif sp_state.find('pro_30pctdown') != -1:
-            t.download_volume_factor = 0.3
-        elif sp_state.find('pro_2up') != -1:
-            t.upload_volume_factor = 2
-        else:
-            t.download_volume_factor = 1.0
-        if t.download_volume_factor == 0.0:
-            if free_info['timeout'] == '':
-                # 默认为不免费，避免损失
-                t.download_volume_factor = 1.0
+
+
+def _get_csrf(search_html_text):
+    mcsrf = _CSRF_RE.search(search_html_text or '')
+    return mcsrf.group(1) if mcsrf else ''
+
+
+class HdchinaPromotionEnricher(ResultEnricher):
+    """
+    hdchina的促销状态在免费截止之前很少变化，按种子编号缓存到截止时间（最长ttl秒），只查询没有缓存的编号；
+    batch_delay秒内多个页面、多个并发搜索要查的编号合并成一次请求
+    """
+
+    def __init__(self, ttl: float = 600, batch_delay: float = 0.05, max_batch: int = 200, maxsize: int = 20000):
+        """
+        :param ttl: 促销状态最长缓存秒数
+        :param batch_delay: 第一个编号到达后等待多久再发请求，期间到达的编号一起查询
+        :param max_batch: 一次请求最多查询的编号数
+        :param maxsize: 最多缓存的种子数
+        """
+        self.ttl = ttl
+        self.batch_delay = batch_delay
+        self.max_batch = max_batch
+        self.cache = Cache(maxsize=maxsize, ttl=ttl)
+        self.csrf = ''
+        # 等待发送的编号和正在查询的编号，值是等查询结果的future
+        self._queued: Dict[str, asyncio.Future] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._flush_task = None
+
+    def _cache_promotion(self, torrent_id, promotion: dict):
+        ttl = self.ttl
+        deadline = promotion.get('free_deadline')
+        if isinstance(deadline, datetime.datetime) and deadline != datetime.datetime.max:
+            ttl = min(ttl, deadline.timestamp() - time.time())
+            if ttl <= 0:
+                return
+        self.cache.set(torrent_id, promotion, ttl=ttl)
+
+    async def _send(self, tracker, futures: Dict[str, asyncio.Future]):
+        try:
+            tracker.record_metric('promotion_requests')
+            r = await _post_hdchina_promotion(tracker, list(futures.keys()), self.csrf)
+            message = json.loads(r.text)['message']
+        except Exception as e:
+            for f in futures.values():
+                if not f.cancelled() and not f.done():
+                    f.set_exception(e)
+            return
+        finally:
+            for torrent_id in futures:
+                self._inflight.pop(torrent_id, None)
+        for torrent_id, f in futures.items():
+            # 没有返回促销信息的种子也缓存，避免反复查询
+            promotion = parse_hdchina_promotion(message[torrent_id]) if torrent_id in message else {}
+            self._cache_promotion(torrent_id, promotion)
+            if not f.cancelled() and not f.done():
+                f.set_result(promotion)
+
+    async def _flush_later(self, tracker):
+        await asyncio.sleep(self.batch_delay)
+        self._flush_task = None
+        queued = list(self._queued.items())
+        self._queued = {}
+        self._inflight.update(queued)
+        batches = [dict(queued[i:i + self.max_batch]) for i in range(0, len(queued), self.max_batch)]
+        await asyncio.gather(*[self._send(tracker, b) for b in batches])
+
+    async def _lookup(self, tracker, ids: List[str]) -> Dict[str, dict]:
+        futures = {}
+        for torrent_id in ids:
+            f = self._inflight.get(torrent_id) or self._queued.get(torrent_id)
+            if f is None:
+                f = asyncio.get_running_loop().create_future()
+                self._queued[torrent_id] = f
+            futures[torrent_id] = f
+        if self._queued and self._flush_task is None:
+            self._flush_task = asyncio.ensure_future(self._flush_later(tracker))
+        # future是多个搜索共用的，一个调用方被取消时不能把别人等的future也取消掉
+        results = await asyncio.gather(*[asyncio.shield(f) for f in futures.values()])
+        return dict(zip(futures.keys(), results))
+
+    async def enrich(self, tracker, search_html_text, torrents: TorrentList):
+        csrf = _get_csrf(search_html_text)
+        if csrf:
+            self.csrf = csrf
+        promotions = {}
+        missing = []
+        for t in torrents:
+            torrent_id = str(t.id)
+            promotion = self.cache.get(torrent_id)
+            if promotion is None:
+                missing.append(torrent_id)
             else:
-                mtime = re.search(r'\d+-\d+-\d+ \d+:\d+:\d+', free_info['timeout'])
-                if mtime:
-                    t.free_deadline = datetime.datetime.strptime(mtime.group(), '%Y-%m-%d %H:%M:%S')
-    return free_res
+                promotions[torrent_id] = promotion
+        tracker.record_metric('promotion_cache_hits', len(promotions))
+        if missing:
+            promotions.update(await self._lookup(tracker, list(dict.fromkeys(missing))))
+        for t in torrents:
+            apply_promotion(t, promotions.get(str(t.id)) or {})
 
 
 result_filters = {
-    'hdchina_free_ajax_filter': hdchina_free_ajax_filter
+    'hdchina_free_ajax_filter': HdchinaPromotionEnricher
 }
+
+
+def create_result_enricher(name) -> ResultEnricher:
+    """
+    :param name: 站点配置文件的search.result_filter
+    :return: 没有配置时为空
+    """
+    if not name:
+        return None
+    if name not in result_filters:
+        raise ValueError(f'不支持的result_filter: {name}')
+    return result_filters[name]()
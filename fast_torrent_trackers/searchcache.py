@@ -0,0 +1,179 @@
+import asyncio
+import copy
+import functools
+import logging
+import time
+
+from cacheout import LRUCache
+
+from fast_torrent_trackers.models import CateLevel1, TorrentList
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class SearchCache:
+    """
+    站点搜索结果缓存，按站点和查询条件缓存TorrentList，条目数超过maxsize时淘汰最久没用到的。
+    结果超过ttl后变旧，stale_ttl内再次搜索仍然直接返回旧结果，同时在后台重新请求站点刷新缓存；超过ttl+stale_ttl才等待重新请求。
+    每次返回种子的副本，调用方修改返回的种子不会影响缓存和其他调用方
+    """
+
+    def __init__(self, maxsize: int = 512, ttl: float = 300, stale_ttl: float = 600, site_ttls: dict = None):
+        """
+        :param maxsize: 最多缓存多少次搜索的结果
+        :param ttl: 结果新鲜的秒数
+        :param stale_ttl: 结果变旧后还可以先返回、后台刷新的秒数，为0时不做后台刷新
+        :param site_ttls: 按站点编号单独设置ttl，优先级高于站点配置文件的search.cache.ttl
+        """
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.site_ttls = site_ttls if site_ttls else {}
+        self.cache = LRUCache(maxsize=maxsize, ttl=0)
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+        # 正在请求中的key，同一个查询同时只请求一次站点
+        self._pending = {}
+
+    @staticmethod
+    def make_key(site_id, keyword=None, imdb_id=None, cate_level1_list: list = None, free: bool = False,
+                 page: int = None):
+        cates = None
+        if cate_level1_list:
+            cates = tuple(sorted(c.name if isinstance(c, CateLevel1) else str(c) for c in cate_level1_list))
+        return site_id, keyword, imdb_id, cates, bool(free), page
+
+    def get_ttl(self, site_config) -> (float, float):
+        """
+        取站点的缓存时间，站点配置文件里可以用search.cache.ttl、search.cache.stale_ttl单独设置
+        :param site_config:
+        :return: (新鲜秒数, 可以返回旧结果的秒数)
+        """
+        search_config = site_config.get('search') or {}
+        cache_config = search_config.get('cache') or {}
+        ttl = self.site_ttls.get(site_config.get('id'), cache_config.get('ttl', self.ttl))
+        stale_ttl = cache_config.get('stale_ttl', self.stale_ttl)
+        return ttl, stale_ttl
+
+    @staticmethod
+    def _copy_torrents(torrents) -> TorrentList:
+        return [copy.copy(t) for t in torrents] if torrents is not None else torrents
+
+    async def get_or_load(self, site_config, key, loader) -> TorrentList:
+        """
+        :param site_config:
+        :param key: make_key生成的缓存key
+        :param loader: 真正请求站点搜索的协程函数
+        :return: 缓存里种子的副本
+        """
+        ttl, stale_ttl = self.get_ttl(site_config)
+        if not ttl or ttl <= 0:
+            return await loader()
+        entry = self.cache.get(key)
+        if entry is not None:
+            created_at, torrents = entry
+            age = time.monotonic() - created_at
+            if age < ttl:
+                self.hits += 1
+                return self._copy_torrents(torrents)
+            if age < ttl + stale_ttl:
+                self.stale_hits += 1
+                self._revalidate(key, loader, ttl, stale_ttl)
+                return self._copy_torrents(torrents)
+        self.misses += 1
+        task = self._get_pending(key)
+        if task is None:
+            task = self._start(key, loader, ttl, stale_ttl, refresh=False)
+        # 调用方被取消时不影响其他在等同一个查询的调用方
+        torrents = await asyncio.shield(task)
+        return self._copy_torrents(torrents)
+
+    def _get_pending(self, key):
+        task = self._pending.get(key)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            return None
+        return task
+
+    def _revalidate(self, key, loader, ttl, stale_ttl):
+        if self._get_pending(key) is not None:
+            return
+        self.refreshes += 1
+        self._start(key, loader, ttl, stale_ttl, refresh=True)
+
+    def _start(self, key, loader, ttl, stale_ttl, refresh):
+        task = asyncio.ensure_future(self._fetch(key, loader, ttl, stale_ttl))
+        self._pending[key] = task
+        task.add_done_callback(functools.partial(self._on_done, key, refresh))
+        return task
+
+    async def _fetch(self, key, loader, ttl, stale_ttl):
+        torrents = await loader()
+        if torrents is not None:
+            self.cache.set(key, (time.monotonic(), torrents), ttl=ttl + stale_ttl)
+        return torrents
+
+    def _on_done(self, key, refresh, task):
+        if self._pending.get(key) is task:
+            del self._pending[key]
+        if task.cancelled():
+            return
+        e = task.exception()
+        if e is not None and refresh:
+            # 后台刷新失败时保留旧结果，等下次再刷新
+            self.refresh_errors += 1
+            _LOGGER.warning(f'后台刷新搜索缓存{key}失败：{e}')
+
+    def invalidate(self, site_id=None):
+        """
+        清除缓存，不传site_id清除全部
+        :param site_id:
+        :return:
+        """
+        if site_id is None:
+            self.cache.clear()
+        else:
+            self.cache.delete_many(lambda k: k[0] == site_id)
+
+    def stats(self) -> dict:
+        total = self.hits + self.stale_hits + self.misses
+        return {
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'refreshes': self.refreshes,
+            'refresh_errors': self.refresh_errors,
+            'size': len(self.cache),
+            'hit_ratio': (self.hits + self.stale_hits) / total if total else 0.0
+        }
+
+
+def cached_search(func):
+    """
+    给站点的search方法加上结果缓存，站点实例的search_cache为空时直接搜索
+    :param func:
+    :return:
+    """
+
+    @functools.wraps(func)
+    async def wrapper(self, keyword=None, imdb_id=None, cate_level1_list: list = None, free: bool = False,
+                      page: int = None, timeout=None) -> TorrentList:
+        search = functools.partial(func, self, keyword=keyword, imdb_id=imdb_id, cate_level1_list=cate_level1_list,
+                                   free=free, page=page, timeout=timeout)
+        if self.search_cache is None:
+            return await search()
+        loaded = []
+
+        async def loader():
+            loaded.append(True)
+            return await search()
+
+        key = self.search_cache.make_key(self.get_id(), keyword, imdb_id, cate_level1_list, free, page)
+        result = await self.search_cache.get_or_load(self.site_config, key, loader)
+        if getattr(self, 'metrics', None) is not None:
+            # 这次调用没有请求站点（包括等到了别的调用方正在请求的结果）都算命中
+            self.metrics.incr(self.get_id(), 'cache_misses' if loaded else 'cache_hits')
+        return result
+
+    return wrapper
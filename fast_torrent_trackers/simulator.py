@@ -0,0 +1,181 @@
+import asyncio
+import json
+import random
+import time
+from urllib.parse import urlparse
+
+import httpx
+
+from fast_torrent_trackers.ratelimiter import AsyncRateLimiter
+
+RATE_LIMIT_PAGE = '<html><head><title>请求次数过多</title></head><body>请求次数过多，请稍后再试</body></html>'
+OVERLOAD_PAGE = '<html><head><meta http-equiv="refresh" content="120"/></head><body>负载过高，120秒后自动刷新</body></html>'
+CLOUDFLARE_PAGE = '<html><head><title>Just a moment...</title></head><body>Checking your browser</body></html>'
+DOWNLOAD_NOTICE_PAGE = '<html><head><title>下载提示</title></head><body><form method="post" action="downloadnotice.php">' \
+                       '<input type="hidden" name="id" value="{id}" /><input type="submit" value="下载" /></form>' \
+                       '</body></html>'
+TORRENT_CONTENT = b'd8:announce30:http://tracker.invalid/announce4:infod6:lengthi1e4:name4:test12:piece lengthi16384e' \
+                  b'6:pieces20:01234567890123456789ee'
+
+
+class FaultConfig:
+    """模拟站点的响应延迟、吞吐上限和各类故障页面出现的概率"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, max_rps: float = None, rate_limit: float = 0.0,
+                 overload: float = 0.0, cloudflare: float = 0.0, download_notice: float = 0.0, seed=None):
+        """
+        :param latency: 每个请求的固定延迟秒数
+        :param jitter: 在固定延迟上再随机增加0~jitter秒
+        :param max_rps: 站点每秒最多处理的请求数，超过的请求排队等待，为空不限制
+        :param rate_limit: 返回"请求次数过多"页面的概率
+        :param overload: 搜索时返回"负载过高，120秒后自动刷新"页面的概率
+        :param cloudflare: 返回CloudFlare 5秒盾（503）的概率
+        :param download_notice: 下载种子时返回下载提示确认页的概率
+        :param seed: 随机数种子，指定后故障出现的顺序可以复现
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.max_rps = max_rps
+        self.rate_limit = rate_limit
+        self.overload = overload
+        self.cloudflare = cloudflare
+        self.download_notice = download_notice
+        self.seed = seed
+
+
+class FixtureReplayer:
+    """
+    回放保存好的页面的本地NexusPHP站点，作为httpx.MockTransport挂到站点实例上，不走网络。
+    用户信息页、搜索页按站点配置的路径原样返回给定的页面（比如test/fixtures下保存的页面），
+    下载链接返回种子文件，可以按FaultConfig注入延迟、限流、负载过高、CloudFlare和下载提示页面。
+    页面不是按站点配置的规则生成的，改了选择器或配置不会体现在回放的页面上，规则能否解析页面由解析测试检查
+    """
+
+    def __init__(self, site_config, search_html: str, userinfo_html: str = None, faults: FaultConfig = None):
+        self.site_config = site_config
+        self.search_html = search_html
+        self.userinfo_html = userinfo_html if userinfo_html else search_html
+        self.faults = faults if faults else FaultConfig()
+        # 多个站点共用一份配置时按站点编号区分随机序列，避免各站点的故障同时出现
+        self.random = random.Random(None if self.faults.seed is None else f'{self.faults.seed}-{site_config.get("id")}')
+        self.limiter = AsyncRateLimiter(self.faults.max_rps) if self.faults.max_rps else None
+        userinfo_path = (site_config.get('userinfo') or {}).get('path') or ''
+        self.userinfo_path = self._normalize_path(userinfo_path)
+        self.search_paths = set(self._normalize_path(p.get('path')) for p in site_config.get('search').get('paths'))
+        self.stats = {}
+        self.transport = httpx.MockTransport(self.handle)
+
+    @staticmethod
+    def _normalize_path(path):
+        return urlparse(path).path.lstrip('/')
+
+    def attach(self, tracker):
+        """
+        把站点实例的请求都转到模拟站点，需要在站点创建客户端之前调用
+        :param tracker: SpiderTracker
+        :return: tracker
+        """
+        tracker.transport = self.transport
+        return tracker
+
+    def _count(self, name):
+        self.stats[name] = self.stats.get(name, 0) + 1
+
+    def _hit(self, probability):
+        return probability > 0 and self.random.random() < probability
+
+    @staticmethod
+    def _html(text, status_code=200):
+        return httpx.Response(status_code, text=text, headers={'content-type': 'text/html; charset=utf-8'})
+
+    def _route(self, request):
+        path = self._normalize_path(request.url.path)
+        if path == 'downloadnotice.php':
+            return 'download_confirm'
+        if path == 'download.php':
+            return 'download'
+        if path in self.search_paths:
+            return 'search'
+        if path == self.userinfo_path:
+            return 'userinfo'
+        return 'other'
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        kind = self._route(request)
+        self._count('requests')
+        self._count(kind)
+        if self.limiter is not None:
+            await self.limiter.acquire()
+        delay = self.faults.latency + (self.random.uniform(0, self.faults.jitter) if self.faults.jitter else 0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self._hit(self.faults.cloudflare):
+            self._count('cloudflare')
+            return self._html(CLOUDFLARE_PAGE, 503)
+        if kind in ('search', 'download') and self._hit(self.faults.rate_limit):
+            self._count('rate_limit')
+            return self._html(RATE_LIMIT_PAGE)
+        if kind == 'search':
+            if self._hit(self.faults.overload):
+                self._count('overload')
+                return self._html(OVERLOAD_PAGE)
+            return self._html(self.search_html)
+        if kind == 'userinfo':
+            return self._html(self.userinfo_html)
+        if kind == 'download':
+            if self._hit(self.faults.download_notice):
+                self._count('download_notice')
+                return self._html(DOWNLOAD_NOTICE_PAGE.format(id=request.url.params.get('id', '0')))
+            return self._torrent()
+        if kind == 'download_confirm':
+            return self._torrent()
+        # 其他接口（比如hdchina的促销查询）返回空结果
+        return httpx.Response(200, text=json.dumps({'message': {}}), headers={'content-type': 'application/json'})
+
+    @staticmethod
+    def _torrent():
+        return httpx.Response(200, content=TORRENT_CONTENT, headers={'content-type': 'application/x-bittorrent'})
+
+
+class LatencyRecorder:
+    """记录每次操作的耗时和结果，统计吞吐、分位延迟和重试放大倍数"""
+
+    def __init__(self):
+        self.latencies = []
+        # 包含重试在内的实际尝试次数
+        self.attempts = 0
+        self.errors = {}
+        self.started_at = None
+        self.finished_at = None
+
+    def start(self):
+        self.started_at = time.perf_counter()
+
+    def finish(self):
+        self.finished_at = time.perf_counter()
+
+    def record(self, seconds, error: Exception = None):
+        self.latencies.append(seconds)
+        if error is not None:
+            name = type(error).__name__
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    def percentile(self, p):
+        if not self.latencies:
+            return 0.0
+        values = sorted(self.latencies)
+        return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+    def summary(self):
+        elapsed = (self.finished_at or time.perf_counter()) - (self.started_at or time.perf_counter())
+        count = len(self.latencies)
+        return {
+            'count': count,
+            'errors': dict(self.errors),
+            'throughput': count / elapsed if elapsed > 0 else 0.0,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'max': max(self.latencies) if self.latencies else 0.0,
+            'retry_amplification': self.attempts / count if count else 0.0,
+        }
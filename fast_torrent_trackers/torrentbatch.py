@@ -0,0 +1,168 @@
+import datetime
+import sys
+from array import array
+from typing import Iterable, Iterator
+
+from fast_torrent_trackers.models import CompactTorrentInfo, TorrentInfo
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+# 时间列里表示None、空字符串（没免费时free_deadline模版渲染的结果）的值
+_NO_TIME = -(2 ** 63)
+_EMPTY_TIME = _NO_TIME + 1
+_NAN = float('nan')
+
+
+def _time_to_int(value) -> int:
+    if value == '':
+        return _EMPTY_TIME
+    if not isinstance(value, datetime.datetime):
+        return _NO_TIME
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    # 按微秒整数存，datetime.max也能原样还原
+    return (value - _EPOCH) // datetime.timedelta(microseconds=1)
+
+
+def _int_to_time(value):
+    if value == _NO_TIME:
+        return None
+    if value == _EMPTY_TIME:
+        return ''
+    return _EPOCH + datetime.timedelta(microseconds=value)
+
+
+def _float_or_nan(value) -> float:
+    if value is None:
+        return _NAN
+    return float(value)
+
+
+def _nan_to_none(value):
+    return None if value != value else value
+
+
+class _StringPool:
+    """站点编号、分类这类重复很多的值只存一份，列里存编号"""
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def encode(self, value) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.values.append(sys.intern(value) if type(value) is str else value)
+            self.codes[value] = code
+        return code
+
+    def decode(self, code):
+        return self.values[code]
+
+
+class TorrentBatch:
+    """
+    按列存放大量种子的容器：编号、大小、做种数、时间这些数值存在array里，站点编号和分类只存一份取值。
+    常驻内存的种子数量很大时比逐个保存TorrentInfo对象省很多内存，按下标取出时还原成CompactTorrentInfo
+    """
+    _pooled = ('site_id', 'cate_level1', 'cate_id')
+    _ints = ('id', 'upload_count', 'downloading_count', 'download_count', 'minimum_seed_time')
+    _floats = ('size_mb', 'download_volume_factor', 'minimum_ratio')
+    _times = ('publish_date', 'free_deadline')
+    _objects = ('name', 'subject', 'details_url', 'download_url', 'imdb_id', 'upload_volume_factor', 'poster_url')
+
+    def __init__(self, torrents: Iterable[TorrentInfo] = None):
+        self._pools = {name: _StringPool() for name in self._pooled}
+        self.columns = {}
+        for name in self._pooled:
+            self.columns[name] = array('I')
+        for name in self._ints:
+            self.columns[name] = array('q')
+        for name in self._floats:
+            self.columns[name] = array('d')
+        for name in self._times:
+            self.columns[name] = array('q')
+        for name in self._objects:
+            self.columns[name] = []
+        # 数值列存不了的值（int列的None、时间列里模版渲染出的空字符串等）单独按(下标, 列名)记下来
+        self._others = {}
+        if torrents:
+            self.extend(torrents)
+
+    def __len__(self):
+        return len(self.columns['id'])
+
+    def append(self, torrent: TorrentInfo):
+        """
+        :param torrent: TorrentInfo.build_by_parse_item的结果，或者CompactTorrentInfo
+        :return:
+        """
+        index = len(self)
+        columns = self.columns
+        for name in self._pooled:
+            columns[name].append(self._pools[name].encode(getattr(torrent, name, None)))
+        for name in self._ints:
+            value = getattr(torrent, name, None)
+            if not isinstance(value, int):
+                self._others[(index, name)] = value
+                value = 0
+            columns[name].append(value)
+        for name in self._floats:
+            columns[name].append(_float_or_nan(getattr(torrent, name, None)))
+        for name in self._times:
+            value = getattr(torrent, name, None)
+            if value is not None and value != '' and not isinstance(value, datetime.datetime):
+                self._others[(index, name)] = value
+            columns[name].append(_time_to_int(value))
+        for name in self._objects:
+            columns[name].append(getattr(torrent, name, None))
+
+    def extend(self, torrents: Iterable[TorrentInfo]):
+        for t in torrents:
+            self.append(t)
+
+    def column(self, name):
+        """
+        取一整列的值，数值列没有特殊值时直接返回array，可以不还原对象做排序、过滤；float列里的None为nan
+        :param name:
+        :return:
+        """
+        column = self.columns[name]
+        if name in self._pooled:
+            pool = self._pools[name]
+            return [pool.decode(code) for code in column]
+        if name in self._times:
+            column = [_int_to_time(v) for v in column]
+        others = [(index, value) for (index, n), value in self._others.items() if n == name]
+        if others:
+            column = list(column)
+            for index, value in others:
+                column[index] = value
+        return column
+
+    def __getitem__(self, index) -> CompactTorrentInfo:
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError('TorrentBatch下标越界')
+        columns = self.columns
+        values = {}
+        for name in self._pooled:
+            values[name] = self._pools[name].decode(columns[name][index])
+        for name in self._ints:
+            values[name] = columns[name][index]
+        for name in self._floats:
+            values[name] = _nan_to_none(columns[name][index])
+        for name in self._times:
+            values[name] = _int_to_time(columns[name][index])
+        if self._others:
+            for name in self._ints + self._times:
+                if (index, name) in self._others:
+                    values[name] = self._others[(index, name)]
+        for name in self._objects:
+            values[name] = columns[name][index]
+        return CompactTorrentInfo(**values)
+
+    def __iter__(self) -> Iterator[CompactTorrentInfo]:
+        for i in range(len(self)):
+            yield self[i]
@@ -1,37 +1,43 @@
-import asyncio
 import datetime
 import random
 import re
 import time
 
-import httpx
 from cacheout import Cache
 from httpx import Timeout
 from magnet2torrent import Magnet2Torrent
-from pyrate_limiter import Limiter, RequestRate, Duration
 from tenacity import retry, wait_fixed, stop_after_attempt, stop_after_delay, wait_exponential
 
 from fast_torrent_trackers.basetracker import BaseTracker, user_agent_rotator
 from fast_torrent_trackers.exceptions import RateLimitException
+from fast_torrent_trackers.metrics import TrackerMetrics, record_retry
 from fast_torrent_trackers.models import TrackerUserinfo, TorrentInfo, TorrentList, CateLevel1
+from fast_torrent_trackers.searchcache import cached_search
 
 token_cache = Cache(maxsize=32, ttl=800, default=None)
 
-search_limter = Limiter(RequestRate(1, 3 * Duration.SECOND))
-
 
 class Rarbg(BaseTracker):
     APP_ID = "m-bot"
     ENDPOINT = 'http://torrentapi.org/pubapi_v2.php'
+    # torrentapi没有翻页参数，一次最多返回100个结果
+    first_page = None
 
-    def __init__(self, site_config, proxies=None):
+    def __init__(self, site_config, proxies=None, http2=None, pool_limits=None, search_cache=None,
+                 metrics: TrackerMetrics = None):
         self.token = None
+        self.search_cache = search_cache
+        self.metrics = metrics
         self.site_config = site_config
         self.category_mappings = self._init_category_mappings(site_config.get('category_mappings'))
+        self._init_category_index()
+        # torrentapi要求2秒以上一次请求
+        self._init_rate_limiters({'search': {'rate': 1, 'per': 3}})
         if proxies:
             self.proxies = proxies
         else:
             self.proxies = None
+        self._init_http_options(http2, pool_limits)
 
     async def __do_get(self, url, params=None, timeout=None):
         if not timeout:
@@ -44,17 +50,15 @@ class Rarbg(BaseTracker):
         headers = {
             'user-agent': user_agent_rotator.get_random_user_agent()
         }
-        with search_limter.ratelimit('rarbg', delay=True):
-            async with httpx.AsyncClient(
-                    headers=headers,
-                    timeout=Timeout(timeout, connect=60, read=60),
-                    proxies=self.proxies,
-                    follow_redirects=True
-            ) as client:
-                r = await client.get(url, params=params)
-                return r
+        with self._timer('search_wait'):
+            await self.search_limiter.acquire()
+        with self._timer('request'):
+            r = await self.get_client().get(url, params=params, headers=headers,
+                                            timeout=Timeout(timeout, connect=60, read=60))
+        self.record_metric('bytes_received', len(r.content))
+        return r
 
-    @retry(wait=wait_fixed(3), stop=stop_after_attempt(3), reraise=True)
+    @retry(wait=wait_fixed(3), stop=stop_after_attempt(3), reraise=True, before_sleep=record_retry)
     async def _get_token(self):
         if token_cache.get('token'):
             return token_cache.get('token')
@@ -66,7 +70,8 @@ class Rarbg(BaseTracker):
         token_cache.set('token', token)
         return token
 
-    @retry(stop=stop_after_delay(300), wait=wait_exponential(multiplier=1, min=30, max=90), reraise=True)
+    @retry(stop=stop_after_delay(300), wait=wait_exponential(multiplier=1, min=30, max=90), reraise=True,
+           before_sleep=record_retry)
     async def download(self, url, filepath):
         async def fetch_that_torrent():
             m2t = Magnet2Torrent(url)
@@ -74,7 +79,8 @@ class Rarbg(BaseTracker):
             with open(filepath, 'wb') as file:
                 file.write(torrent_data)
 
-        await fetch_that_torrent()
+        with self._timer('download'):
+            await fetch_that_torrent()
 
     async def get_userinfo(self, refresh=False) -> TrackerUserinfo:
         user = TrackerUserinfo()
@@ -89,9 +95,23 @@ class Rarbg(BaseTracker):
         user.uploaded = 0
         return user
 
+    @cached_search
     async def search(self, keyword=None, imdb_id=None, cate_level1_list: list = None, free: bool = False,
                      page: int = None,
                      timeout=None) -> TorrentList:
+        try:
+            with self._timer('search'):
+                result = await self.__search__(keyword, imdb_id, timeout)
+        except Exception as e:
+            # 被限流时降低请求速率，成功后逐步恢复
+            self.search_limiter.feedback(e)
+            if isinstance(e, RateLimitException):
+                self.record_metric('rate_limited')
+            raise
+        self.search_limiter.feedback(None)
+        return result
+
+    async def __search__(self, keyword=None, imdb_id=None, timeout=None) -> TorrentList:
         params = {
             'format': 'json_extended',
             'limit': 100
@@ -112,7 +132,6 @@ class Rarbg(BaseTracker):
         params['token'] = await self._get_token()
         r = await self.__do_get(self.ENDPOINT, params, timeout=timeout)
         if r.status_code != 200:
-            await asyncio.sleep(5)
             raise RateLimitException()
         data: dict = r.json()
         if data.get('error_code'):
@@ -121,11 +140,16 @@ class Rarbg(BaseTracker):
                 return []
             raise RateLimitException()
         if data.get('rate_limit'):
-            await asyncio.wait(2)
             raise RateLimitException()
         torrents = data.get('torrent_results')
         if not torrents:
             return []
+        with self._timer('parse'):
+            result = self.__parse_torrents__(torrents)
+        self.record_metric('rows_parsed', len(result))
+        return result
+
+    def __parse_torrents__(self, torrents) -> TorrentList:
         result: TorrentList = []
         for t in torrents:
             try:
@@ -148,14 +172,10 @@ class Rarbg(BaseTracker):
                 torrent.minimum_ratio = 0
                 utctime = time.strptime(t.get('pubdate'), '%Y-%m-%d %H:%M:%S +0000')
                 torrent.publish_date = datetime.datetime.fromtimestamp(time.mktime(utctime))
-                find = False
-                for c in self.category_mappings:
-                    if c.get('cate_level2') == t.get('category'):
-                        torrent.cate_level1 = CateLevel1.get_type(c.get('cate_level1'))
-                        torrent.cate_id = c.get('id')
-                        find = True
-                        break
-                if not find:
+                if t.get('category') in self.category_index.id_by_level2:
+                    torrent.cate_level1 = self.category_index.level1_by_level2[t.get('category')]
+                    torrent.cate_id = self.category_index.id_by_level2[t.get('category')]
+                else:
                     torrent.cate_id = t.get('category')
                     if torrent.cate_id.startswith('Movies'):
                         torrent.cate_level1 = CateLevel1.Movie
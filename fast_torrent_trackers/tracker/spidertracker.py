@@ -1,48 +1,97 @@
 import asyncio
+import functools
 import logging
-import random
+import os
 import re
+import time
 from http.cookies import SimpleCookie
+from typing import Iterator, List
 
 import aiofiles
 import httpx
-from bs4 import BeautifulSoup
 from httpx import Timeout
 from jinja2 import Template
-from pyrate_limiter import Limiter, RequestRate, Duration
 from tenacity import retry, stop_after_delay, wait_exponential
 
 from fast_torrent_trackers.basetracker import BaseTracker, user_agent_rotator
 from fast_torrent_trackers.exceptions import LoginRequired, RequestOverloadException, RateLimitException
-from fast_torrent_trackers.htmlparser import HtmlParser
-from fast_torrent_trackers.resultfilters import result_filters
-from fast_torrent_trackers.models import TrackerUserinfo, TorrentList, TorrentInfo
-from fast_torrent_trackers.utils import trans_size_str_to_mb
+from fast_torrent_trackers.metrics import TrackerMetrics, record_retry
+from fast_torrent_trackers.htmlparser import HtmlParser, ParsedPage, get_backend
+from fast_torrent_trackers.resultfilters import create_result_enricher
+from fast_torrent_trackers.models import CategoryIndex, TrackerUserinfo, TorrentList, TorrentInfo
+from fast_torrent_trackers.normalize import Normalizer
+from fast_torrent_trackers.parsepool import parse_search_page, parse_userinfo_page
+from fast_torrent_trackers.queryplanner import match_any_keyword
+from fast_torrent_trackers.searchcache import cached_search
+from fast_torrent_trackers.utils import trans_size_str_to_mb, DictWrapper
+from fast_torrent_trackers.watermark import Watermark
 
 _LOGGER = logging.getLogger(__name__)
-download_limiter = Limiter(RequestRate(1, 15 * Duration.SECOND))
+# 下载种子时每次写入文件的字节数
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+_STREAM_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding'}
 
 
 class TrackerParser:
-    def __init__(self, site_config):
+    def __init__(self, site_config, backend=None, category_index: CategoryIndex = None):
+        """
+        :param site_config:
+        :param backend: 解析后端，bs4或lxml，为空时取站点配置的parser_backend，默认bs4
+        :param category_index: 站点的分类索引，为空时取CategoryIndex.for_config(site_config)
+        """
         self.site_config = site_config
+        if category_index is None:
+            category_index = CategoryIndex.for_config(site_config)
+        self.category_index = category_index
+        self.backend = get_backend(backend if backend else site_config.get('parser_backend'))
+        # 站点的字段规则只编译一次，后续每一行直接执行解析计划
+        self.userinfo_plan = None
+        self.torrents_plan = None
+        if site_config.get('userinfo') and site_config.get('userinfo').get('fields'):
+            self.userinfo_plan = HtmlParser.compile(site_config.get('userinfo').get('fields'), self.backend)
+        if site_config.get('torrents') and site_config.get('torrents').get('fields'):
+            self.torrents_plan = HtmlParser.compile(site_config.get('torrents').get('fields'), self.backend)
+
+    def parse_page(self, html_text, cache_userinfo=True) -> ParsedPage:
+        """
+        :param html_text:
+        :param cache_userinfo: 是否把解析出的用户信息存在页面上
+        :return: 可以同时传给test_login、parse_userinfo、parse_torrents的页面，文档树只解析一次
+        """
+        return ParsedPage(html_text, self.backend, cache_userinfo)
+
+    def __get_page__(self, html_text) -> ParsedPage:
+        if isinstance(html_text, ParsedPage):
+            return html_text
+        return self.parse_page(html_text)
 
     def test_login(self, html_text):
-        if not html_text:
+        """
+        :param html_text: 页面文本或者ParsedPage
+        :return:
+        """
+        page = self.__get_page__(html_text)
+        if not page.text:
             return False
         login_config = self.site_config.get('login')
         if not login_config:
             return
         test = login_config.get('test')
-        soup = BeautifulSoup(html_text, 'lxml')
-        tag = soup.select_one(test.get('selector'))
-        if tag:
+        tag = self.backend.select_one(page.document, test.get('selector'))
+        if tag is not None:
             return True
         else:
             return False
 
     def parse_userinfo(self, html_text):
-        if not self.test_login(html_text):
+        """
+        :param html_text: 页面文本或者ParsedPage
+        :return:
+        """
+        page = self.__get_page__(html_text)
+        if page.userinfo is not None:
+            return page.userinfo
+        if not self.test_login(page):
             raise LoginRequired(self.site_config.get('id'), self.site_config.get('name'),
                                 f'{self.site_config.get("name")}登陆失败！')
         user_rule = self.site_config.get('userinfo')
@@ -51,28 +100,181 @@ class TrackerParser:
         field_rule = user_rule.get('fields')
         if not field_rule:
             return
-        soup = BeautifulSoup(html_text, 'lxml')
-        item_tag = soup.select_one(user_rule.get('item')['selector'])
-        result = HtmlParser.parse_item_fields(item_tag, field_rule)
+        item_tag = self.backend.select_one(page.document, user_rule.get('item')['selector'])
+        result = HtmlParser.parse_item_fields(item_tag, self.userinfo_plan or field_rule, backend=self.backend)
+        if page.cache_userinfo:
+            page.userinfo = result
         return result
 
-    def parse_torrents(self, html_text, context=None) -> TorrentList:
+    def parse_torrents(self, html_text, context=None, watermark: Watermark = None,
+                       seen_streak_to_stop: int = 10) -> TorrentList:
+        """
+        :param html_text: 页面文本或者ParsedPage
+        :param context:
+        :param watermark: 增量拉取时的水位线，拉取过的种子不返回
+        :param seen_streak_to_stop: 连续遇到多少个拉取过的种子就不再往下解析；置顶种子一般是旧种子，不能遇到第一个就停
+        :return:
+        """
+        return list(self.iter_torrents(html_text, context, watermark=watermark,
+                                       seen_streak_to_stop=seen_streak_to_stop))
+
+    def iter_torrents(self, html_text, context=None, limit: int = None, predicate=None, watermark: Watermark = None,
+                      seen_streak_to_stop: int = 10) -> Iterator[TorrentInfo]:
+        """
+        逐行解析种子，调用方拿够了就不再解析后面的行
+        :param html_text: 页面文本或者ParsedPage
+        :param context:
+        :param limit: 最多返回多少个种子
+        :param predicate: 过滤条件，RowPredicate会先只解析条件用到的字段，不满足的行不再解析其他字段；
+                          也可以是接收TorrentInfo的普通函数，解析完整行后再判断
+        :param watermark: 增量拉取时的水位线，拉取过的种子不返回
+        :param seen_streak_to_stop:
+        :return:
+        """
         torrents_rule = self.site_config.get('torrents')
         if not torrents_rule:
-            return []
+            return
         list_rule = torrents_rule.get('list')
         fields_rule = torrents_rule.get('fields')
         if not fields_rule:
-            return []
-        soup = BeautifulSoup(html_text, 'lxml')
-        rows = soup.select(list_rule['selector'])
+            return
+        if limit is not None and limit <= 0:
+            return
+        rows = self.backend.select(self.__get_page__(html_text).document, list_rule['selector'])
         if not rows:
-            return []
-        result: TorrentList = []
+            return
+        state = _TorrentRows(self, context, limit, predicate, watermark, seen_streak_to_stop)
         for tag in rows:
-            item = HtmlParser.parse_item_fields(tag, fields_rule, context=context)
-            result.append(TorrentInfo.build_by_parse_item(self.site_config, item))
-        return result
+            torrent = state.process(tag)
+            if torrent is not None:
+                yield torrent
+            if state.done:
+                return
+
+    def stream_torrents(self, encoding=None, context=None, limit: int = None, predicate=None,
+                        watermark: Watermark = None, seen_streak_to_stop: int = 10) -> 'TorrentStream':
+        """
+        边接收搜索结果页边解析种子，参数同iter_torrents，只支持lxml后端
+        :param encoding: 页面编码，为空时按utf-8
+        :return:
+        """
+        if not hasattr(self.backend, 'stream_document'):
+            raise ValueError(f'{self.backend.name}解析后端不支持流式解析')
+        torrents_rule = self.site_config.get('torrents') or {}
+        selector = (torrents_rule.get('list') or {}).get('selector')
+        if not selector or not torrents_rule.get('fields'):
+            raise ValueError(f'{self.site_config.get("name")}没有配置种子列表规则')
+        document = self.backend.stream_document(selector, encoding)
+        return TorrentStream(document, _TorrentRows(self, context, limit, predicate, watermark, seen_streak_to_stop))
+
+    @staticmethod
+    def __parse_row_id__(id_field, tag, context=None):
+        try:
+            return DictWrapper({'id': id_field.parse(tag, {}, context)}).get_int('id', 0)
+        except Exception:
+            return 0
+
+
+class _TorrentRows:
+    """逐行解析种子时的状态：水位线连续命中数、已返回数量，整页解析和流式解析共用"""
+
+    def __init__(self, parser: TrackerParser, context=None, limit: int = None, predicate=None,
+                 watermark: Watermark = None, seen_streak_to_stop: int = 10):
+        self.parser = parser
+        self.context = context
+        self.limit = limit
+        self.predicate = predicate
+        self.watermark = watermark
+        self.seen_streak_to_stop = seen_streak_to_stop
+        self.plan = parser.torrents_plan or HtmlParser.compile(parser.site_config['torrents']['fields'],
+                                                               parser.backend)
+        self.id_field = self.plan.get_field('id') if watermark is not None else None
+        self.predicate_fields = None
+        if predicate is not None and getattr(predicate, 'fields', None):
+            self.predicate_fields = self.plan.resolve(predicate.fields)
+        # 整页共用一个，尺寸、做种数这类重复的原始值只转换一次
+        self.normalizer = Normalizer()
+        self.seen_streak = 0
+        self.count = 0
+        # 连续遇到拉取过的种子或者拿够了数量，后面的行不用再解析
+        self.done = limit is not None and limit <= 0
+
+    def build(self, item) -> TorrentInfo:
+        return TorrentInfo.build_by_parse_item(self.parser.site_config, item, self.normalizer,
+                                               self.parser.category_index)
+
+    def process(self, tag):
+        """
+        解析一行
+        :param tag:
+        :return: 需要返回的种子，拉取过或者不满足过滤条件时返回None
+        """
+        if self.done:
+            return None
+        context = self.context
+        torrent = None
+        seen = False
+        if self.id_field is not None:
+            # 先只解析种子编号，拉取过的行不用再解析其他字段
+            seen = self.watermark.is_seen(TrackerParser.__parse_row_id__(self.id_field, tag, context))
+        if not seen:
+            if self.predicate_fields:
+                values = self.plan.parse(tag, context, only=self.predicate_fields)
+                if not self.predicate(self.build(values)):
+                    return None
+                item = self.plan.parse(tag, context, values=values, skip=self.predicate_fields)
+            else:
+                item = self.plan.parse(tag, context)
+            torrent = self.build(item)
+            seen = self.watermark is not None and self.watermark.is_seen(torrent.id, torrent.publish_date)
+        if seen:
+            self.seen_streak += 1
+            if self.seen_streak >= self.seen_streak_to_stop:
+                self.done = True
+            return None
+        self.seen_streak = 0
+        if self.predicate is not None and not self.predicate_fields and not self.predicate(torrent):
+            return None
+        self.count += 1
+        if self.limit is not None and self.count >= self.limit:
+            self.done = True
+        return torrent
+
+
+class TorrentStream:
+    """
+    流式解析一页种子，按块喂入响应内容，每次返回新解析出的种子；处理过的行随即释放
+    """
+
+    def __init__(self, document, rows: _TorrentRows):
+        self.document = document
+        self.rows = rows
+
+    @property
+    def done(self):
+        """为True时不需要再接收后面的内容"""
+        return self.rows.done
+
+    @property
+    def row_count(self):
+        return self.document.row_count
+
+    def feed(self, data: bytes) -> TorrentList:
+        return self.__process__(self.document.feed(data))
+
+    def close(self) -> TorrentList:
+        return self.__process__(self.document.close())
+
+    def __process__(self, tags) -> TorrentList:
+        torrents = []
+        for tag in tags:
+            if self.rows.done:
+                break
+            torrent = self.rows.process(tag)
+            self.document.release(tag)
+            if torrent is not None:
+                torrents.append(torrent)
+        return torrents
 
 
 class SpiderTracker(BaseTracker):
@@ -80,16 +282,36 @@ class SpiderTracker(BaseTracker):
         'user-agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/99.0.4844.51 Safari/537.36'}
     cookies = None
     last_search_text = None
+    last_search_page = None
     userinfo = None
+    result_enricher = None
 
     def __init__(self, site_config, cookie_str=None, request_timeout=10.0, download_timeout=180.0, proxies=None,
-                 user_agent=None):
+                 user_agent=None, http2=None, pool_limits=None, parallel_search=None, parser_backend=None,
+                 parse_executor=None, search_cache=None, stream_parse=None, metrics: TrackerMetrics = None):
+        # 复制一份，避免多个站点实例共用类属性上的请求头
+        self.headers = dict(self.headers)
         self.request_timeout = request_timeout
         self.download_timeout = download_timeout
         self.set_cookie(cookie_str)
         self.site_config = site_config
-        self.parser = TrackerParser(site_config)
         self.category_mappings = self._init_category_mappings(site_config.get('category_mappings'))
+        self._init_category_index()
+        self.parser = TrackerParser(site_config, parser_backend, self.category_index)
+        # 页面解析用的线程池或进程池，为空时在事件循环里直接解析
+        self.parse_executor = parse_executor
+        self.search_cache = search_cache
+        self.metrics = metrics
+        # 边接收搜索结果页边解析（只支持lxml后端），未指定时取站点配置的search.stream_parse
+        if stream_parse is None:
+            stream_parse = bool(site_config.get('search').get('stream_parse'))
+        self.stream_parse = stream_parse
+        if 'first_page' in site_config.get('search'):
+            self.first_page = site_config.get('search').get('first_page')
+        # 配置文件的查询模板用query.match_any切换成"或"搜索
+        self.keyword_or = bool(site_config.get('search').get('keyword_or'))
+        # 搜索结果的补充阶段，按search.result_filter创建，促销状态缓存、批量查询都在这个实例里
+        self.result_enricher = create_result_enricher(site_config.get('search').get('result_filter'))
         self.search_paths = self.__init_search_paths__(site_config.get('search').get('paths'), self.category_mappings)
         self.search_query = self.__init_search_query__(site_config.get('search').get('query'))
         if proxies:
@@ -100,6 +322,50 @@ class SpiderTracker(BaseTracker):
             self.headers['user-agent'] = user_agent
         else:
             self.headers['user-agent'] = user_agent_rotator.get_random_user_agent()
+        self._init_http_options(http2, pool_limits)
+        self.__init_parallel_search__(site_config.get('search').get('parallel'), parallel_search)
+
+    @classmethod
+    def from_config(cls, site_config, cookie=None, **options):
+        return super().from_config(site_config, cookie_str=cookie, **options)
+
+    def __init_parallel_search__(self, parallel_config, parallel_search=None):
+        """
+        多path并行搜索配置，未显式指定开关时，站点配置了search.parallel即开启；
+        同时初始化各类请求的限流器。搜索速率只在rate_limit.search里配置，search.parallel只管同时请求数
+        :param parallel_config: {max_concurrency: 同时请求数}
+        :param parallel_search:
+        :return:
+        """
+        if parallel_search is None:
+            parallel_search = bool(parallel_config)
+        if not isinstance(parallel_config, dict):
+            parallel_config = {}
+        if 'rate' in parallel_config or 'per' in parallel_config:
+            raise ValueError(f'{self.get_id()}的搜索速率请配置在rate_limit.search，search.parallel只支持max_concurrency')
+        self.parallel_search = parallel_search
+        self.search_max_concurrency = int(parallel_config.get('max_concurrency', 3))
+        if parallel_config or parallel_search:
+            # 没有配置rate_limit.search时每秒2次，允许同时请求的path一起发出
+            search_rate = {'rate': 2, 'per': 1, 'burst': self.search_max_concurrency}
+        else:
+            # 逐个path搜索时，相邻两次请求平均间隔4秒
+            search_rate = {'rate': 1, 'per': 4}
+        self._init_rate_limiters({
+            'search': search_rate,
+            'userinfo': {'rate': 1, 'per': 1},
+            'download': self.__default_download_rate__(),
+        })
+
+    def __default_download_rate__(self):
+        """
+        站点没有配置rate_limit.download时，按request_interval.download的平均间隔，都没有时15秒一个
+        :return:
+        """
+        interval = (self.site_config.get('request_interval') or {}).get('download')
+        if interval and interval.get('min') is not None and interval.get('max') is not None:
+            return {'rate': 1, 'per': (float(interval.get('min')) + float(interval.get('max'))) / 2}
+        return {'rate': 1, 'per': 15}
 
     def set_cookie(self, cookie_str: str):
         if not cookie_str:
@@ -109,6 +375,20 @@ class SpiderTracker(BaseTracker):
         for key, morsel in cookie.items():
             cookies[key] = morsel.value
         self.cookies = cookies
+        if self.client is not None and not self.client.is_closed:
+            self.client.cookies = cookies
+
+    def _create_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            headers=self.headers,
+            cookies=self.cookies,
+            http2=bool(self.http2),
+            limits=self.pool_limits,
+            timeout=Timeout(timeout=self.request_timeout),
+            proxies=self.proxies,
+            transport=self.transport,
+            follow_redirects=True
+        )
 
     def __render_querystring__(self, query):
         qs = ''
@@ -168,20 +448,28 @@ class SpiderTracker(BaseTracker):
             for k in r.cookies:
                 self.cookies[k] = r.cookies[k]
 
+    async def request(self, method, url, **kwargs) -> httpx.Response:
+        """
+        带上站点cookie发请求，响应里新的cookie会记下来；给结果补充阶段这类需要额外调用站点接口的代码用，不经过搜索限流
+        :param method:
+        :param url:
+        :param kwargs: httpx.AsyncClient.request的参数
+        :return:
+        """
+        client = self.get_client()
+        client.cookies = self.cookies
+        r = await client.request(method, url, **kwargs)
+        self.__update_cookie__(r)
+        return r
+
     async def handle_cf_check(self, res):
         if res.text.find('data-cf-settings') != -1 and res.text.find('rocket-loader') != -1:
             match_js_var = re.search(r'window.location=(.+);', res.text)
             if match_js_var:
                 check_uri = eval(match_js_var.group(1))
-                async with httpx.AsyncClient(
-                        headers=self.headers,
-                        cookies=self.cookies,
-                        follow_redirects=True,
-                        timeout=Timeout(timeout=self.request_timeout),
-                        proxies=self.proxies
-                ) as client:
-                    r = await client.get(self.get_domain() + check_uri)
-                    self.__update_cookie__(r)
+                with self._timer('cf_check'):
+                    r = await self.get_client().get(self.get_domain() + check_uri)
+                self.__update_cookie__(r)
                 return self._get_response_text(r)
         elif res.status_code == 503 and res.text.find('<title>Just a moment...</title>') != -1:
             logging.error(f'{self.get_name()}检测到CloudFlare 5秒盾，请浏览器访问跳过拿到新Cookie重新配置。')
@@ -190,20 +478,14 @@ class SpiderTracker(BaseTracker):
         self.__update_cookie__(res)
         return self._get_response_text(res)
 
-    @retry(stop=stop_after_delay(600), wait=wait_exponential(multiplier=1, min=30, max=120))
+    @retry(stop=stop_after_delay(600), wait=wait_exponential(multiplier=1, min=30, max=120), before_sleep=record_retry)
     async def get_userinfo_page_text(self):
         url = self.site_config.get('userinfo').get('path')
-        async with httpx.AsyncClient(
-                headers=self.headers,
-                cookies=self.cookies,
-                http2=False,
-                timeout=Timeout(timeout=self.request_timeout),
-                proxies=self.proxies,
-                follow_redirects=True
-        ) as client:
-            r = await client.get(url)
+        async with self._limit(self.userinfo_limiter, 'userinfo_wait'):
+            with self._timer('request'):
+                r = await self.get_client().get(url)
             text = await self.handle_cf_check(r)
-            return text
+        return text
 
     @staticmethod
     def trans_to_userinfo(result: dict):
@@ -236,20 +518,110 @@ class SpiderTracker(BaseTracker):
         return user
 
     async def get_userinfo(self, refresh=False) -> TrackerUserinfo:
-        if not refresh and self.last_search_text:
-            # 用上次搜索结果页内容做解析
-            text = self.last_search_text
+        if not refresh and self.last_search_page is not None:
+            # 用上次搜索结果页做解析，搜索时已经解析过用户信息的直接复用
+            page = self.last_search_page
+        else:
+            page = self.parser.parse_page(await self.get_userinfo_page_text())
+        if page.userinfo is not None:
+            res = page.userinfo
+        elif self.parse_executor is None:
+            res = self.parser.parse_userinfo(page)
+            page.release()
         else:
-            text = await self.get_userinfo_page_text()
-        res = self.parser.parse_userinfo(text)
+            res = await self.__run_in_executor__(parse_userinfo_page, page.text)
+            page.userinfo = res
         self.userinfo = res
         return self.trans_to_userinfo(res)
 
+    @cached_search
     async def search(self, keyword=None, imdb_id=None, cate_level1_list: list = None, free: bool = False,
                      page: int = None,
                      timeout=None) -> TorrentList:
+        with self._timer('search'):
+            return await self.__search__(keyword, imdb_id, cate_level1_list, free, page, timeout)
+
+    async def list_since(self, watermark: Watermark = None, cate_level1_list: list = None,
+                         timeout=None) -> TorrentList:
+        """
+        增量拉取最新种子列表，只返回水位线之后的新种子，解析到连续多个拉取过的种子时不再往下解析
+        :param watermark: 为空时返回整页
+        :param cate_level1_list:
+        :param timeout:
+        :return:
+        """
+        with self._timer('search'):
+            return await self.__search__(cate_level1_list=cate_level1_list, timeout=timeout, watermark=watermark)
+
+    async def search_any(self, keywords: List[str], cate_level1_list: list = None, free: bool = False,
+                         timeout=None) -> TorrentList:
+        """
+        站点支持"或"搜索时多个关键字只请求一次。站点按词匹配，结果里只保留种子名或标题包含某个完整关键字的种子，不走搜索结果缓存
+        :param keywords:
+        :param cate_level1_list:
+        :param free:
+        :param timeout:
+        :return:
+        """
+        if not self.keyword_or or len(keywords) < 2:
+            return await super().search_any(keywords, cate_level1_list, free, timeout)
+        with self._timer('search'):
+            torrents = await self.__search__(' '.join(keywords), None, cate_level1_list, free, None, timeout,
+                                             match_any=True)
+        return match_any_keyword(torrents, keywords)
+
+    async def __search__(self, keyword=None, imdb_id=None, cate_level1_list: list = None, free: bool = False,
+                         page: int = None, timeout=None, watermark: Watermark = None,
+                         match_any: bool = False) -> TorrentList:
         if not self.search_paths:
             return []
+        path_queries = self.__build_path_queries__(keyword, imdb_id, cate_level1_list, free, page, match_any)
+        if not path_queries:
+            # 配置文件的分类设置有问题或者真的不存在此分类
+            return
+        search_result: TorrentList = []
+        if not timeout:
+            timeout = self.request_timeout
+        if self.parallel_search and len(path_queries) > 1:
+            for torrents in await self.__search_paths_parallel__(path_queries, timeout, watermark):
+                if torrents:
+                    search_result += torrents
+            return search_result
+        for p, path_query in path_queries:
+            torrents = await self.__search_path__(p, path_query, timeout, watermark)
+            if torrents:
+                search_result += torrents
+        return search_result
+
+    async def iter_search(self, keyword=None, imdb_id=None, cate_level1_list: list = None, free: bool = False,
+                          page: int = None, timeout=None):
+        """
+        逐个path搜索并产出种子，不走搜索结果缓存。一个path的种子收完、退出限流器后才产出，
+        调用方处理得再慢也不会拖住限流反馈和负载过高时的暂停
+        :param keyword:
+        :param imdb_id:
+        :param cate_level1_list:
+        :param free:
+        :param page:
+        :param timeout:
+        :return:
+        """
+        if not self.search_paths:
+            return
+        path_queries = self.__build_path_queries__(keyword, imdb_id, cate_level1_list, free, page)
+        if not path_queries:
+            return
+        if not timeout:
+            timeout = self.request_timeout
+        for p, path_query in path_queries:
+            for torrent in await self.__search_path__(p, path_query, timeout) or []:
+                yield torrent
+
+    def __build_path_queries__(self, keyword=None, imdb_id=None, cate_level1_list: list = None, free: bool = False,
+                               page: int = None, match_any: bool = False):
+        """
+        :return: 要请求的(path, 查询参数)列表
+        """
         input_cate2_ids = set(self._get_cate_level2_ids(cate_level1_list))
         paths = []
         # 根据传入一级分类数据，查找真正要执行的搜索path，一级对应分类
@@ -265,9 +637,6 @@ class SpiderTracker(BaseTracker):
             else:
                 cpath['query_cates'] = cate_in
             paths.append(cpath)
-        if len(paths) == 0:
-            # 配置文件的分类设置有问题或者真的不存在此分类
-            return
         query = {}
         if keyword:
             query['keyword'] = keyword
@@ -279,93 +648,273 @@ class SpiderTracker(BaseTracker):
             query['cates'] = []
         if page:
             query['page'] = page
-        search_result: TorrentList = []
-        if not timeout:
-            timeout = self.request_timeout
-        for i, p in enumerate(paths):
+        if match_any:
+            query['match_any'] = True
+        path_queries = []
+        for p in paths:
             if p.get('query_cates'):
                 query['cates'] = self._trans_search_cate_id(p.get('query_cates'))
-            uri = p.get('path')
-            qs = self.__render_querystring__(query)
-            headers = self.headers
-            headers['Referer'] = f'{self.get_domain()}{uri}'
-            async with httpx.AsyncClient(
-                    headers=headers,
-                    cookies=self.cookies,
-                    timeout=Timeout(timeout, connect=60, read=60),
-                    proxies=self.proxies,
-                    follow_redirects=True
-            ) as client:
-                if p.get('method') == 'get':
-                    url = f'{self.get_domain()}{uri}?{qs}'
-                    r = await client.get(url)
-                else:
-                    url = f'{self.get_domain()}{uri}'
-                    r = await client.post(url, data=qs)
-                text = await self.handle_cf_check(r)
-                if not text:
-                    continue
-                if text.find('负载过高，120秒后自动刷新') != -1:
-                    raise RequestOverloadException('负载过高，120秒后自动刷新', self.get_id(), self.get_name(), 120)
-                self.last_search_text = text
+            path_queries.append((p, dict(query)))
+        return path_queries
+
+    async def __search_path__(self, p, query, timeout, watermark: Watermark = None) -> TorrentList:
+        text, torrents = await self.__fetch_search_path__(p, query, timeout, watermark)
+        return await self.__enrich_results__(text, torrents)
+
+    async def __fetch_search_path__(self, p, query, timeout, watermark: Watermark = None):
+        """
+        :return: (页面文本, 种子列表)，流式解析时不保留页面文本
+        """
+        # 每个path请求前按站点搜索限流取令牌，遇到限流、负载过高时自动降速
+        async with self._limit(self.search_limiter, 'search_wait'):
+            if self.__can_stream_parse__():
+                return None, [t async for t in self.__stream_search_path__(p, query, timeout, watermark)]
+            return await self.__request_search_path__(p, query, timeout, watermark)
+
+    async def __enrich_results__(self, text, torrents) -> TorrentList:
+        # 在搜索限流器、并发数之外补充字段，补充阶段的请求不占搜索令牌，也不计入限流反馈
+        if self.result_enricher is not None and torrents:
+            with self._timer('result_filter'):
+                await self.result_enricher.enrich(self, text, torrents)
+        return torrents
+
+    async def __send_search_request__(self, p, query, timeout, stream=False) -> httpx.Response:
+        uri = p.get('path')
+        qs = self.__render_querystring__(query)
+        headers = {'Referer': f'{self.get_domain()}{uri}'}
+        client = self.get_client()
+        request_timeout = Timeout(timeout, connect=60, read=60)
+        if p.get('method') == 'get':
+            request = client.build_request('GET', f'{self.get_domain()}{uri}?{qs}', headers=headers,
+                                           timeout=request_timeout)
+        else:
+            request = client.build_request('POST', f'{self.get_domain()}{uri}', data=qs, headers=headers,
+                                           timeout=request_timeout)
+        with self._timer('request'):
+            return await client.send(request, stream=stream)
+
+    async def __request_search_path__(self, p, query, timeout, watermark: Watermark = None):
+        r = await self.__send_search_request__(p, query, timeout)
+        return await self.__handle_search_response__(r, watermark)
+
+    async def __handle_search_response__(self, r: httpx.Response, watermark: Watermark = None):
+        """
+        :return: (页面文本, 种子列表)
+        """
+        text = await self.handle_cf_check(r)
+        if not text:
+            return text, []
+        self.__check_limit__(text, '搜索频率过高')
+        if text.find('负载过高，120秒后自动刷新') != -1:
+            self.record_metric('overloaded')
+            raise RequestOverloadException('负载过高，120秒后自动刷新', self.get_id(), self.get_name(), 120)
+        self.last_search_text = text
+        page = self.parser.parse_page(text)
+        self.last_search_page = page
+        torrents = await self.__parse_search_page__(page, watermark)
+        return text, torrents
+
+    def __can_stream_parse__(self):
+        # 种子字段模版会用到用户信息，结果过滤需要整页文本，这两种情况还是等整页收完再解析
+        return self.stream_parse and self.parse_executor is None and bool(self.userinfo) \
+            and hasattr(self.parser.backend, 'stream_document') \
+            and self.result_enricher is None
+
+    async def __stream_search_path__(self, p, query, timeout, watermark: Watermark = None):
+        """
+        边接收搜索结果页边解析，每收到一块内容就产出其中已经完整的种子，不保留整页文本；
+        页面里没有种子行时（限流、负载过高、CloudFlare这类提示页面），收完后按整页走原来的检查
+        """
+        r = await self.__send_search_request__(p, query, timeout, stream=True)
+        try:
+            if r.status_code != 200 or r.headers.get('content-type', '').find('text/html') == -1:
+                await r.aread()
+                _, torrents = await self.__handle_search_response__(r, watermark)
+                for torrent in torrents:
+                    yield torrent
+                return
+            self.__update_cookie__(r)
+            stream = self.parser.stream_torrents(self.get_encoding(), context={'userinfo': self.userinfo},
+                                                 watermark=watermark)
+            head = []
+            # 解析和接收交替进行，解析耗时按每次feed累加，收完后记一次
+            parse_secs = 0.0
+            received = 0
+            rows = 0
+            fallback = False
+            try:
+                async for chunk in r.aiter_bytes():
+                    received += len(chunk)
+                    if head is not None:
+                        head.append(chunk)
+                    start = time.perf_counter()
+                    torrents = stream.feed(chunk)
+                    parse_secs += time.perf_counter() - start
+                    rows += len(torrents)
+                    for torrent in torrents:
+                        yield torrent
+                    if head is not None and stream.row_count:
+                        head = None
+                    if stream.done:
+                        return
+                start = time.perf_counter()
+                torrents = stream.close()
+                parse_secs += time.perf_counter() - start
+                rows += len(torrents)
+                fallback = head is not None and not stream.row_count
+                for torrent in torrents:
+                    yield torrent
+            finally:
+                # 回退到整页解析时，由整页解析那次记录接收字节、解析行数和耗时，这里不重复记
+                if not fallback:
+                    self._observe('parse', parse_secs)
+                    self.record_metric('bytes_received', received)
+                    self.record_metric('rows_parsed', rows)
+            if fallback:
+                # aiter_bytes已经解压过，去掉压缩相关的响应头
+                headers = [(k, v) for k, v in r.headers.multi_items() if k not in _STREAM_HEADERS]
+                page = httpx.Response(r.status_code, headers=headers, content=b''.join(head), request=r.request)
+                _, torrents = await self.__handle_search_response__(page, watermark)
+                for torrent in torrents:
+                    yield torrent
+        finally:
+            await r.aclose()
+
+    async def __run_in_executor__(self, parse_func, *args):
+        """
+        把解析交给parse_executor（线程池或进程池），避免大页面解析卡住事件循环里其他站点的请求
+        :param parse_func: parsepool里的解析函数，参数和返回值都可以pickle
+        :param args:
+        :return:
+        """
+        loop = asyncio.get_running_loop()
+        func = functools.partial(parse_func, self.site_config, *args, backend=self.parser.backend.name)
+        return await loop.run_in_executor(self.parse_executor, func)
+
+    async def __parse_search_page__(self, page: ParsedPage, watermark: Watermark = None) -> TorrentList:
+        """
+        登录检查、用户信息、种子列表共用一棵文档树，解析完后释放，只保留页面文本和用户信息
+        :param page:
+        :param watermark:
+        :return:
+        """
+        with self._timer('parse'):
+            if self.parse_executor is None:
+                try:
+                    if not self.userinfo:
+                        self.userinfo = self.parser.parse_userinfo(page)
+                    torrents = self.parser.parse_torrents(page, context={'userinfo': self.userinfo},
+                                                          watermark=watermark)
+                finally:
+                    page.release()
+            else:
+                userinfo, torrents = await self.__run_in_executor__(parse_search_page, page.text, self.userinfo,
+                                                                    watermark)
                 if not self.userinfo:
-                    self.userinfo = self.parser.parse_userinfo(text)
-                torrents = self.parser.parse_torrents(text, context={'userinfo': self.userinfo})
-                if self.site_config.get('search').get('result_filter'):
-                    client.cookies = self.cookies
-                    r = await result_filters[self.site_config.get('search').get('result_filter')](client, text,
-                                                                                                  torrents)
-                    self.__update_cookie__(r)
-                if torrents:
-                    search_result += torrents
-            if i + 1 < len(paths):
-                # 多页面搜索随机延迟
-                await asyncio.sleep(random.randint(3, 5))
-        return search_result
+                    page.userinfo = userinfo
+                self.userinfo = userinfo
+        self.record_metric('rows_parsed', len(torrents))
+        return torrents
+
+    async def __search_paths_parallel__(self, path_queries, timeout, watermark: Watermark = None):
+        """
+        多个搜索path同时请求，受站点并发数和请求频率限制，结果按path顺序返回
+        :param path_queries:
+        :param timeout:
+        :param watermark:
+        :return:
+        """
+        semaphore = asyncio.Semaphore(self.search_max_concurrency)
+
+        async def search_path(p, query):
+            async with semaphore:
+                text, torrents = await self.__fetch_search_path__(p, query, timeout, watermark)
+            return await self.__enrich_results__(text, torrents)
+
+        tasks = [asyncio.ensure_future(search_path(p, q)) for p, q in path_queries]
+        try:
+            return await asyncio.gather(*tasks)
+        finally:
+            # 任意一个path出错，其他还没完成的path没必要继续请求
+            for t in tasks:
+                if not t.done():
+                    t.cancel()
 
     def __check_limit__(self, text, err_msg):
         if not text:
             return
         if text.find('请求次数过多') != -1:
+            self.record_metric('rate_limited')
             raise RateLimitException(f'{self.get_name()}{err_msg}')
 
-    @retry(stop=stop_after_delay(300), wait=wait_exponential(multiplier=1, min=30, max=120), reraise=True)
-    async def download(self, url, filepath):
-        async with download_limiter.ratelimit(self.get_id(), delay=True):
-            async with httpx.AsyncClient(
-                    headers=self.headers,
-                    cookies=self.cookies,
-                    timeout=Timeout(timeout=self.download_timeout),
-                    proxies=self.proxies,
-                    follow_redirects=True
-            ) as client:
-                if self.get_download_method() == 'POST':
-                    if self.get_download_content_type():
-                        headers = self.headers
-                        headers['content-type'] = self.get_download_content_type()
-                        r = await client.post(url, data=self.get_download_args(), headers=headers)
-                    else:
-                        r = await client.post(url, data=self.get_download_args())
-                else:
-                    r = await client.get(url)
-                if r.status_code == 404:
-                    _LOGGER.error(f'Not found torrent: {url}')
-                    return
-                if 'content-type' in r.headers and r.headers['content-type'].find('text/html') != -1:
-                    if r.text.find(
-                            '下载提示') != -1 or r.text.find('下載輔助說明') != -1:
-                        match_id = re.search(r'name="id"\s+value="(\d+)"', r.text)
-                        if match_id:
-                            r = await client.post(f'{self.get_domain()}downloadnotice.php',
-                                                  data={'id': match_id.group(1), 'type': 'ratio'})
+    def __build_download_request__(self, client, url, timeout):
+        if self.get_download_method() == 'POST':
+            if self.get_download_content_type():
+                headers = {'content-type': self.get_download_content_type()}
+                return client.build_request('POST', url, data=self.get_download_args(), headers=headers,
+                                            timeout=timeout)
+            return client.build_request('POST', url, data=self.get_download_args(), timeout=timeout)
+        return client.build_request('GET', url, timeout=timeout)
+
+    @retry(stop=stop_after_delay(300), wait=wait_exponential(multiplier=1, min=30, max=120), reraise=True,
+           before_sleep=record_retry)
+    async def download(self, url, filepath) -> bool:
+        """
+        下载种子，响应内容按块写入文件，不在内存里保留整个种子；先写入临时文件，下载完整后才替换成filepath
+        :param url:
+        :param filepath:
+        :return: 是否保存了种子，种子不存在（404）时返回False
+        """
+        async with self._limit(self.download_limiter, 'download_wait'):
+            with self._timer('download'):
+                client = self.get_client()
+                download_timeout = Timeout(timeout=self.download_timeout)
+                r = await client.send(self.__build_download_request__(client, url, download_timeout), stream=True)
+                try:
+                    if r.status_code == 404:
+                        _LOGGER.error(f'Not found torrent: {url}')
+                        return False
+                    if 'content-type' in r.headers and r.headers['content-type'].find('text/html') != -1:
+                        await r.aread()
+                        if r.text.find(
+                                '下载提示') != -1 or r.text.find('下載輔助說明') != -1:
+                            match_id = re.search(r'name="id"\s+value="(\d+)"', r.text)
+                            if match_id:
+                                await r.aclose()
+                                request = client.build_request('POST', f'{self.get_domain()}downloadnotice.php',
+                                                               data={'id': match_id.group(1), 'type': 'ratio'},
+                                                               timeout=download_timeout)
+                                r = await client.send(request, stream=True)
+                            else:
+                                raise RuntimeError(
+                                    '%s下载种子需要页面确认，先手动打开浏览器下载一次，并重新换Cookie！' % self.get_name())
                         else:
-                            raise RuntimeError('%s下载种子需要页面确认，先手动打开浏览器下载一次，并重新换Cookie！' % self.get_name())
-                    else:
-                        self.__check_limit__(r.text, '下载频率过高：%s' % url)
-                        logging.error(f'下载种子错误：%s' % url)
-                        logging.error('%s' % r.text)
-                        raise RuntimeError(f'{self.get_name()}下载出错')
-                if r.status_code == 404:
-                    return
-                async with aiofiles.open(filepath, 'wb') as file:
-                    await file.write(r.content)
+                            self.__check_limit__(r.text, '下载频率过高：%s' % url)
+                            logging.error(f'下载种子错误：%s' % url)
+                            logging.error('%s' % r.text)
+                            raise RuntimeError(f'{self.get_name()}下载出错')
+                    if r.status_code == 404:
+                        return False
+                    self.record_metric('bytes_received', await self.__write_stream__(r, filepath))
+                    return True
+                finally:
+                    await r.aclose()
+
+    @staticmethod
+    async def __write_stream__(r: httpx.Response, filepath) -> int:
+        """
+        :return: 写入的字节数
+        """
+        tmp_path = f'{filepath}.part'
+        received = 0
+        try:
+            async with aiofiles.open(tmp_path, 'wb') as file:
+                async for chunk in r.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                    await file.write(chunk)
+                    received += len(chunk)
+            os.replace(tmp_path, filepath)
+            return received
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
@@ -1,18 +1,68 @@
-from fast_torrent_trackers.basetracker import BaseTracker
-from fast_torrent_trackers.tracker.rarbg import Rarbg
-from fast_torrent_trackers.tracker.spidertracker import SpiderTracker
+import importlib
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from fast_torrent_trackers.basetracker import BaseTracker
+
+# 站点配置parser的取值到站点实现类的注册表，构建站点时才导入对应模块，只用NexusPHP站点时不会导入Rarbg的依赖
+_TRACKER_CLASSES = {
+    'NexusPHP': 'fast_torrent_trackers.tracker.spidertracker:SpiderTracker',
+    'SpiderTracker': 'fast_torrent_trackers.tracker.spidertracker:SpiderTracker',
+    'RARBG': 'fast_torrent_trackers.tracker.rarbg:Rarbg',
+}
+_loaded_classes = {}
 
 
 class TrackerBuilder:
     @staticmethod
-    def build(site_config, cookie=None, proxies=None, user_agent=None) -> BaseTracker:
+    def register(parser, target):
+        """
+        注册站点实现类
+        :param parser: 站点配置里parser的取值
+        :param target: 类本身，或者"模块路径:类名"，用到时才导入
+        :return:
+        """
+        _TRACKER_CLASSES[parser] = target
+        _loaded_classes.pop(parser, None)
+
+    @staticmethod
+    def get_tracker_class(parser):
+        """
+        :param parser: 站点配置里parser的取值
+        :return: 站点实现类，未注册时返回None
+        """
+        tracker_class = _loaded_classes.get(parser)
+        if tracker_class is not None:
+            return tracker_class
+        target = _TRACKER_CLASSES.get(parser)
+        if target is None:
+            return
+        if isinstance(target, str):
+            module_name, class_name = target.split(':')
+            tracker_class = getattr(importlib.import_module(module_name), class_name)
+        else:
+            tracker_class = target
+        _loaded_classes[parser] = tracker_class
+        return tracker_class
+
+    @staticmethod
+    def build(site_config, cookie=None, proxies=None, user_agent=None, http2=None, pool_limits=None,
+              parser_backend=None, parse_executor=None, search_cache=None, metrics=None) -> 'BaseTracker':
+        """
+        由站点实现类的from_config创建站点，实现类不接受的参数不会传进去
+        :param metrics: TrackerMetrics，多个站点可以共用一个
+        :return:
+        """
         if not site_config:
             return
         if site_config.get('parser'):
             parser = site_config.get('parser')
         else:
             parser = 'SpiderTracker'
-        if parser == 'NexusPHP' or parser == 'SpiderTracker':
-            return SpiderTracker(site_config, cookie, proxies=proxies, user_agent=user_agent)
-        elif parser == 'RARBG':
-            return Rarbg(site_config, proxies=proxies)
+        tracker_class = TrackerBuilder.get_tracker_class(parser)
+        if tracker_class is None:
+            return
+        return tracker_class.from_config(site_config, cookie=cookie, proxies=proxies, user_agent=user_agent,
+                                         http2=http2, pool_limits=pool_limits, parser_backend=parser_backend,
+                                         parse_executor=parse_executor, search_cache=search_cache,
+                                         metrics=metrics)
@@ -1,22 +1,31 @@
 import asyncio
+import functools
 import logging
 import time
 
 from tenacity import stop_after_delay, wait_exponential, retry_if_not_exception_type, AsyncRetrying
 
+from fast_torrent_trackers.catalog import TorrentCatalog
 from fast_torrent_trackers.exceptions import LoginRequired, RequestOverloadException
+from fast_torrent_trackers.metrics import TrackerMetrics
 from fast_torrent_trackers.models import CateLevel1
+from fast_torrent_trackers.queryplanner import plan_queries
+from fast_torrent_trackers.watermark import WatermarkStore
 
 _LOGGER = logging.getLogger(__name__)
 
 
 class TrackerSearcher:
     run_time = None
-    interval_secs = 10
+    # 多个查询之间额外等待的秒数，设置后逐个查询；为空时并发查询，只按站点的搜索限流器控制请求间隔
+    interval_secs = None
 
     def __init__(self, tracker, query=None, cate_level1_list: list = None, network_error_retry=False,
-                 timeout: int = None, search_value_type=None):
+                 timeout: int = None, search_value_type=None, watermark_store: WatermarkStore = None,
+                 metrics: TrackerMetrics = None, catalog: TorrentCatalog = None):
         self.tracker = tracker
+        # 为空时用站点实例上的metrics
+        self.metrics = metrics if metrics is not None else getattr(tracker, 'metrics', None)
         self.query = []
         if query:
             for q in query:
@@ -26,6 +35,10 @@ class TrackerSearcher:
         self.network_error_retry = network_error_retry
         self.cate_level1_list = cate_level1_list
         self.timeout = timeout
+        # 指定后list只返回上次拉取之后的新种子
+        self.watermark_store = watermark_store
+        # 本地种子目录，拉取、搜索到的种子都存进去；站点最近拉取过时，关键字和imdb搜索直接查本地
+        self.catalog = catalog
 
     def get_run_time(self):
         return self.run_time
@@ -42,41 +55,108 @@ class TrackerSearcher:
     def get_query_str(self):
         return [i.get('value') for i in self.query]
 
+    def _observe(self, stage, seconds):
+        if self.metrics is not None:
+            self.metrics.observe(self.get_site_id(), stage, seconds)
+
+    def _on_attempt(self, attempt):
+        if self.metrics is not None and attempt.retry_state.attempt_number > 1:
+            self.metrics.incr(self.get_site_id(), 'retries')
+
+    async def _sleep(self, seconds):
+        start = time.perf_counter()
+        await asyncio.sleep(seconds)
+        self._observe('sleep', time.perf_counter() - start)
+
+    async def _run_catalog(self, func, *args, **kwargs):
+        # SQLite查询、写入会阻塞，放到线程池执行，不卡住其他站点的搜索
+        return await asyncio.get_running_loop().run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+    async def _is_catalog_fresh(self):
+        return self.catalog is not None and not await self._run_catalog(self.catalog.is_stale, self.get_site_id())
+
+    async def _can_search_catalog(self, q):
+        return q.get('key') in ('keyword', 'imdb_id') and q.get('value') and await self._is_catalog_fresh()
+
+    async def _search_live(self, step):
+        if len(step) > 1:
+            fetch = functools.partial(self.tracker.search_any, [q.get('value') for q in step],
+                                      cate_level1_list=self.cate_level1_list, timeout=self.timeout)
+        else:
+            fetch = functools.partial(self.tracker.search, **{step[0].get('key'): step[0].get('value')},
+                                      cate_level1_list=self.cate_level1_list, timeout=self.timeout)
+        if not self.network_error_retry:
+            return await fetch()
+        async for attempt in AsyncRetrying(retry=retry_if_not_exception_type(LoginRequired),
+                                           stop=stop_after_delay(600),
+                                           wait=wait_exponential(multiplier=1, min=5, max=120)):
+            self._on_attempt(attempt)
+            with attempt:
+                try:
+                    return await fetch()
+                except RequestOverloadException as e:
+                    await self._sleep(e.stop_secs)
+                    raise e
+                except Exception as e:
+                    _LOGGER.info(f"{self.get_site_name()}搜索{[q.get('value') for q in step]}出错，自动重试中，错误信息：{e}")
+                    raise e
+
+    async def _run_step(self, step):
+        """
+        执行查询计划的一步
+        :param step: 一个或多个合并成一次请求的查询
+        :return: (搜索结果, 是否在本地目录回答)；本地目录没有结果时照常请求站点
+        """
+        query_start = time.perf_counter()
+        r = None
+        if len(step) == 1 and await self._can_search_catalog(step[0]):
+            q = step[0]
+            r = await self._run_catalog(self.catalog.search, **{q.get('key'): q.get('value')},
+                                        site_ids=[self.get_site_id()], cate_level1_list=self.cate_level1_list,
+                                        limit=None)
+        local = bool(r)
+        if local:
+            if self.metrics is not None:
+                self.metrics.incr(self.get_site_id(), 'catalog_hits')
+        else:
+            r = await self._search_live(step)
+            if self.catalog is not None and r:
+                await self._run_catalog(self.catalog.add, r)
+        self._observe('query', time.perf_counter() - query_start)
+        return r, local
+
+    async def _plan(self):
+        if await self._is_catalog_fresh():
+            # 本地目录能回答时不需要合并请求
+            return [[q] for q in self.query]
+        return plan_queries(self.query, getattr(self.tracker, 'keyword_or', False))
+
     async def search(self):
         start = time.perf_counter()
         try:
+            steps = await self._plan()
+            if self.interval_secs:
+                results = []
+                for i, step in enumerate(steps):
+                    r, local = await self._run_step(step)
+                    results.append(r)
+                    if not local and i + 1 < len(steps):
+                        await self._sleep(self.interval_secs)
+            else:
+                # 并发执行，请求间隔由站点的搜索限流器控制；有一步出错时等其他步骤结束再抛出
+                results = []
+                for r in await asyncio.gather(*[self._run_step(step) for step in steps], return_exceptions=True):
+                    if isinstance(r, BaseException):
+                        raise r
+                    results.append(r[0])
             ids: set = set()
             res = []
-            for i, q in enumerate(self.query):
-                params = {
-                    q.get('key'): q.get('value'),
-                    'cate_level1_list': self.cate_level1_list,
-                    'timeout': self.timeout
-                }
-                if self.network_error_retry:
-                    async for attempt in AsyncRetrying(retry=retry_if_not_exception_type(LoginRequired),
-                                                       stop=stop_after_delay(600),
-                                                       wait=wait_exponential(multiplier=1, min=5, max=120)):
-                        with attempt:
-                            try:
-                                r = await self.tracker.search(**params)
-                            except RequestOverloadException as e:
-                                await asyncio.sleep(e.stop_secs)
-                                raise e
-                            except Exception as e:
-                                _LOGGER.info(f"{self.get_site_name()}搜索{q.get('value')}出错，自动重试中，错误信息：{e}")
-                                raise e
-                else:
-                    r = await self.tracker.search(**params)
-                if not r:
-                    continue
-                for t in r:
+            for r in results:
+                for t in r or []:
                     if t.id in ids:
                         continue
                     res.append(t)
                     ids.add(t.id)
-                if i + 1 < len(self.query):
-                    await asyncio.sleep(self.interval_secs)
             return {'code': 0, 'data': res}
         except LoginRequired as e:
             raise e
@@ -99,21 +179,33 @@ class TrackerSearcher:
                                            CateLevel1.AV,
                                            CateLevel1.Game,
                                            CateLevel1.Other], 'timeout': 10}
+            if self.watermark_store is not None:
+                # 增量模式，只拉取水位线之后的新种子
+                fetch = functools.partial(self.tracker.list_since, self.watermark_store.get(self.get_site_id()),
+                                          **params)
+            else:
+                fetch = functools.partial(self.tracker.search, **params)
             if self.network_error_retry:
                 async for attempt in AsyncRetrying(retry=retry_if_not_exception_type(LoginRequired),
                                                    stop=stop_after_delay(600),
                                                    wait=wait_exponential(multiplier=1, min=20, max=120)):
+                    self._on_attempt(attempt)
                     with attempt:
                         try:
-                            r = await self.tracker.search(**params)
+                            r = await fetch()
                         except RequestOverloadException as e:
-                            await asyncio.sleep(e.stop_secs)
+                            await self._sleep(e.stop_secs)
                             raise e
                         except Exception as e:
                             _LOGGER.info(f"{self.get_site_name()}获取最新种子列表出错，自动重试中，错误信息：{e}")
                             raise e
             else:
-                r = await self.tracker.search(**params)
+                r = await fetch()
+            self._observe('query', time.perf_counter() - start)
+            if self.watermark_store is not None and r:
+                self.watermark_store.update(self.get_site_id(), r)
+            if self.catalog is not None and r is not None:
+                await self._run_catalog(self.catalog.add_poll, self.get_site_id(), r)
             return r
         except LoginRequired as e:
             raise e
@@ -132,9 +132,9 @@ class TrackerTester:
             if not t.imdb_id.startswith('tt'):
                 raise RuntimeError('imdb_id的前缀由tt开始')
         self.check_str('torrent.cate_id', t.cate_id)
-        if t.cate_id not in [c['id'] for c in self.helper.category_mappings]:
+        if t.cate_id not in self.helper.category_index.level1_by_id:
             raise RuntimeError('cate_id的值未在站点描述配置中存在：%s' % t.cate_id)
-        if t.cate_level1.name not in [c['cate_level1'] for c in self.config.get('category_mappings')]:
+        if t.cate_level1.name not in self.helper.category_index.level1_names:
             raise RuntimeError('cate_level1的值未在站点描述配置中存在：%s' % t.cate_level1)
 
     def test_torrent_list(self, torrent_list):
@@ -0,0 +1,117 @@
+import datetime
+import json
+import logging
+import os
+import threading
+
+from fast_torrent_trackers.models import TorrentList
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class Watermark:
+    """
+    站点已经拉取过的最新种子位置，种子编号是站点自增的，编号不大于max_id的种子都是拉取过的
+    """
+
+    def __init__(self, max_id: int = 0, publish_date: datetime.datetime = None):
+        self.max_id = max_id if max_id else 0
+        self.publish_date = publish_date
+
+    def is_seen(self, torrent_id: int = None, publish_date: datetime.datetime = None) -> bool:
+        if torrent_id:
+            return torrent_id <= self.max_id
+        # 解析不到编号时，退回用发布时间判断
+        if publish_date and self.publish_date:
+            return publish_date <= self.publish_date
+        return False
+
+    def advance(self, torrents: TorrentList) -> 'Watermark':
+        """
+        用新拉取到的种子推进水位线
+        :param torrents:
+        :return: 新的水位线
+        """
+        max_id = self.max_id
+        publish_date = self.publish_date
+        for t in torrents or []:
+            if t.id and t.id > max_id:
+                max_id = t.id
+            if isinstance(t.publish_date, datetime.datetime) and (not publish_date or t.publish_date > publish_date):
+                publish_date = t.publish_date
+        return Watermark(max_id, publish_date)
+
+    def to_dict(self) -> dict:
+        return {
+            'max_id': self.max_id,
+            'publish_date': self.publish_date.isoformat() if self.publish_date else None
+        }
+
+    @staticmethod
+    def from_dict(data: dict):
+        if not data:
+            return None
+        publish_date = data.get('publish_date')
+        if publish_date:
+            publish_date = datetime.datetime.fromisoformat(publish_date)
+        return Watermark(data.get('max_id', 0), publish_date)
+
+    def __eq__(self, other):
+        return isinstance(other, Watermark) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f'Watermark(max_id={self.max_id}, publish_date={self.publish_date})'
+
+
+class WatermarkStore:
+    """
+    按站点保存水位线，指定path时保存到json文件，重启后从上次的位置继续拉取
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self.watermarks = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except Exception as e:
+            _LOGGER.error(f'读取水位线文件{self.path}失败，从头开始拉取：{e}')
+            return
+        for site_id in data:
+            wm = Watermark.from_dict(data[site_id])
+            if wm:
+                self.watermarks[site_id] = wm
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = {site_id: wm.to_dict() for site_id, wm in self.watermarks.items()}
+            # 先写临时文件再替换，写到一半进程退出也不会损坏原文件
+            tmp_path = f'{self.path}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump(data, file, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+
+    def get(self, site_id) -> Watermark:
+        return self.watermarks.get(site_id)
+
+    def update(self, site_id, torrents: TorrentList) -> Watermark:
+        """
+        用本次拉取到的新种子推进站点水位线并保存
+        :param site_id:
+        :param torrents:
+        :return:
+        """
+        old = self.watermarks.get(site_id) or Watermark()
+        new = old.advance(torrents)
+        if new != old:
+            self.watermarks[site_id] = new
+            self.save()
+        return new
@@ -0,0 +1,77 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+import yaml
+
+from fast_torrent_trackers.bulkdownload import BulkDownloader, DownloadStatus
+from fast_torrent_trackers.models import TorrentInfo
+from fast_torrent_trackers.simulator import FaultConfig, FixtureReplayer, TORRENT_CONTENT
+from fast_torrent_trackers.tracker.spidertracker import SpiderTracker
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'trackers_config')
+
+
+def build(site_id, **faults):
+    with open(os.path.join(CONFIG_DIR, 'mteam.yml'), 'r', encoding='utf-8') as file:
+        site_config = yaml.safe_load(file)
+    site_config['id'] = site_id
+    site_config['rate_limit'] = {'download': {'rate': 100, 'per': 1, 'burst': 10}}
+    simulator = FixtureReplayer(site_config, '', faults=FaultConfig(**faults))
+    tracker = SpiderTracker(site_config, 'c_secure_uid=1', user_agent='test')
+    return simulator.attach(tracker), simulator
+
+
+def torrent(site_id, torrent_id):
+    t = TorrentInfo()
+    t.site_id = site_id
+    t.download_url = f'https://kp.m-team.cc/download.php?id={torrent_id}'
+    return t
+
+
+class TestBulkDownload(unittest.TestCase):
+    def test_download(self):
+        slow, slow_simulator = build('bulk-slow', latency=0.3)
+        fast, fast_simulator = build('bulk-fast')
+
+        async def run(tmp):
+            jobs = [(torrent('bulk-slow', i), os.path.join(tmp, f'slow-{i}.torrent')) for i in range(2)]
+            jobs += [(torrent('bulk-fast', i % 3), os.path.join(tmp, f'fast-{i}.torrent')) for i in range(6)]
+            jobs.append((torrent('unknown', 1), os.path.join(tmp, 'unknown.torrent')))
+            downloader = BulkDownloader([slow, fast], site_concurrency=2, max_attempts=1)
+            try:
+                completed = [r async for r in downloader.iter_download(jobs)]
+                return completed, await downloader.download(jobs[2:5]), jobs[2:5]
+            finally:
+                await slow.aclose()
+                await fast.aclose()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            completed, results, jobs = asyncio.run(run(tmp))
+            # 慢站点不影响快站点，快站点的结果先返回
+            self.assertEqual(['unknown'] + ['bulk-fast'] * 6 + ['bulk-slow'] * 2, [r['site_id'] for r in completed])
+            self.assertEqual(DownloadStatus.Error, completed[0]['status'])
+            for r in completed[1:]:
+                self.assertEqual(DownloadStatus.Success, r['status'])
+                with open(r['filepath'], 'rb') as file:
+                    self.assertEqual(TORRENT_CONTENT, file.read())
+            # 相同下载链接只请求一次
+            self.assertEqual(3, sum(1 for r in completed if r['deduplicated']))
+            self.assertEqual(3 + 3, fast_simulator.stats['download'])
+            self.assertEqual(2, slow_simulator.stats['download'])
+            # 一次性返回时和任务顺序一致
+            self.assertEqual([path for _, path in jobs], [r['filepath'] for r in results])
+            self.assertFalse(any(f.endswith('.part') for f in os.listdir(tmp)))
+
+    def test_error(self):
+        tracker, simulator = build('bulk-limit', rate_limit=1.0)
+
+        async def run():
+            async with tracker:
+                return await BulkDownloader({'bulk-limit': tracker}, max_attempts=2, retry_wait=0).download(
+                    [(torrent('bulk-limit', 1), os.devnull)])
+
+        results = asyncio.run(run())
+        self.assertEqual(DownloadStatus.Error, results[0]['status'])
+        self.assertEqual(2, simulator.stats['download'])
@@ -0,0 +1,111 @@
+import asyncio
+import datetime
+import os
+import tempfile
+import time
+import unittest
+
+from fast_torrent_trackers.catalog import TorrentCatalog
+from fast_torrent_trackers.models import CateLevel1, TorrentInfo
+from fast_torrent_trackers.trackersearcher import TrackerSearcher
+
+
+def torrent(site_id, torrent_id, name, subject='', imdb_id=None, cate_level1=CateLevel1.Movie, days=0):
+    t = TorrentInfo()
+    t.site_id = site_id
+    t.id = torrent_id
+    t.name = name
+    t.subject = subject
+    t.imdb_id = imdb_id
+    t.cate_level1 = cate_level1
+    t.publish_date = datetime.datetime(2023, 1, 1) + datetime.timedelta(days=days)
+    t.size_mb = 1024.5
+    t.download_url = f'https://{site_id}/download.php?id={torrent_id}'
+    return t
+
+
+class FakeTracker:
+    def __init__(self, torrents):
+        self.torrents = torrents
+        self.calls = 0
+
+    def get_id(self):
+        return 'mteam'
+
+    def get_name(self):
+        return '馒头'
+
+    async def search(self, keyword=None, imdb_id=None, cate_level1_list=None, timeout=None):
+        self.calls += 1
+        return list(self.torrents)
+
+
+class TestCatalog(unittest.TestCase):
+    def test_search(self):
+        with TorrentCatalog() as catalog:
+            catalog.add([
+                torrent('mteam', 1, 'The.Wandering.Earth.2019.1080p.BluRay.x264-GRP', '流浪地球 刘慈欣原著',
+                        imdb_id='tt7605074', days=1),
+                torrent('hdsky', 2, 'The Wandering Earth II 2023 2160p WEB-DL', '流浪地球2', days=3),
+                torrent('mteam', 3, 'Friends.S01.1080p', '老友记 第一季', cate_level1=CateLevel1.TV, days=2),
+            ])
+            self.assertEqual([2, 1], [t.id for t in catalog.search(keyword='wandering earth')])
+            self.assertEqual([2, 1], [t.id for t in catalog.search(keyword='流浪地球')])
+            # 不到3个字符的词按子串匹配
+            self.assertEqual([3], [t.id for t in catalog.search(keyword='老友')])
+            self.assertEqual([1], [t.id for t in catalog.search(keyword='wandering 1080p')])
+            self.assertEqual([1], [t.id for t in catalog.search(imdb_id='tt7605074')])
+            self.assertEqual([1], [t.id for t in catalog.search(keyword='earth', site_ids=['mteam'])])
+            self.assertEqual([3], [t.id for t in catalog.search(cate_level1_list=[CateLevel1.TV])])
+            self.assertEqual([2], [t.id for t in catalog.search(since=datetime.datetime(2023, 1, 4))])
+            self.assertEqual([], catalog.search(keyword='100%'))
+            t = catalog.get('mteam', 1)
+            self.assertEqual(CateLevel1.Movie, t.cate_level1)
+            self.assertEqual(datetime.datetime(2023, 1, 2), t.publish_date)
+            self.assertEqual(1024.5, t.size_mb)
+
+    def test_upsert_and_batch(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'catalog.db')
+            catalog = TorrentCatalog(path, batch_size=1000)
+            start = time.perf_counter()
+            catalog.add(torrent('mteam', i, f'Some.Movie.{i}.1080p', days=i % 30) for i in range(1, 5001))
+            catalog.add([torrent('mteam', 1, 'Renamed.Movie.1080p')])
+            catalog.close()
+            # 5000个种子分批写入，单次事务批量提交
+            self.assertLess(time.perf_counter() - start, 10)
+            with TorrentCatalog(path) as catalog:
+                self.assertEqual(5000, catalog.count())
+                self.assertEqual([1], [t.id for t in catalog.search(keyword='renamed')])
+                self.assertEqual('Renamed.Movie.1080p', catalog.get('mteam', 1).name)
+
+    def test_stale(self):
+        catalog = TorrentCatalog(max_age=60)
+        self.assertTrue(catalog.is_stale('mteam'))
+        catalog.add_poll('mteam', [torrent('mteam', 1, 'A.Movie.2020')])
+        self.assertFalse(catalog.is_stale('mteam'))
+        self.assertEqual(1, catalog.count('mteam'))
+        catalog.add_poll('mteam', [], synced_at=time.time() - 120)
+        self.assertTrue(catalog.is_stale('mteam'))
+        self.assertFalse(catalog.is_stale('mteam', max_age=300))
+
+    def test_searcher(self):
+        catalog = TorrentCatalog()
+        tracker = FakeTracker([torrent('mteam', 1, 'The.Movie.2021.1080p', imdb_id='tt1')])
+        searcher = TrackerSearcher(tracker, query=[{'key': 'keyword', 'value': 'movie'}], catalog=catalog)
+        # 站点还没拉取过，搜索请求站点，结果存进本地目录
+        self.assertEqual([1], [t.id for t in asyncio.run(searcher.search())['data']])
+        self.assertEqual(1, tracker.calls)
+        asyncio.run(searcher.list())
+        self.assertEqual(2, tracker.calls)
+        # 刚拉取过，直接在本地回答
+        self.assertEqual([1], [t.id for t in asyncio.run(searcher.search())['data']])
+        searcher = TrackerSearcher(tracker, query=[{'key': 'imdb_id', 'value': 'tt1'}], catalog=catalog)
+        self.assertEqual([1], [t.id for t in asyncio.run(searcher.search())['data']])
+        self.assertEqual(2, tracker.calls)
+        # 本地没有结果时照常请求站点
+        tracker.torrents = [torrent('mteam', 2, 'Another.Show.S01')]
+        searcher = TrackerSearcher(tracker, query=[{'key': 'keyword', 'value': 'show'}], catalog=catalog)
+        self.assertEqual([2], [t.id for t in asyncio.run(searcher.search())['data']])
+        self.assertEqual(3, tracker.calls)
+        self.assertEqual(2, catalog.count('mteam'))
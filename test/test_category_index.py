@@ -0,0 +1,79 @@
+import itertools
+import os
+import unittest
+
+import yaml
+
+from fast_torrent_trackers.models import CateLevel1, CategoryIndex, TorrentInfo
+from fast_torrent_trackers.tracker.spidertracker import SpiderTracker
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'trackers_config')
+
+
+def scan_level1(category_mappings, cate_id):
+    level1 = None
+    for c in category_mappings:
+        if c.get('id') == cate_id:
+            level1 = CateLevel1.get_type(c.get('cate_level1'))
+    return level1
+
+
+def scan_level2_ids(category_mappings, cate_level1_list):
+    if not cate_level1_list:
+        return [c['id'] for c in category_mappings if c['cate_level1'] != CateLevel1.AV.name]
+    names = [i.name for i in cate_level1_list]
+    return [c.get('id') for c in category_mappings if c.get('cate_level1') in names or c.get('cate_level1') == '*']
+
+
+def scan_search_ids(id_mapping, ids):
+    if not ids or not id_mapping:
+        return ids
+    new_ids = []
+    for id in ids:
+        for mid in id_mapping:
+            if mid.get('id') == id:
+                if isinstance(mid.get('mapping'), list):
+                    new_ids += mid.get('mapping')
+                else:
+                    new_ids.append(mid.get('mapping'))
+    return list(filter(None, new_ids))
+
+
+class TestCategoryIndex(unittest.TestCase):
+    def test_same_as_scan(self):
+        for filename in sorted(os.listdir(CONFIG_DIR)):
+            with open(os.path.join(CONFIG_DIR, filename), 'r', encoding='utf-8') as file:
+                site_config = yaml.safe_load(file)
+            if not site_config.get('search'):
+                continue
+            tracker = SpiderTracker(site_config, cookie_str='')
+            mappings = tracker.category_mappings
+            index = tracker.category_index
+            for c in mappings + [{'id': 'missing'}]:
+                self.assertEqual(scan_level1(mappings, c.get('id')), index.get_level1(c.get('id')), filename)
+                level2 = c.get('cate_level2')
+                expected = next((m.get('id') for m in mappings if level2 and m.get('cate_level2') == level2), None)
+                self.assertEqual(expected, tracker._get_cate_id_from_level2(level2), filename)
+            for n in range(3):
+                for levels in itertools.combinations(list(CateLevel1), n):
+                    ids = scan_level2_ids(mappings, list(levels))
+                    self.assertEqual(ids, tracker._get_cate_level2_ids(list(levels)), filename)
+                    id_mapping = site_config.get('category_id_mapping')
+                    self.assertEqual(scan_search_ids(id_mapping, ids), tracker._trans_search_cate_id(ids), filename)
+
+    def test_for_config(self):
+        site_config = {'id': 'test', 'category_mappings': [{'id': '1', 'cate_level1': 'Movie', 'cate_level2': 'HD'}]}
+        index = CategoryIndex.for_config(site_config)
+        # 同一份配置每行解析时都取到同一个索引，不再逐行重建
+        self.assertIs(index, CategoryIndex.for_config(site_config))
+        self.assertIs(index, CategoryIndex.for_config(dict(site_config)))
+        item = {'id': '1', 'title': 'The.Movie', 'category': '1'}
+        self.assertEqual(CateLevel1.Movie, TorrentInfo.build_by_parse_item(site_config, item).cate_level1)
+        other = {'id': 'test', 'category_mappings': [{'id': '1', 'cate_level1': 'TV', 'cate_level2': 'HD'}]}
+        self.assertEqual(CateLevel1.TV, CategoryIndex.for_config(other).get_level1('1'))
+
+    def test_readonly(self):
+        index = CategoryIndex([{'id': '1', 'cate_level1': 'Movie', 'cate_level2': 'HD'}])
+        self.assertEqual(CateLevel1.Movie, index.get_level1('1'))
+        with self.assertRaises(TypeError):
+            index.level1_by_id['2'] = CateLevel1.TV
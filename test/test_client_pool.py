@@ -0,0 +1,53 @@
+import asyncio
+import os
+import unittest
+
+import httpx
+import yaml
+
+from fast_torrent_trackers.tracker.spidertracker import SpiderTracker
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'trackers_config')
+
+
+def load_config(site_id):
+    with open(os.path.join(CONFIG_DIR, f'{site_id}.yml'), 'r', encoding='utf-8') as file:
+        return yaml.safe_load(file)
+
+
+class MockSpiderTracker(SpiderTracker):
+    created = 0
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, text='<html></html>'))
+
+    def _create_client(self) -> httpx.AsyncClient:
+        self.created += 1
+        return super()._create_client()
+
+
+class TestClientPool(unittest.TestCase):
+    def test_reuse_client(self):
+        async def run():
+            async with MockSpiderTracker(load_config('mteam'), 'c_secure_uid=1') as tracker:
+                await tracker.get_userinfo_page_text()
+                await tracker.get_userinfo_page_text()
+                client = tracker.client
+                self.assertFalse(client.is_closed)
+                self.assertEqual('1', client.cookies.get('c_secure_uid'))
+            self.assertTrue(client.is_closed)
+            self.assertIsNone(tracker.client)
+            return tracker
+
+        tracker = asyncio.run(run())
+        self.assertEqual(1, tracker.created)
+
+    def test_rebuild_client_on_new_loop(self):
+        tracker = MockSpiderTracker(load_config('mteam'), 'c_secure_uid=1')
+        asyncio.run(tracker.get_userinfo_page_text())
+        asyncio.run(tracker.get_userinfo_page_text())
+        self.assertEqual(2, tracker.created)
+
+    def test_headers_not_shared(self):
+        a = SpiderTracker(load_config('mteam'), user_agent='a')
+        b = SpiderTracker(load_config('mteam'), user_agent='b')
+        self.assertEqual('a', a.headers['user-agent'])
+        self.assertEqual('b', b.headers['user-agent'])
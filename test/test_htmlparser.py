@@ -0,0 +1,61 @@
+import datetime
+import unittest
+from unittest import mock
+
+from bs4 import BeautifulSoup
+
+from fast_torrent_trackers import htmlparser
+from fast_torrent_trackers.htmlparser import HtmlParser
+
+ROW = '<table><tr class="row"><td><a href="details.php?id=501" title="The.Movie.2021.1080p"><b>The.Movie</b></a>' \
+      '<img class="pro_free" src="f.gif"/></td><td><span title="2021-05-01 12:30:00">1年</span></td>' \
+      '<td>1,234.5 MB</td><td class="desc">中字<span>tag</span></td></tr></table>'
+
+FIELDS = {
+    'id': {'selector': 'a[href^="details.php?id="]', 'attribute': 'href',
+           'filters': [{'name': 're_search', 'args': ['\\d+', 0]}]},
+    'title_default': {'selector': 'a[href^="details.php?id="] > b'},
+    'title_optional': {'selector': 'a[title][href^="details.php?id="]', 'attribute': 'title'},
+    'title': {'text': "{% if fields['title_optional'] %}{{ fields['title_optional'] }}"
+                      "{% else %}{{ fields['title_default'] }}{% endif %}"},
+    'date': {'selector': 'td > span[title]', 'attribute': 'title',
+             'filters': [{'name': 'dateparse', 'args': '%Y-%m-%d %H:%M:%S'}]},
+    'size': {'selector': 'td:nth-child(3)'},
+    'description': {'selector': 'td.desc', 'remove': 'span'},
+    'downloadvolumefactor': {'case': {'img.pro_free': 0, '*': 1}},
+    'free_deadline': {'default_value': "{% if fields['downloadvolumefactor']==0 %}{{max_time}}{% endif%}",
+                      'default_value_format': '%Y-%m-%d %H:%M:%S.%f',
+                      'selector': 'span.deadline'},
+    'broken': {'selector': 'a[', 'default_value': 1},
+    'broken_remove': {'selector': 'td.desc', 'remove': ['span']},
+    'minimumratio': {'text': 1},
+}
+
+
+class TestHtmlParser(unittest.TestCase):
+    def parse(self, rule):
+        tag = BeautifulSoup(ROW, 'lxml').select_one('tr.row')
+        return HtmlParser.parse_item_fields(tag, rule)
+
+    def test_parse_item_fields(self):
+        item = self.parse(FIELDS)
+        self.assertEqual('501', item['id'])
+        self.assertEqual('The.Movie.2021.1080p', item['title'])
+        self.assertEqual(datetime.datetime(2021, 5, 1, 12, 30), item['date'])
+        self.assertEqual('1,234.5 MB', item['size'])
+        self.assertEqual('中字', item['description'])
+        self.assertEqual(0, item['downloadvolumefactor'])
+        self.assertEqual(datetime.datetime.max, item['free_deadline'])
+        self.assertEqual(1, item['minimumratio'])
+        # 选择器错误、remove不是字符串的字段跳过，不影响其他字段
+        self.assertNotIn('broken', item)
+        self.assertNotIn('broken_remove', item)
+
+    def test_compile_once(self):
+        rule = dict(FIELDS)
+        plan = HtmlParser.compile(rule)
+        self.assertIs(plan, HtmlParser.compile(rule))
+        self.assertIs(plan, HtmlParser.compile(plan))
+        with mock.patch.object(htmlparser, 'Template', side_effect=AssertionError('模版不应该重复构建')):
+            for i in range(3):
+                self.assertEqual('The.Movie.2021.1080p', self.parse(rule)['title'])
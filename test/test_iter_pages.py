@@ -0,0 +1,112 @@
+import asyncio
+import datetime
+import unittest
+
+from fast_torrent_trackers.basetracker import BaseTracker
+from fast_torrent_trackers.models import TorrentInfo
+
+
+class PagedTracker(BaseTracker):
+    def __init__(self, pages, delay=0.05):
+        self.pages = pages
+        self.delay = delay
+        self.requested = []
+        self.completed = []
+
+    def get_id(self):
+        return 'paged'
+
+    async def get_userinfo(self, refresh=False):
+        return None
+
+    async def search(self, keyword=None, imdb_id=None, cate_level1_list: list = None, free: bool = False,
+                     page: int = None, timeout=None):
+        self.requested.append(page or 0)
+        await asyncio.sleep(self.delay)
+        n = page or 0
+        self.completed.append(n)
+        return list(self.pages[n]) if n < len(self.pages) else []
+
+    async def download(self, url, filepath):
+        pass
+
+
+def torrent(torrent_id, days):
+    t = TorrentInfo()
+    t.site_id = 'paged'
+    t.id = torrent_id
+    t.publish_date = datetime.datetime(2023, 1, 31) - datetime.timedelta(days=days)
+    return t
+
+
+def build_pages(count, size=10):
+    return [[torrent(p * size + i, p * size + i) for i in range(size)] for p in range(count)]
+
+
+async def collect(tracker, consume_delay=0.0, **kwargs):
+    pages = []
+    async for page in tracker.iter_pages(keyword='test', **kwargs):
+        pages.append([t.id for t in page])
+        await asyncio.sleep(consume_delay)
+    return pages
+
+
+class TestIterPages(unittest.TestCase):
+    def test_stop_conditions(self):
+        tracker = PagedTracker(build_pages(3), delay=0)
+        pages = asyncio.run(collect(tracker))
+        self.assertEqual(3, len(pages))
+        # 遇到空页停止
+        self.assertEqual([0, 1, 2, 3], tracker.requested)
+
+        tracker = PagedTracker(build_pages(5), delay=0)
+        self.assertEqual(2, len(asyncio.run(collect(tracker, max_pages=2))))
+        self.assertEqual([0, 1], tracker.requested)
+
+        tracker = PagedTracker(build_pages(5), delay=0)
+        pages = asyncio.run(collect(tracker, max_rows=15))
+        self.assertEqual([10, 5], [len(p) for p in pages])
+        self.assertEqual([0, 1], tracker.requested)
+
+        tracker = PagedTracker(build_pages(5), delay=0)
+        pages = asyncio.run(collect(tracker, oldest_date=datetime.datetime(2023, 1, 31) - datetime.timedelta(days=14)))
+        self.assertEqual([10, 5], [len(p) for p in pages])
+        self.assertEqual([0, 1], tracker.requested)
+
+    def test_dedup(self):
+        pages = build_pages(2)
+        # 翻页期间有新种子，第二页开头是第一页末尾的种子；第三页整页重复
+        pages[1] = pages[0][-2:] + pages[1][:-2]
+        pages.append(list(pages[1]))
+        tracker = PagedTracker(pages, delay=0)
+        result = asyncio.run(collect(tracker))
+        self.assertEqual([10, 8], [len(p) for p in result])
+        self.assertEqual([0, 1, 2], tracker.requested)
+
+    def test_prefetch(self):
+        async def run(prefetch):
+            tracker = PagedTracker(build_pages(4), delay=0.1)
+            start = asyncio.get_running_loop().time()
+            await collect(tracker, consume_delay=0.1, max_pages=4, prefetch=prefetch)
+            return asyncio.get_running_loop().time() - start
+
+        # 请求下一页和处理当前页重叠，4页大约省下3次请求的时间
+        self.assertLess(asyncio.run(run(True)), asyncio.run(run(False)) - 0.2)
+
+    def test_early_exit_cancels_prefetch(self):
+        async def run():
+            tracker = PagedTracker(build_pages(4), delay=0.1)
+            iterator = tracker.iter_pages(keyword='test')
+            await iterator.__anext__()
+            await asyncio.sleep(0.01)
+            await iterator.aclose()
+            await asyncio.sleep(0.2)
+            return tracker.requested, tracker.completed
+
+        self.assertEqual(([0, 1], [0]), asyncio.run(run()))
+
+    def test_no_paging(self):
+        tracker = PagedTracker(build_pages(3), delay=0)
+        tracker.first_page = None
+        self.assertEqual(1, len(asyncio.run(collect(tracker))))
+        self.assertEqual([0], tracker.requested)
@@ -0,0 +1,114 @@
+import os
+import unittest
+from unittest import mock
+
+import yaml
+
+from fast_torrent_trackers.htmlparser import HtmlParser
+from fast_torrent_trackers.models import TorrentInfo
+from fast_torrent_trackers.predicates import free_only, min_seeders, RowPredicate
+from fast_torrent_trackers.tracker.spidertracker import TrackerParser
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'trackers_config')
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def load_site(site_id):
+    with open(os.path.join(CONFIG_DIR, f'{site_id}.yml'), 'r', encoding='utf-8') as file:
+        site_config = yaml.safe_load(file)
+    with open(os.path.join(FIXTURE_DIR, site_id, 'search.html'), 'r', encoding='utf-8') as file:
+        return site_config, file.read()
+
+
+def summary(torrents):
+    return [(t.id, t.name, t.subject, t.size_mb, t.upload_count, t.download_volume_factor, t.cate_level1,
+             t.details_url, t.download_url) for t in torrents]
+
+
+class TestIterTorrents(unittest.TestCase):
+    def test_predicate_same_as_filter(self):
+        for site_id in sorted(os.listdir(FIXTURE_DIR)):
+            site_config, html_text = load_site(site_id)
+            parser = TrackerParser(site_config)
+            context = {'userinfo': parser.parse_userinfo(html_text)}
+            torrents = parser.parse_torrents(html_text, context)
+            for predicate in (free_only(), min_seeders(50), free_only() & min_seeders(10)):
+                expected = [t for t in torrents if predicate(t)]
+                actual = list(parser.iter_torrents(html_text, context, predicate=predicate))
+                self.assertEqual(summary(expected), summary(actual), site_id)
+
+    def test_skip_rows_before_full_parse(self):
+        site_config, html_text = load_site('mteam')
+        parser = TrackerParser(site_config)
+        free_count = len([t for t in parser.parse_torrents(html_text) if t.download_volume_factor == 0])
+        with mock.patch.object(TorrentInfo, 'build_by_parse_item', wraps=TorrentInfo.build_by_parse_item) as build:
+            result = list(parser.iter_torrents(html_text, predicate=free_only()))
+        self.assertEqual(free_count, len(result))
+        # 每行先用判断字段构建一次，满足条件的行完整构建一次
+        self.assertEqual(50 + free_count, build.call_count)
+
+    def test_limit(self):
+        site_config, html_text = load_site('hdsky')
+        parser = TrackerParser(site_config)
+        with mock.patch.object(TorrentInfo, 'build_by_parse_item', wraps=TorrentInfo.build_by_parse_item) as build:
+            result = list(parser.iter_torrents(html_text, limit=5))
+        self.assertEqual(summary(parser.parse_torrents(html_text)[:5]), summary(result))
+        self.assertEqual(5, build.call_count)
+        self.assertEqual([], list(parser.iter_torrents(html_text, limit=0)))
+        # 普通函数做条件时解析完整行后再判断
+        result = list(parser.iter_torrents(html_text, limit=3, predicate=lambda t: t.id % 2 == 0))
+        self.assertEqual(3, len(result))
+        self.assertTrue(all(t.id % 2 == 0 for t in result))
+
+    def test_resolve_template_refs(self):
+        site_config, html_text = load_site('mteam')
+        plan = HtmlParser.compile(site_config['torrents']['fields'])
+        self.assertTrue({'title', 'title_default', 'title_optional'} <= plan.resolve(['title']))
+        self.assertIn('downloadvolumefactor', plan.resolve(['free_deadline']))
+        title = RowPredicate(['title'], lambda t: bool(t.name))
+        self.assertEqual(summary(TrackerParser(site_config).parse_torrents(html_text)),
+                         summary(TrackerParser(site_config).iter_torrents(html_text, predicate=title)))
+
+    def test_stream_same_as_parse(self):
+        for site_id in sorted(os.listdir(FIXTURE_DIR)):
+            site_config, html_text = load_site(site_id)
+            parser = TrackerParser(site_config, 'lxml')
+            context = {'userinfo': parser.parse_userinfo(html_text)}
+            expected = parser.parse_torrents(html_text, context)
+            data = html_text.encode('utf-8')
+            # 按块喂入，块边界会切在标签、多字节字符中间
+            stream = parser.stream_torrents('utf-8', context)
+            actual = []
+            for i in range(0, len(data), 1000):
+                actual += stream.feed(data[i:i + 1000])
+            actual += stream.close()
+            self.assertEqual(summary(expected), summary(actual), site_id)
+
+    def test_stream_emits_closed_rows(self):
+        site_config, html_text = load_site('mteam')
+        parser = TrackerParser(site_config, 'lxml')
+        data = html_text.encode('utf-8')
+        stream = parser.stream_torrents(limit=3)
+        # 前半页就能拿到前面的种子，拿够后不用再接收
+        torrents = stream.feed(data[:len(data) // 2])
+        self.assertEqual(summary(parser.parse_torrents(html_text)[:3]), summary(torrents))
+        self.assertTrue(stream.done)
+        self.assertRaises(ValueError, TrackerParser(site_config, 'bs4').stream_torrents)
+
+    def test_parsed_page_shared(self):
+        for backend in ('bs4', 'lxml'):
+            for site_id in sorted(os.listdir(FIXTURE_DIR)):
+                site_config, html_text = load_site(site_id)
+                parser = TrackerParser(site_config, backend)
+                userinfo = parser.parse_userinfo(html_text)
+                expected = parser.parse_torrents(html_text, {'userinfo': userinfo})
+                page = parser.parse_page(html_text)
+                with mock.patch.object(parser.backend, 'parse_document',
+                                       wraps=parser.backend.parse_document) as parse_document:
+                    self.assertTrue(parser.test_login(page))
+                    self.assertEqual(userinfo, parser.parse_userinfo(page))
+                    actual = parser.parse_torrents(page, {'userinfo': userinfo})
+                    # 用户信息存在页面上，再取不用解析
+                    self.assertIs(parser.parse_userinfo(page), parser.parse_userinfo(page))
+                self.assertEqual(summary(expected), summary(actual), f'{backend} {site_id}')
+                self.assertEqual(1, parse_document.call_count, f'{backend} {site_id}')
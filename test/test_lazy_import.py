@@ -0,0 +1,57 @@
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def loaded_modules(code, modules):
+    """在新进程里执行代码，返回modules中被导入了的模块"""
+    check = f'import sys\n{code}\nprint(",".join(m for m in {modules!r} if m in sys.modules))'
+    output = subprocess.run([sys.executable, '-c', check], cwd=ROOT_DIR, capture_output=True, text=True,
+                            check=True).stdout
+    return set(filter(None, output.strip().split(',')))
+
+
+class TestLazyImport(unittest.TestCase):
+    def test_import_builder(self):
+        modules = ['fast_torrent_trackers.tracker.rarbg', 'magnet2torrent', 'random_user_agent', 'httpx']
+        self.assertEqual(set(), loaded_modules('import fast_torrent_trackers.trackerbuilder', modules))
+
+    def test_build_nexusphp_site(self):
+        code = '''
+import yaml
+from fast_torrent_trackers.trackerbuilder import TrackerBuilder
+with open('trackers_config/mteam.yml', 'r', encoding='utf-8') as f:
+    tracker = TrackerBuilder.build(yaml.safe_load(f), '', user_agent='test')
+assert type(tracker).__name__ == 'SpiderTracker'
+'''
+        modules = ['fast_torrent_trackers.tracker.rarbg', 'magnet2torrent', 'random_user_agent']
+        self.assertEqual(set(), loaded_modules(code, modules))
+
+    def test_register_custom_class(self):
+        from fast_torrent_trackers.basetracker import BaseTracker
+        from fast_torrent_trackers.trackerbuilder import TrackerBuilder
+
+        class MyTracker(BaseTracker):
+            def __init__(self, site_config, proxies=None):
+                self.site_config = site_config
+                self.proxies = proxies
+
+            async def get_userinfo(self, refresh=False):
+                pass
+
+            async def search(self, keyword=None, imdb_id=None, cate_level1_list: list = None, free: bool = False,
+                             page: int = None, timeout=None):
+                pass
+
+            async def download(self, url, filepath):
+                pass
+
+        TrackerBuilder.register('MyParser', MyTracker)
+        # 构造方法不接受的cookie、user_agent、parser_backend等参数不会传进去
+        tracker = TrackerBuilder.build({'parser': 'MyParser'}, 'uid=1', proxies='http://proxy', user_agent='test',
+                                       parser_backend='lxml')
+        self.assertIsInstance(tracker, MyTracker)
+        self.assertEqual('http://proxy', tracker.proxies)
@@ -0,0 +1,150 @@
+import datetime
+import logging
+import os
+import unittest
+
+import yaml
+from lxml import etree
+
+from fast_torrent_trackers.htmlparser import HtmlParser, SoupBackend, get_backend
+from fast_torrent_trackers.lxmlparser import LxmlBackend
+from fast_torrent_trackers.tracker.spidertracker import TrackerParser
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'trackers_config')
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+ROW = '<table><tr class="row"><td class="name  first"><a href="details.php?id=501">The.Movie</a>' \
+      '<!-- hot --><b>Free</b>剩余<span>2天</span></td><td>上传<b>12</b> GB<script>var x=1;</script></td>' \
+      '<td><img class="pro_free pro" src="f.gif"/><span class="tag">中字</span>国语</td>' \
+      '<td class="empty" title=""></td></tr></table>'
+
+FIELDS = {
+    'id': {'selector': 'a[href^="details.php?id="]', 'attribute': 'href'},
+    'first_class': {'selector': 'td:nth-child(1)', 'attribute': 'class'},
+    'pro_class': {'selector': 'img', 'attribute': 'class'},
+    'after_free': {'selector': 'td:nth-child(1) > b', 'method': 'next_sibling'},
+    'after_link': {'selector': 'td:nth-child(1) > a', 'method': 'next_sibling'},
+    'uploaded': {'selector': 'td:nth-child(2)'},
+    'uploaded_unit': {'selector': 'td:nth-child(2)', 'contents': 2},
+    'uploaded_tail': {'selector': 'td:nth-child(2)', 'contents': -2},
+    'tags': {'selectors': 'td span'},
+    'second_tag': {'selectors': 'td span', 'index': 1},
+    'downloadvolumefactor': {'case': {'img.pro_free': 0, '*': 1}},
+    'has_empty': {'case': {'td.empty:not(:has(span))': True, '*': False}},
+    'empty_class': {'selector': 'td.empty', 'attribute': 'title', 'default_value': 'none'},
+    # remove会改动标签树，放在最后
+    'language': {'selector': 'td:nth-child(3)', 'remove': 'img,span'},
+}
+
+
+def load_site_configs():
+    for filename in sorted(os.listdir(CONFIG_DIR)):
+        with open(os.path.join(CONFIG_DIR, filename), 'r', encoding='utf-8') as f:
+            yield os.path.splitext(filename)[0], yaml.safe_load(f)
+
+
+def stream_rows(selector, html_text, chunk_size=512):
+    data = html_text.encode('utf-8')
+    document = LxmlBackend.stream_document(selector)
+    rows = []
+    for i in range(0, len(data), chunk_size):
+        rows += document.feed(data[i:i + chunk_size])
+    return rows + document.close()
+
+
+def parse_rows(site_config, backend, html_text):
+    torrents_rule = site_config['torrents']
+    doc = backend.parse_document(html_text)
+    return [HtmlParser.parse_item_fields(tag, torrents_rule['fields'], context={'userinfo': {}}, backend=backend)
+            for tag in backend.select(doc, torrents_rule['list']['selector'])]
+
+
+class TestLxmlParser(unittest.TestCase):
+    def assertSameValues(self, expected, actual, msg=None):
+        self.assertEqual(expected.keys(), actual.keys(), msg)
+        for key in expected:
+            e, a = expected[key], actual[key]
+            if isinstance(e, datetime.datetime) and isinstance(a, datetime.datetime):
+                # 相对时间、默认当前时间的字段是按解析时的now算的，两次解析会差一点
+                self.assertLess(abs((e - a).total_seconds()), 5, f'{msg} {key}')
+            else:
+                self.assertEqual(e, a, f'{msg} {key}')
+
+    def test_get_backend(self):
+        self.assertIs(SoupBackend, get_backend(None))
+        self.assertIs(SoupBackend, get_backend('bs4'))
+        self.assertIs(LxmlBackend, get_backend('lxml'))
+        self.assertRaises(ValueError, get_backend, 'html5lib')
+
+    def test_rule_vocabulary(self):
+        logging.disable(logging.CRITICAL)
+        try:
+            values = {}
+            for backend in (SoupBackend, LxmlBackend):
+                tag = backend.select_one(backend.parse_document(ROW), 'tr.row')
+                values[backend.name] = HtmlParser.parse_item_fields(tag, FIELDS, backend=backend)
+        finally:
+            logging.disable(logging.NOTSET)
+        self.assertEqual(values['bs4'], values['lxml'])
+        item = values['lxml']
+        self.assertEqual('details.php?id=501', item['id'])
+        self.assertEqual('name', item['first_class'])
+        self.assertEqual('pro_free', item['pro_class'])
+        self.assertEqual('剩余', item['after_free'])
+        self.assertEqual('', item['after_link'])
+        self.assertEqual('上传12 GB', item['uploaded'])
+        self.assertEqual('GB', item['uploaded_unit'])
+        self.assertEqual('GB', item['uploaded_tail'])
+        self.assertEqual('国语', item['language'])
+        self.assertEqual(['2天', '中字'], item['tags'])
+        self.assertEqual('中字', item['second_tag'])
+        self.assertEqual(0, item['downloadvolumefactor'])
+        self.assertTrue(item['has_empty'])
+        self.assertEqual('none', item['empty_class'])
+
+    def test_parity_with_bs4(self):
+        """trackers_config里每个站点的规则在两种解析后端下结果一致"""
+        checked = 0
+        for site, site_config in load_site_configs():
+            if not site_config.get('torrents') or not os.path.isdir(os.path.join(FIXTURE_DIR, site)):
+                continue
+            for page in ('search', 'userinfo'):
+                with open(os.path.join(FIXTURE_DIR, site, page + '.html'), 'r', encoding='utf-8') as f:
+                    html_text = f.read()
+                expected = parse_rows(site_config, SoupBackend, html_text)
+                actual = parse_rows(site_config, LxmlBackend, html_text)
+                self.assertEqual(len(expected), len(actual), site)
+                for e, a in zip(expected, actual):
+                    self.assertSameValues(e, a, site)
+                self.assertEqual(TrackerParser(site_config, 'bs4').parse_userinfo(html_text),
+                                 TrackerParser(site_config, 'lxml').parse_userinfo(html_text), site)
+            checked += 1
+        self.assertGreater(checked, 0)
+
+    def test_stream_rows(self):
+        """流式解析只检查新闭合的标签，结果和整页查询一致"""
+        html_text = '<div><p class="a">1</p><p>2</p><span><p>3</p></span><p>4</p></div>'
+        doc = LxmlBackend.parse_document(html_text)
+        for selector in ('p.a + p', 'p.a ~ p', 'div p', 'div > p', 'span p, p.a', 'div > :nth-child(2)',
+                         'p:not(.a)'):
+            self.assertEqual([e.text for e in LxmlBackend.select(doc, selector)],
+                             [e.text for e in stream_rows(selector, html_text, chunk_size=7)], selector)
+        checked = 0
+        for site, site_config in load_site_configs():
+            if not site_config.get('torrents') or not os.path.isdir(os.path.join(FIXTURE_DIR, site)):
+                continue
+            selector = site_config['torrents']['list']['selector']
+            with open(os.path.join(FIXTURE_DIR, site, 'search.html'), 'r', encoding='utf-8') as f:
+                html_text = f.read()
+            expected = LxmlBackend.select(LxmlBackend.parse_document(html_text), selector)
+            self.assertEqual([etree.tostring(e) for e in expected],
+                             [etree.tostring(e) for e in stream_rows(selector, html_text)], site)
+            checked += 1
+        self.assertGreater(checked, 0)
+
+    def test_login_failed(self):
+        site_config = next(c for site, c in load_site_configs() if site == 'mteam')
+        parser = TrackerParser(site_config, 'lxml')
+        self.assertFalse(parser.test_login('<html><body>login.php</body></html>'))
+        self.assertFalse(parser.test_login(' '))
+        self.assertEqual([], parser.parse_torrents('<html></html>'))
@@ -0,0 +1,71 @@
+import time
+import unittest
+
+from fast_torrent_trackers.merger import TorrentMerger, merge_torrents, normalize_title
+from fast_torrent_trackers.models import TorrentInfo
+
+
+def torrent(site_id, torrent_id, name, size_mb, seeders=0, free=False, imdb_id=None):
+    t = TorrentInfo()
+    t.site_id = site_id
+    t.id = torrent_id
+    t.name = name
+    t.subject = ''
+    t.size_mb = size_mb
+    t.upload_count = seeders
+    t.download_volume_factor = 0 if free else 1
+    t.imdb_id = imdb_id
+    return t
+
+
+class TestMerger(unittest.TestCase):
+    def test_normalize_title(self):
+        self.assertEqual('the movie 2021 1080p bluray x264 grp',
+                         normalize_title('The.Movie.2021.1080p.BluRay.x264-GRP'))
+        self.assertEqual(normalize_title('The Movie 2021 1080p BluRay x264-GRP.torrent'),
+                         normalize_title('［The_Movie］ 2021 1080p BluRay x264 GRP'))
+        self.assertEqual('', normalize_title(None))
+
+    def test_merge(self):
+        torrents = [
+            torrent('mteam', 1, 'The.Movie.2021.1080p.BluRay.x264-GRP', 10240, seeders=50),
+            torrent('hdsky', 2, 'The Movie 2021 1080p BluRay x264-GRP', 10100, seeders=10, free=True),
+            torrent('ourbits', 3, 'The.Movie.2021.1080p.BluRay.x264-GRP', 10400, seeders=80),
+            # 体积差太多是不同的资源
+            torrent('chdbits', 4, 'The.Movie.2021.1080p.BluRay.x264-GRP', 20480, seeders=5),
+            # 同一站点同一个种子重复出现只留一个
+            torrent('mteam', 1, 'The.Movie.2021.1080p.BluRay.x264-GRP', 10240, seeders=50),
+            torrent('mteam', 5, 'Other.Show.S01.2160p-GRP', 30000, imdb_id='tt1'),
+            # imdb编号不同是不同的资源
+            torrent('hdsky', 6, 'Other.Show.S01.2160p-GRP', 30000, imdb_id='tt2'),
+            torrent('ourbits', 7, 'Other Show S01 2160p GRP', 30100),
+        ]
+        merged = merge_torrents(torrents)
+        self.assertEqual([['hdsky', 'ourbits', 'mteam'], ['chdbits'], ['mteam', 'ourbits'], ['hdsky']],
+                         [m.site_ids for m in merged])
+        # 免费的优先，其次做种人数多的
+        self.assertEqual(2, merged[0].torrent.id)
+        self.assertEqual([3, 1], [t.id for t in merged[0].alternatives])
+
+    def test_size_bucket_boundary(self):
+        # 不管体积落在哪个对数区间，相差不超过容差都能合并
+        for base in (1000, 1019.9, 1020, 1020.4, 4321):
+            merger = TorrentMerger(size_tolerance=0.02)
+            merger.add(torrent('a', 1, 'Same.Name', base))
+            merger.add(torrent('b', 2, 'Same.Name', base * 1.019))
+            merger.add(torrent('c', 3, 'Same.Name', base * 1.05))
+            self.assertEqual([2, 1], [len(m) for m in merger.results()], base)
+
+    def test_linear(self):
+        def run(n):
+            torrents = [torrent(f's{i % 14}', i, f'Release.{i // 14}.1080p-GRP', 1000 + i // 14) for i in range(n)]
+            start = time.perf_counter()
+            merged = merge_torrents(torrents)
+            return len(merged), time.perf_counter() - start
+
+        count, small = run(14000)
+        self.assertEqual(1000, count)
+        count, large = run(140000)
+        self.assertEqual(10000, count)
+        # 数量翻10倍，耗时不应该是平方增长
+        self.assertLess(large, small * 30)
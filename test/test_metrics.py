@@ -0,0 +1,111 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+import yaml
+from tenacity import stop_after_attempt, wait_fixed
+
+from fast_torrent_trackers.exceptions import RateLimitException
+from fast_torrent_trackers.metrics import TrackerMetrics
+from fast_torrent_trackers.searchcache import SearchCache
+from fast_torrent_trackers.simulator import RATE_LIMIT_PAGE, FaultConfig, FixtureReplayer
+from fast_torrent_trackers.tracker.spidertracker import SpiderTracker
+from fast_torrent_trackers.trackersearcher import TrackerSearcher
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'trackers_config')
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def build(site_id, metrics, search_cache=None, parser_backend=None, **faults):
+    with open(os.path.join(CONFIG_DIR, 'mteam.yml'), 'r', encoding='utf-8') as file:
+        site_config = yaml.safe_load(file)
+    site_config['id'] = site_id
+    site_config['rate_limit'] = {'download': {'rate': 100, 'per': 1, 'burst': 10}}
+    with open(os.path.join(FIXTURE_DIR, 'mteam', 'search.html'), 'r', encoding='utf-8') as file:
+        simulator = FixtureReplayer(site_config, file.read(), faults=FaultConfig(**faults))
+    tracker = SpiderTracker(site_config, 'c_secure_uid=1', user_agent='test', parallel_search=True,
+                            search_cache=search_cache, metrics=metrics, parser_backend=parser_backend)
+    return simulator.attach(tracker)
+
+
+class TestMetrics(unittest.TestCase):
+    def test_export_prometheus(self):
+        metrics = TrackerMetrics(buckets=(0.1, 1))
+        events = []
+        metrics.add_listener(events.append)
+        metrics.observe('mteam', 'parse', 0.05)
+        metrics.observe('mteam', 'parse', 0.5)
+        metrics.incr('mteam', 'rows_parsed', 50)
+        metrics.incr('a"b', 'retries')
+        self.assertEqual(['timing', 'timing', 'count', 'count'], [e.kind for e in events])
+        self.assertEqual({'count': 2, 'sum': 0.55}, metrics.get_timing('mteam', 'parse'))
+        text = metrics.export_prometheus()
+        self.assertIn('# TYPE fast_torrent_trackers_stage_seconds histogram', text)
+        self.assertIn('fast_torrent_trackers_stage_seconds_bucket{site="mteam",stage="parse",le="0.1"} 1', text)
+        self.assertIn('fast_torrent_trackers_stage_seconds_bucket{site="mteam",stage="parse",le="1"} 2', text)
+        self.assertIn('fast_torrent_trackers_stage_seconds_bucket{site="mteam",stage="parse",le="+Inf"} 2', text)
+        self.assertIn('fast_torrent_trackers_stage_seconds_count{site="mteam",stage="parse"} 2', text)
+        self.assertIn('fast_torrent_trackers_rows_parsed_total{site="mteam"} 50', text)
+        self.assertIn('fast_torrent_trackers_retries_total{site="a\\"b"} 1', text)
+        metrics.reset()
+        self.assertEqual('', metrics.export_prometheus())
+
+    def test_tracker_stages(self):
+        metrics = TrackerMetrics()
+        tracker = build('metrics-ok', metrics, SearchCache())
+
+        async def run():
+            async with tracker:
+                searcher = TrackerSearcher(tracker, query=[{'key': 'keyword', 'value': 'test'}])
+                await searcher.search()
+                await tracker.search(keyword='test')
+                with tempfile.TemporaryDirectory() as tmp:
+                    await tracker.download('https://kp.m-team.cc/download.php?id=1', os.path.join(tmp, 'a'))
+
+        asyncio.run(run())
+        snapshot = metrics.snapshot()
+        timings = snapshot['timings']['metrics-ok']
+        counters = snapshot['counters']['metrics-ok']
+        for stage in ('search', 'search_wait', 'request', 'decode', 'parse', 'query', 'download', 'download_wait'):
+            self.assertIn(stage, timings)
+        # mteam配置了3个搜索path
+        self.assertEqual(3, timings['parse']['count'])
+        self.assertEqual(1, timings['search']['count'])
+        self.assertEqual(150, counters['rows_parsed'])
+        self.assertEqual(1, counters['cache_hits'])
+        self.assertEqual(1, counters['cache_misses'])
+        self.assertGreater(counters['bytes_received'], 3 * 60000)
+
+    def test_stream_fallback_counted_once(self):
+        metrics = TrackerMetrics()
+        tracker = build('metrics-stream', metrics, parser_backend='lxml', rate_limit=1.0)
+        before = {}
+
+        async def run():
+            async with tracker:
+                await tracker.get_userinfo()
+                tracker.stream_parse = True
+                before['bytes'] = metrics.get_counter('metrics-stream', 'bytes_received')
+                await tracker.search(keyword='test')
+
+        with self.assertRaises(RateLimitException):
+            asyncio.run(run())
+        # 提示页面边收边解析没有种子行，回退到整页检查，接收字节只按整页记一次，也不记边收边解析的耗时
+        received = metrics.get_counter('metrics-stream', 'bytes_received') - before['bytes']
+        self.assertEqual(3 * len(RATE_LIMIT_PAGE.encode('utf-8')), received)
+        self.assertEqual(0, metrics.get_timing('metrics-stream', 'parse')['count'])
+
+    def test_retries_and_rate_limit(self):
+        metrics = TrackerMetrics()
+        tracker = build('metrics-limit', metrics, rate_limit=1.0)
+        download = SpiderTracker.download.retry_with(stop=stop_after_attempt(2), wait=wait_fixed(0))
+
+        async def run():
+            async with tracker:
+                await download(tracker, 'https://kp.m-team.cc/download.php?id=1', os.devnull)
+
+        with self.assertRaises(RateLimitException):
+            asyncio.run(run())
+        self.assertEqual(2, metrics.get_counter('metrics-limit', 'rate_limited'))
+        self.assertEqual(1, metrics.get_counter('metrics-limit', 'retries'))
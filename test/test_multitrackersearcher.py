@@ -0,0 +1,67 @@
+import asyncio
+import unittest
+
+from fast_torrent_trackers.basetracker import BaseTracker
+from fast_torrent_trackers.exceptions import LoginRequired
+from fast_torrent_trackers.models import TorrentInfo
+from fast_torrent_trackers.multitrackersearcher import MultiTrackerSearcher, SiteSearchStatus
+
+
+class FakeTracker(BaseTracker):
+    def __init__(self, site_id, delay, error=None):
+        self.site_config = {'id': site_id, 'name': site_id, 'category_mappings': []}
+        self.category_mappings = []
+        self.delay = delay
+        self.error = error
+
+    async def get_userinfo(self, refresh=False):
+        return
+
+    async def search(self, keyword=None, imdb_id=None, cate_level1_list: list = None, free: bool = False,
+                     page: int = None, timeout=None):
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        t = TorrentInfo()
+        t.id = 1
+        t.site_id = self.get_id()
+        t.name = keyword
+        return [t]
+
+    async def download(self, url, filepath):
+        pass
+
+
+class TestMultiTrackerSearcher(unittest.TestCase):
+    query = [{'key': 'keyword', 'value': 'test', 'value_type': 'cn_name'}]
+
+    def test_stream_in_finish_order(self):
+        trackers = [FakeTracker('slow', 0.2), FakeTracker('fast', 0.01), FakeTracker('middle', 0.1)]
+
+        async def run():
+            searcher = MultiTrackerSearcher(trackers, query=self.query, max_concurrency=3)
+            return [r['site_id'] async for r in searcher.iter_search()]
+
+        self.assertEqual(['fast', 'middle', 'slow'], asyncio.run(run()))
+
+    def test_deadline_returns_partial_results(self):
+        trackers = [FakeTracker('fast', 0.01), FakeTracker('hang', 10),
+                    FakeTracker('login', 0.01, LoginRequired('login', 'login', 'login')),
+                    FakeTracker('broken', 0.01, RuntimeError('broken'))]
+        searcher = MultiTrackerSearcher(trackers, query=self.query, deadline=0.3)
+        r = asyncio.run(searcher.search())
+        self.assertEqual(0, r['code'])
+        self.assertEqual(['fast'], [t.site_id for t in r['data']])
+        status = {s['site_id']: s['status'] for s in r['sites']}
+        self.assertEqual(SiteSearchStatus.Success, status['fast'])
+        self.assertEqual(SiteSearchStatus.Timeout, status['hang'])
+        self.assertEqual(SiteSearchStatus.LoginRequired, status['login'])
+        self.assertEqual(SiteSearchStatus.Error, status['broken'])
+        self.assertLess(searcher.get_run_time(), 1)
+
+    def test_concurrency_cap(self):
+        trackers = [FakeTracker(str(i), 0.1) for i in range(4)]
+        searcher = MultiTrackerSearcher(trackers, query=self.query, max_concurrency=2)
+        r = asyncio.run(searcher.search())
+        self.assertEqual(4, len(r['data']))
+        self.assertGreaterEqual(searcher.get_run_time(), 0.2)
@@ -0,0 +1,43 @@
+import datetime
+import unittest
+
+from fast_torrent_trackers.normalize import Normalizer, parse_datetime, size_to_mb
+from fast_torrent_trackers.utils import DictWrapper, trans_size_str_to_mb
+
+SIZES = ['1.5 GB', '1,024.25 MB', '700MiB', '3.2TiB', '12 KB', '0.5 PB', '1.37 GiB', '1. GB', '2 XB', '1,5 GB',
+         '1.5', '', '0', 'GB', '1.5 GB extra', 'abc GB', '1 2 GB', ' 1.5 GB']
+NUMBERS = [None, 0, 12, '12', '1,234', ' 7 ', '1.5', '', 'abc', True, 3.0, '-3', '1e3']
+DATES = ['2022-10-18 19:58:00', '2022-1-8 09:05:00', '2022-02-30 10:00:00', '2022-10-18  19:58:00',
+         '2022-10-18 24:00:00', '2022-10-18 19:58:60', '2022-00-18 19:58:00', '2022-10-18T19:58:00', '2022-10-18']
+FORMATS = ['%Y-%m-%d %H:%M:%S', '%Y-%m-%d%H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d']
+
+
+def outcome(func, *args):
+    try:
+        return func(*args)
+    except Exception as e:
+        return type(e)
+
+
+class TestNormalize(unittest.TestCase):
+    def test_size_same_as_before(self):
+        normalizer = Normalizer()
+        for size in SIZES:
+            expected = outcome(trans_size_str_to_mb, size)
+            self.assertEqual(expected, outcome(size_to_mb, size), size)
+            self.assertEqual(expected, outcome(normalizer.size_mb, size), size)
+        self.assertEqual(0.0, normalizer.size_mb(None))
+
+    def test_numbers_same_as_before(self):
+        normalizer = Normalizer()
+        for _ in range(2):
+            for value in NUMBERS:
+                item = DictWrapper({'v': value})
+                self.assertEqual(item.get_int('v', -1), normalizer.to_int(value, -1), value)
+                self.assertEqual(item.get_float('v', -1.0), normalizer.to_float(value, -1.0), value)
+
+    def test_dates_same_as_before(self):
+        for fmt in FORMATS:
+            for value in DATES + ['2022-10-1819:58:00', '2022-10-18 19:58']:
+                self.assertEqual(outcome(datetime.datetime.strptime, value, fmt), outcome(parse_datetime, value, fmt),
+                                 (value, fmt))
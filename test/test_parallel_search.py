@@ -0,0 +1,130 @@
+import asyncio
+import os
+import time
+import unittest
+
+import httpx
+import yaml
+
+from fast_torrent_trackers.exceptions import RateLimitException, RequestOverloadException
+from fast_torrent_trackers.ratelimiter import AdaptiveRateLimiter, AsyncRateLimiter
+from fast_torrent_trackers.tracker.spidertracker import SpiderTracker
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'trackers_config')
+PAGE = '<html><body><table id="info_block"><tr><td><a href="userdetails.php?id=1">user</a>' \
+       '<a href="logout.php">logout</a></td></tr></table></body></html>'
+
+
+def load_config(site_id):
+    with open(os.path.join(CONFIG_DIR, f'{site_id}.yml'), 'r', encoding='utf-8') as file:
+        return yaml.safe_load(file)
+
+
+class SlowSiteTracker(SpiderTracker):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.transport = httpx.MockTransport(self.handle)
+
+    async def handle(self, request):
+        self.requests.append(request.url.path)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.1)
+        self.in_flight -= 1
+        return httpx.Response(200, text=PAGE, headers={'content-type': 'text/html'})
+
+
+class TestParallelSearch(unittest.TestCase):
+    def test_paths_run_concurrently(self):
+        self.assertFalse(SlowSiteTracker(load_config('mteam'), 'c_secure_uid=1').parallel_search)
+        config = load_config('mteam')
+        config['search']['parallel'] = {'max_concurrency': 3}
+        config['rate_limit']['search'] = {'rate': 3, 'per': 1, 'burst': 3}
+        tracker = SlowSiteTracker(config, 'c_secure_uid=1')
+        self.assertTrue(tracker.parallel_search)
+        start = time.perf_counter()
+        r = asyncio.run(tracker.search(keyword='test', cate_level1_list=None))
+        self.assertEqual([], r)
+        self.assertLess(time.perf_counter() - start, 1)
+        self.assertEqual(['/torrents.php', '/adult.php', '/music.php'], tracker.requests)
+        self.assertEqual(3, tracker.max_in_flight)
+
+    def test_concurrency_limit(self):
+        config = load_config('mteam')
+        config['search']['parallel'] = {'max_concurrency': 1}
+        config['rate_limit']['search'] = {'rate': 100, 'per': 1}
+        tracker = SlowSiteTracker(config, 'c_secure_uid=1')
+        self.assertEqual((100, 1), (tracker.search_limiter.rate, tracker.search_limiter.per))
+        start = time.perf_counter()
+        asyncio.run(tracker.search(keyword='test'))
+        # 速率足够时只受同时请求数限制，3个path逐个请求，每个0.1秒
+        self.assertAlmostEqual(0.3, time.perf_counter() - start, delta=0.15)
+        self.assertEqual(1, tracker.max_in_flight)
+        self.assertEqual(3, len(tracker.requests))
+
+    def test_search_rate_single_key(self):
+        config = load_config('mteam')
+        config['search']['parallel'] = {'max_concurrency': 3}
+        config['rate_limit']['search'] = {'rate': 5, 'per': 1, 'burst': 1}
+        tracker = SlowSiteTracker(config, 'c_secure_uid=1')
+        start = time.perf_counter()
+        asyncio.run(tracker.search(keyword='test'))
+        # 3个path可以同时请求，但每0.2秒才发出一个：第一个立即发出，最后一个在0.4秒发出
+        self.assertAlmostEqual(0.5, time.perf_counter() - start, delta=0.15)
+        config['search']['parallel'] = {'max_concurrency': 3, 'rate': 100}
+        with self.assertRaises(ValueError):
+            SlowSiteTracker(config, 'c_secure_uid=1')
+
+    def test_rate_limiter(self):
+        limiter = AsyncRateLimiter(10, 1, burst=2)
+
+        async def run():
+            start = time.perf_counter()
+            for i in range(4):
+                await limiter.acquire()
+            return time.perf_counter() - start
+
+        # 2个突发，后面两个各等0.1秒
+        self.assertAlmostEqual(0.2, asyncio.run(run()), delta=0.08)
+
+    def test_adaptive_rate_limiter(self):
+        limiter = AdaptiveRateLimiter(4, 1, burst=10, min_rate=1, increase=1)
+
+        async def request(error=None):
+            async with limiter:
+                if error:
+                    raise error
+
+        async def run():
+            with self.assertRaises(RateLimitException):
+                await request(RateLimitException())
+            self.assertEqual(2, limiter.rate)
+            await request()
+            await request()
+            await request()
+            # 没有配置max_rate时恢复到初始速率后不再增加
+            self.assertEqual(4, limiter.rate)
+            with self.assertRaises(RequestOverloadException):
+                await request(RequestOverloadException('负载过高', 'mteam', '馒头', 0.3))
+            self.assertEqual(2, limiter.rate)
+            start = time.perf_counter()
+            await limiter.acquire()
+            return time.perf_counter() - start
+
+        self.assertAlmostEqual(0.3, asyncio.run(run()), delta=0.1)
+
+    def test_site_rate_limit_config(self):
+        config = load_config('hdsky')
+        tracker = SlowSiteTracker(config, 'c_secure_uid=1')
+        # rate_limit.download和request_interval.download的平均间隔一致，搜索没有配置时平均4秒一次
+        self.assertEqual((1, 7.5), (tracker.download_limiter.rate, tracker.download_limiter.per))
+        self.assertEqual((1, 4), (tracker.search_limiter.rate, tracker.search_limiter.per))
+        # 没有配置max_rate时不会超过配置的速率
+        self.assertEqual(1, tracker.search_limiter.max_rate)
+        config['rate_limit'] = {'search': {'rate': 2, 'per': 10, 'max_rate': 4}}
+        tracker = SlowSiteTracker(config, 'c_secure_uid=1')
+        self.assertEqual((2, 10, 4), (tracker.search_limiter.rate, tracker.search_limiter.per,
+                                      tracker.search_limiter.max_rate))
@@ -0,0 +1,72 @@
+import asyncio
+import os
+import pickle
+import unittest
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import httpx
+import yaml
+
+from fast_torrent_trackers.exceptions import LoginRequired, RequestOverloadException
+from fast_torrent_trackers.tracker.spidertracker import SpiderTracker
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'trackers_config')
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def load_config(site_id):
+    with open(os.path.join(CONFIG_DIR, f'{site_id}.yml'), 'r', encoding='utf-8') as file:
+        return yaml.safe_load(file)
+
+
+def load_fixture(site_id, page):
+    with open(os.path.join(FIXTURE_DIR, site_id, f'{page}.html'), 'r', encoding='utf-8') as file:
+        return file.read()
+
+
+class FixtureTracker(SpiderTracker):
+    page_text = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.transport = httpx.MockTransport(
+            lambda request: httpx.Response(200, text=self.page_text, headers={'content-type': 'text/html'}))
+
+
+def search(page_text, **kwargs):
+    config = load_config('mteam')
+    # 只比较解析结果，不按站点真实的限速等待
+    config['rate_limit'] = {'search': {'rate': 1000}}
+
+    async def run():
+        async with FixtureTracker(config, 'c_secure_uid=1', **kwargs) as tracker:
+            tracker.page_text = page_text
+            torrents = await tracker.search(keyword='test')
+            return tracker.userinfo, [(t.id, t.name, t.size_mb, t.cate_level1, t.download_volume_factor)
+                                      for t in torrents]
+
+    return asyncio.run(run())
+
+
+class TestParseExecutor(unittest.TestCase):
+    def test_exceptions_picklable(self):
+        e = pickle.loads(pickle.dumps(LoginRequired('mteam', '馒头', '馒头登陆失败！')))
+        self.assertEqual(('mteam', '馒头', '馒头登陆失败！'), (e.site_id, e.site_name, str(e)))
+        e = pickle.loads(pickle.dumps(RequestOverloadException('负载过高', 'mteam', '馒头', 120)))
+        self.assertEqual(('负载过高', 'mteam', '馒头', 120), (str(e), e.site_id, e.site_name, e.stop_secs))
+
+    def test_same_result_as_inline(self):
+        page_text = load_fixture('mteam', 'search')
+        expected = search(page_text)
+        # mteam配置了3个搜索path，每个path都返回同一页
+        self.assertEqual(150, len(expected[1]))
+        with ThreadPoolExecutor(2) as executor:
+            self.assertEqual(expected, search(page_text, parse_executor=executor))
+        with ProcessPoolExecutor(2) as executor:
+            self.assertEqual(expected, search(page_text, parse_executor=executor, parser_backend='lxml'))
+
+    def test_login_required_from_worker(self):
+        with ProcessPoolExecutor(1) as executor:
+            with self.assertRaises(LoginRequired) as ctx:
+                search('<html><body>请登录</body></html>', parse_executor=executor)
+        self.assertEqual('mteam', ctx.exception.site_id)
@@ -0,0 +1,104 @@
+import asyncio
+import os
+import time
+import unittest
+
+import yaml
+
+from fast_torrent_trackers.models import TorrentInfo
+from fast_torrent_trackers.queryplanner import is_single_term, match_any_keyword, plan_queries
+from fast_torrent_trackers.tracker.spidertracker import SpiderTracker
+from fast_torrent_trackers.trackersearcher import TrackerSearcher
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'trackers_config')
+
+
+def torrent(torrent_id, name, subject=''):
+    t = TorrentInfo()
+    t.site_id = 'fake'
+    t.id = torrent_id
+    t.name = name
+    t.subject = subject
+    return t
+
+
+class FakeTracker:
+    def __init__(self, keyword_or, delay=0.1):
+        self.keyword_or = keyword_or
+        self.delay = delay
+        self.calls = []
+
+    def get_id(self):
+        return 'fake'
+
+    def get_name(self):
+        return 'fake'
+
+    async def search(self, keyword=None, imdb_id=None, cate_level1_list=None, timeout=None):
+        self.calls.append(keyword or imdb_id)
+        await asyncio.sleep(self.delay)
+        return [torrent(keyword or imdb_id, keyword or imdb_id)]
+
+    async def search_any(self, keywords, cate_level1_list=None, timeout=None):
+        self.calls.append(tuple(keywords))
+        await asyncio.sleep(self.delay)
+        return [torrent(100 + i, k) for i, k in enumerate(keywords)]
+
+
+QUERY = [
+    {'key': 'keyword', 'value': '流浪地球', 'value_type': 'cn_name'},
+    {'key': 'keyword', 'value': 'The Wandering Earth', 'value_type': 'en_name'},
+    {'key': 'keyword', 'value': 'Avatar', 'value_type': 'original_name'},
+    {'key': 'imdb_id', 'value': 'tt7605074'},
+]
+
+
+class TestQueryPlanner(unittest.TestCase):
+    def test_plan(self):
+        self.assertTrue(is_single_term('流浪地球'))
+        self.assertTrue(is_single_term('Avatar'))
+        self.assertFalse(is_single_term('The.Wandering.Earth'))
+        steps = plan_queries(QUERY, keyword_or=True)
+        self.assertEqual([['流浪地球', 'Avatar'], ['The Wandering Earth'], ['tt7605074']],
+                         [[q['value'] for q in step] for step in steps])
+        self.assertEqual(4, len(plan_queries(QUERY, keyword_or=False)))
+
+    def test_match_any_keyword(self):
+        torrents = [
+            torrent(1, 'The.Wandering.Earth.2019.1080p', '流浪地球'),
+            torrent(2, 'Avatar.2009.2160p'),
+            # "或"搜索按词匹配，只命中部分词的种子要过滤掉
+            torrent(3, 'Earth.Documentary.2020'),
+        ]
+        self.assertEqual([1, 2], [t.id for t in match_any_keyword(torrents, ['流浪地球', 'avatar'])])
+        self.assertEqual([1], [t.id for t in match_any_keyword(torrents, ['The Wandering Earth'])])
+
+    def test_searcher(self):
+        async def run(tracker, interval_secs=None):
+            searcher = TrackerSearcher(tracker, query=QUERY)
+            searcher.interval_secs = interval_secs
+            start = time.perf_counter()
+            r = await searcher.search()
+            return r, time.perf_counter() - start
+
+        tracker = FakeTracker(keyword_or=True)
+        r, elapsed = asyncio.run(run(tracker))
+        self.assertEqual(0, r['code'])
+        self.assertEqual([('流浪地球', 'Avatar'), 'The Wandering Earth', 'tt7605074'], tracker.calls)
+        self.assertEqual(4, len(r['data']))
+        # 三次请求并发执行
+        self.assertLess(elapsed, 0.25)
+
+        tracker = FakeTracker(keyword_or=False)
+        r, elapsed = asyncio.run(run(tracker, interval_secs=0.05))
+        self.assertEqual(['流浪地球', 'The Wandering Earth', 'Avatar', 'tt7605074'], tracker.calls)
+        self.assertGreater(elapsed, 0.5)
+
+    def test_render_or_query(self):
+        with open(os.path.join(CONFIG_DIR, 'mteam.yml'), 'r', encoding='utf-8') as file:
+            tracker = SpiderTracker(yaml.safe_load(file), 'c_secure_uid=1', user_agent='test')
+        self.assertTrue(tracker.keyword_or)
+        _, query = tracker.__build_path_queries__('流浪地球 Avatar', match_any=True)[0]
+        self.assertIn('search_mode=1', tracker.__render_querystring__(query))
+        _, query = tracker.__build_path_queries__('流浪地球')[0]
+        self.assertIn('search_mode=0', tracker.__render_querystring__(query))
@@ -0,0 +1,158 @@
+import asyncio
+import datetime
+import json
+import os
+import unittest
+from urllib.parse import parse_qs
+
+import httpx
+import yaml
+
+from fast_torrent_trackers.models import TorrentInfo
+from fast_torrent_trackers.resultfilters import HdchinaPromotionEnricher, ResultEnricher, parse_hdchina_promotion
+from fast_torrent_trackers.tracker.spidertracker import SpiderTracker
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'trackers_config')
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+PAGE = '<html><head><meta name="x-csrf" content="token"/></head></html>'
+
+
+def torrent(torrent_id):
+    t = TorrentInfo()
+    t.site_id = 'hdchina'
+    t.id = torrent_id
+    t.download_volume_factor = 1.0
+    t.upload_volume_factor = 1.0
+    return t
+
+
+class PromotionServer:
+    def __init__(self, promotions):
+        self.promotions = promotions
+        self.requests = []
+
+    def handle(self, request: httpx.Request):
+        form = parse_qs(request.content.decode())
+        ids = form['ids[]']
+        self.requests.append((ids, form['csrf'][0]))
+        message = dict((i, self.promotions[i]) for i in ids if i in self.promotions)
+        return httpx.Response(200, text=json.dumps({'message': message}))
+
+
+class RecordingEnricher(ResultEnricher):
+    def __init__(self):
+        self.search_rates = []
+
+    async def enrich(self, tracker, search_html_text, torrents):
+        self.search_rates.append(tracker.search_limiter.rate)
+
+
+def load_config():
+    with open(os.path.join(CONFIG_DIR, 'hdchina.yml'), 'r', encoding='utf-8') as file:
+        return yaml.safe_load(file)
+
+
+def build(promotions):
+    tracker = SpiderTracker(load_config(), 'uid=1', user_agent='test')
+    server = PromotionServer(promotions)
+    tracker.transport = httpx.MockTransport(server.handle)
+    return tracker, server
+
+
+class TestResultFilters(unittest.TestCase):
+    def test_parse_promotion(self):
+        promotion = parse_hdchina_promotion({'sp_state': 'pro_free', 'timeout': '<span>2030-01-02 03:04:05</span>'})
+        self.assertEqual({'download_volume_factor': 0.0, 'free_deadline': datetime.datetime(2030, 1, 2, 3, 4, 5)},
+                         promotion)
+        # 免费没有截止时间时按不免费处理
+        self.assertEqual({'download_volume_factor': 1.0},
+                         parse_hdchina_promotion({'sp_state': 'pro_free', 'timeout': ''}))
+        self.assertEqual({'upload_volume_factor': 2}, parse_hdchina_promotion({'sp_state': 'pro_2up', 'timeout': ''}))
+
+    def test_batch_and_cache(self):
+        tracker, server = build({
+            '1': {'sp_state': 'pro_free', 'timeout': '2030-01-02 03:04:05'},
+            '2': {'sp_state': 'pro_50pctdown', 'timeout': ''},
+            '3': {'sp_state': 'pro_2up', 'timeout': ''},
+        })
+        self.assertIsInstance(tracker.result_enricher, HdchinaPromotionEnricher)
+
+        async def run():
+            async with tracker:
+                # 两个并发搜索的页面合并成一次查询，重复的编号只查一次
+                pages = [[torrent(1), torrent(2)], [torrent(2), torrent(3), torrent(4)]]
+                await asyncio.gather(*[tracker.result_enricher.enrich(tracker, PAGE, p) for p in pages])
+                again = [torrent(1), torrent(3), torrent(4)]
+                await tracker.result_enricher.enrich(tracker, PAGE, again)
+                return pages, again
+
+        pages, again = asyncio.run(run())
+        self.assertEqual([(['1', '2', '3', '4'], 'token')], server.requests)
+        self.assertEqual([0.0, 0.5], [t.download_volume_factor for t in pages[0]])
+        self.assertEqual(datetime.datetime(2030, 1, 2, 3, 4, 5), pages[0][0].free_deadline)
+        self.assertEqual([0.5, 1.0, 1.0], [t.download_volume_factor for t in pages[1]])
+        self.assertEqual([1.0, 2, 1.0], [t.upload_volume_factor for t in pages[1]])
+        # 都命中缓存，没有再请求
+        self.assertEqual([0.0, 1.0, 1.0], [t.download_volume_factor for t in again])
+        self.assertEqual(2, again[1].upload_volume_factor)
+
+    def test_expired_deadline_not_cached(self):
+        tracker, server = build({'1': {'sp_state': 'pro_free', 'timeout': '2020-01-01 00:00:00'}})
+
+        async def run():
+            async with tracker:
+                for _ in range(2):
+                    await tracker.result_enricher.enrich(tracker, PAGE, [torrent(1)])
+
+        asyncio.run(run())
+        self.assertEqual(2, len(server.requests))
+
+    def test_cancelled_caller(self):
+        tracker, server = build({'1': {'sp_state': 'pro_free', 'timeout': '2030-01-02 03:04:05'}})
+
+        async def run():
+            async with tracker:
+                first = asyncio.ensure_future(tracker.result_enricher.enrich(tracker, PAGE, [torrent(1)]))
+                second_torrents = [torrent(1)]
+                second = asyncio.ensure_future(tracker.result_enricher.enrich(tracker, PAGE, second_torrents))
+                await asyncio.sleep(0)
+                # 比如MultiTrackerSearcher到了截止时间取消还没结束的站点
+                first.cancel()
+                await second
+                return first, second_torrents
+
+        first, torrents = asyncio.run(run())
+        self.assertTrue(first.cancelled())
+        self.assertEqual(0.0, torrents[0].download_volume_factor)
+        self.assertEqual(1, len(server.requests))
+
+    def test_enrich_outside_search_limiter(self):
+        config = load_config()
+        config['rate_limit'] = {'search': {'rate': 100, 'max_rate': 200}}
+        tracker = SpiderTracker(config, 'uid=1', user_agent='test')
+        tracker.result_enricher = enricher = RecordingEnricher()
+        with open(os.path.join(FIXTURE_DIR, 'hdchina', 'search.html'), 'r', encoding='utf-8') as file:
+            page = file.read()
+        tracker.transport = httpx.MockTransport(
+            lambda request: httpx.Response(200, text=page, headers={'content-type': 'text/html'}))
+
+        async def run():
+            async with tracker:
+                return await tracker.search(keyword='test')
+
+        self.assertTrue(asyncio.run(run()))
+        # 补充阶段开始时已经退出搜索限流器，这个path的成功反馈已经生效
+        self.assertTrue(enricher.search_rates)
+        self.assertTrue(all(rate > 100 for rate in enricher.search_rates))
+
+    def test_request_error(self):
+        tracker, _ = build({})
+        tracker.transport = httpx.MockTransport(lambda request: httpx.Response(500, text='error'))
+
+        async def run():
+            async with tracker:
+                await tracker.result_enricher.enrich(tracker, PAGE, [torrent(1)])
+
+        with self.assertRaises(ValueError):
+            asyncio.run(run())
+        self.assertEqual({}, tracker.result_enricher._inflight)
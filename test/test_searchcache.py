@@ -0,0 +1,133 @@
+import asyncio
+import unittest
+
+from fast_torrent_trackers.basetracker import BaseTracker
+from fast_torrent_trackers.models import TorrentInfo, CateLevel1
+from fast_torrent_trackers.searchcache import SearchCache, cached_search
+
+
+class CountingTracker(BaseTracker):
+    def __init__(self, site_id, search_cache=None, cache_config=None):
+        self.site_config = {'id': site_id, 'name': site_id, 'category_mappings': [],
+                            'search': {'cache': cache_config} if cache_config else {}}
+        self.category_mappings = []
+        self.search_cache = search_cache
+        self.calls = 0
+        self.error = None
+
+    async def get_userinfo(self, refresh=False):
+        return
+
+    @cached_search
+    async def search(self, keyword=None, imdb_id=None, cate_level1_list: list = None, free: bool = False,
+                     page: int = None, timeout=None):
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        if self.error:
+            raise self.error
+        t = TorrentInfo()
+        t.id = self.calls
+        t.site_id = self.get_id()
+        t.name = keyword
+        return [t]
+
+    async def download(self, url, filepath):
+        pass
+
+
+class TestSearchCache(unittest.TestCase):
+    def test_hit_and_key(self):
+        cache = SearchCache(ttl=60)
+        tracker = CountingTracker('mteam', cache)
+
+        async def run():
+            await tracker.search('复仇者联盟', cate_level1_list=[CateLevel1.Movie, CateLevel1.TV])
+            r = await tracker.search(keyword='复仇者联盟', cate_level1_list=[CateLevel1.TV, CateLevel1.Movie])
+            self.assertEqual(1, r[0].id)
+            # 免费、页码不同都是不同的查询
+            await tracker.search('复仇者联盟', free=True)
+            await tracker.search('复仇者联盟', page=2)
+
+        asyncio.run(run())
+        self.assertEqual(3, tracker.calls)
+        stats = cache.stats()
+        self.assertEqual((1, 3, 3), (stats['hits'], stats['misses'], stats['size']))
+
+    def test_concurrent_misses_request_once(self):
+        cache = SearchCache(ttl=60)
+        tracker = CountingTracker('mteam', cache)
+
+        async def run():
+            return await asyncio.gather(*[tracker.search('test') for i in range(5)])
+
+        results = asyncio.run(run())
+        self.assertEqual(1, tracker.calls)
+        self.assertEqual([1] * 5, [r[0].id for r in results])
+
+    def test_results_are_copies(self):
+        cache = SearchCache(ttl=60)
+        tracker = CountingTracker('mteam', cache)
+
+        async def run():
+            first = await tracker.search('test')
+            # 调用方就地修改种子（比如补充促销状态）不影响缓存里的结果
+            first[0].download_volume_factor = 0.0
+            return first, await tracker.search('test')
+
+        first, second = asyncio.run(run())
+        self.assertEqual(1, tracker.calls)
+        self.assertEqual(1, second[0].id)
+        self.assertIsNot(first[0], second[0])
+        self.assertNotEqual(0.0, getattr(second[0], 'download_volume_factor', None))
+
+    def test_stale_while_revalidate(self):
+        cache = SearchCache(ttl=0.1, stale_ttl=10)
+        tracker = CountingTracker('mteam', cache)
+
+        async def run():
+            await tracker.search('test')
+            await asyncio.sleep(0.15)
+            # 旧结果直接返回，同时后台刷新
+            r = await tracker.search('test')
+            self.assertEqual(1, r[0].id)
+            await asyncio.sleep(0.1)
+            r = await tracker.search('test')
+            self.assertEqual(2, r[0].id)
+            # 刷新失败时继续返回旧结果
+            tracker.error = RuntimeError('站点挂了')
+            await asyncio.sleep(0.15)
+            self.assertEqual(2, (await tracker.search('test'))[0].id)
+            await asyncio.sleep(0.1)
+
+        asyncio.run(run())
+        stats = cache.stats()
+        self.assertEqual(3, tracker.calls)
+        self.assertEqual((2, 2, 1), (stats['stale_hits'], stats['refreshes'], stats['refresh_errors']))
+
+    def test_site_ttl(self):
+        cache = SearchCache(ttl=60, site_ttls={'nocache': 0})
+        no_cache = CountingTracker('nocache', cache)
+        configured = CountingTracker('hdsky', cache, cache_config={'ttl': 0})
+
+        async def run():
+            for i in range(2):
+                await no_cache.search('test')
+                await configured.search('test')
+
+        asyncio.run(run())
+        self.assertEqual((2, 2), (no_cache.calls, configured.calls))
+        self.assertEqual(0, cache.stats()['size'])
+
+    def test_invalidate(self):
+        cache = SearchCache(ttl=60)
+        trackers = [CountingTracker('mteam', cache), CountingTracker('hdsky', cache)]
+
+        async def run():
+            for t in trackers:
+                await t.search('test')
+            cache.invalidate('mteam')
+            for t in trackers:
+                await t.search('test')
+
+        asyncio.run(run())
+        self.assertEqual([2, 1], [t.calls for t in trackers])
@@ -0,0 +1,117 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+import yaml
+from tenacity import stop_after_attempt
+
+from fast_torrent_trackers.exceptions import LoginRequired, RateLimitException, RequestOverloadException
+from fast_torrent_trackers.simulator import FaultConfig, LatencyRecorder, FixtureReplayer, TORRENT_CONTENT
+from fast_torrent_trackers.tracker.spidertracker import SpiderTracker
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'trackers_config')
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def build(site_id, **faults):
+    with open(os.path.join(CONFIG_DIR, 'mteam.yml'), 'r', encoding='utf-8') as file:
+        site_config = yaml.safe_load(file)
+    site_config['id'] = site_id
+    # 不按站点真实的限速等待，限流相关的用例检查限流器的状态
+    site_config['rate_limit'] = {'search': {'rate': 1000, 'burst': 3}, 'download': {'rate': 1000}}
+    with open(os.path.join(FIXTURE_DIR, 'mteam', 'search.html'), 'r', encoding='utf-8') as file:
+        simulator = FixtureReplayer(site_config, file.read(), faults=FaultConfig(**faults))
+    tracker = SpiderTracker(site_config, 'c_secure_uid=1', user_agent='test', parallel_search=True,
+                            parser_backend='lxml')
+    return simulator.attach(tracker), simulator
+
+
+def download_once(tracker, url, filepath):
+    return SpiderTracker.download.retry_with(stop=stop_after_attempt(1))(tracker, url, filepath)
+
+
+class TestSimulator(unittest.TestCase):
+    def test_search_and_download(self):
+        async def run():
+            async with tracker:
+                torrents = await tracker.search(keyword='test')
+                with tempfile.TemporaryDirectory() as tmp:
+                    filepath = os.path.join(tmp, 'a.torrent')
+                    await download_once(tracker, torrents[0].download_url, filepath)
+                    with open(filepath, 'rb') as file:
+                        return torrents, file.read()
+
+        tracker, simulator = build('sim-ok', download_notice=1.0)
+        torrents, content = asyncio.run(run())
+        # mteam配置了3个搜索path
+        self.assertEqual(150, len(torrents))
+        self.assertEqual(TORRENT_CONTENT, content)
+        self.assertEqual({'requests': 5, 'search': 3, 'download': 1, 'download_notice': 1, 'download_confirm': 1},
+                         simulator.stats)
+
+    def test_fault_pages(self):
+        async def search(tracker):
+            async with tracker:
+                return await tracker.search(keyword='test')
+
+        with self.assertRaises(RequestOverloadException):
+            asyncio.run(search(build('sim-overload', overload=1.0)[0]))
+        with self.assertRaises(LoginRequired):
+            asyncio.run(search(build('sim-cf', cloudflare=1.0)[0]))
+
+        async def download(tracker):
+            async with tracker:
+                await download_once(tracker, 'https://kp.m-team.cc/download.php?id=1', os.devnull)
+
+        with self.assertRaises(RateLimitException):
+            asyncio.run(download(build('sim-limit', rate_limit=1.0)[0]))
+
+    def test_stream_search(self):
+        async def run(tracker):
+            async with tracker:
+                await tracker.get_userinfo()
+                buffered = await tracker.search(keyword='test')
+                tracker.stream_parse = True
+                streamed = await tracker.search(keyword='test')
+                first = None
+                # 前面的搜索已经把速率升到上限，降下来看产出前是否收到成功反馈
+                rate = tracker.search_limiter.rate = tracker.search_limiter.min_rate
+                async for torrent in tracker.iter_search(keyword='test'):
+                    first = torrent
+                    # 产出种子时已经退出限流器，成功反馈已经生效
+                    self.assertGreater(tracker.search_limiter.rate, rate)
+                    break
+                return buffered, streamed, first
+
+        tracker, simulator = build('sim-stream')
+        buffered, streamed, first = asyncio.run(run(tracker))
+        self.assertEqual(150, len(streamed))
+        self.assertEqual([t.id for t in buffered], [t.id for t in streamed])
+        self.assertEqual(buffered[0].id, first.id)
+
+        # 没有种子行的提示页面收完后按整页检查
+        async def limited(tracker):
+            async with tracker:
+                await tracker.get_userinfo()
+                tracker.stream_parse = True
+                return await tracker.search(keyword='test')
+
+        with self.assertRaises(RateLimitException):
+            asyncio.run(limited(build('sim-stream-limit', rate_limit=1.0)[0]))
+
+    def test_latency_recorder(self):
+        recorder = LatencyRecorder()
+        recorder.start()
+        for i in range(1, 101):
+            recorder.attempts += 1
+            recorder.record(i / 1000)
+        recorder.attempts += 10
+        recorder.record(1, RateLimitException('limit'))
+        recorder.finish()
+        summary = recorder.summary()
+        self.assertEqual(101, summary['count'])
+        self.assertEqual({'RateLimitException': 1}, summary['errors'])
+        self.assertEqual(0.051, summary['p50'])
+        self.assertEqual(1, summary['max'])
+        self.assertAlmostEqual(110 / 101, summary['retry_amplification'])
@@ -0,0 +1,60 @@
+import datetime
+import os
+import pickle
+import unittest
+
+import yaml
+
+from fast_torrent_trackers.models import CompactTorrentInfo, CompactTrackerUserinfo, TorrentInfo, TrackerUserinfo
+from fast_torrent_trackers.torrentbatch import TorrentBatch
+from fast_torrent_trackers.tracker.spidertracker import TrackerParser
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'trackers_config')
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def load_torrents(site_id):
+    with open(os.path.join(CONFIG_DIR, f'{site_id}.yml'), 'r', encoding='utf-8') as file:
+        site_config = yaml.safe_load(file)
+    with open(os.path.join(FIXTURE_DIR, site_id, 'search.html'), 'r', encoding='utf-8') as file:
+        html_text = file.read()
+    parser = TrackerParser(site_config, 'lxml')
+    return parser.parse_torrents(html_text, {'userinfo': parser.parse_userinfo(html_text)})
+
+
+class TestTorrentBatch(unittest.TestCase):
+    def test_compact_models(self):
+        t = load_torrents('mteam')[0]
+        c = CompactTorrentInfo.from_object(t)
+        for name in CompactTorrentInfo.__slots__:
+            self.assertEqual(getattr(t, name), getattr(c, name), name)
+        self.assertFalse(hasattr(c, '__dict__'))
+        with self.assertRaises(AttributeError):
+            c.name = 'changed'
+        self.assertEqual(c, pickle.loads(pickle.dumps(c)))
+        self.assertEqual(hash(c), hash(CompactTorrentInfo.from_object(t)))
+
+        user = TrackerUserinfo()
+        user.uid = 1
+        user.username = 'test'
+        u = CompactTrackerUserinfo.from_object(user)
+        self.assertEqual((1, 'test', False, None), (u.uid, u.username, u.vip_group, u.seeding))
+
+    def test_batch_round_trip(self):
+        torrents = load_torrents('mteam') + load_torrents('hdsky') + load_torrents('totheglory')
+        t = TorrentInfo()
+        t.id = 1
+        t.site_id = 'demo'
+        t.free_deadline = datetime.datetime.max
+        torrents.append(t)
+        batch = TorrentBatch(torrents)
+        self.assertEqual(len(torrents), len(batch))
+        for i, t in enumerate(torrents):
+            self.assertEqual(CompactTorrentInfo.from_object(t), batch[i])
+        self.assertEqual(batch[len(batch) - 1], batch[-1])
+        self.assertEqual(datetime.datetime.max, batch[-1].free_deadline)
+        self.assertIsNone(batch[-1].upload_count)
+        self.assertIsNone(batch[-1].size_mb)
+        self.assertEqual([t.id for t in torrents], list(batch.column('id')))
+        self.assertEqual({'mteam', 'hdsky', 'ttg', 'demo'}, set(batch.column('site_id')))
+        self.assertRaises(IndexError, batch.__getitem__, len(batch))
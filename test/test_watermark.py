@@ -0,0 +1,95 @@
+import asyncio
+import datetime
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from fast_torrent_trackers.basetracker import BaseTracker
+from fast_torrent_trackers.models import TorrentInfo
+from fast_torrent_trackers.tracker.spidertracker import TrackerParser
+from fast_torrent_trackers.trackersearcher import TrackerSearcher
+from fast_torrent_trackers.watermark import Watermark, WatermarkStore
+
+SITE_CONFIG = {
+    'id': 'demo',
+    'name': 'demo',
+    'domain': 'https://demo.org/',
+    'category_mappings': [],
+    'torrents': {
+        'list': {'selector': 'tr.row'},
+        'fields': {
+            'id': {'selector': 'a[href^="details.php?id="]', 'attribute': 'href',
+                   'filters': [{'name': 're_search', 'args': ['\\d+', 0]}]},
+            'title': {'selector': 'a[href^="details.php?id="]'},
+        }
+    }
+}
+
+
+def build_page(ids):
+    rows = ''.join(f'<tr class="row"><td><a href="details.php?id={i}">t{i}</a></td></tr>' for i in ids)
+    return f'<html><body><table>{rows}</table></body></html>'
+
+
+class ListTracker(BaseTracker):
+    def __init__(self):
+        self.site_config = {'id': 'demo', 'name': 'demo', 'category_mappings': []}
+        self.category_mappings = []
+        self.ids = []
+
+    async def get_userinfo(self, refresh=False):
+        return
+
+    async def search(self, keyword=None, imdb_id=None, cate_level1_list: list = None, free: bool = False,
+                     page: int = None, timeout=None):
+        result = []
+        for i in self.ids:
+            t = TorrentInfo()
+            t.id = i
+            t.publish_date = datetime.datetime(2022, 1, 1) + datetime.timedelta(minutes=i)
+            result.append(t)
+        return result
+
+    async def download(self, url, filepath):
+        pass
+
+
+class TestWatermark(unittest.TestCase):
+    def test_stop_after_seen_streak(self):
+        parser = TrackerParser(SITE_CONFIG)
+        # 两个置顶的旧种子，5个新种子，后面都是拉取过的
+        page = build_page([10, 20] + list(range(105, 100, -1)) + list(range(100, 60, -1)))
+        self.assertEqual(47, len(parser.parse_torrents(page)))
+        with mock.patch.object(TorrentInfo, 'build_by_parse_item', wraps=TorrentInfo.build_by_parse_item) as build, \
+                mock.patch.object(TrackerParser, '__parse_row_id__', wraps=TrackerParser.__parse_row_id__) as parse_id:
+            torrents = parser.parse_torrents(page, watermark=Watermark(100))
+        self.assertEqual([105, 104, 103, 102, 101], [t.id for t in torrents])
+        # 拉取过的行只解析编号，连续10个拉取过的种子后不再往下解析
+        self.assertEqual(5, build.call_count)
+        self.assertEqual(2 + 5 + 10, parse_id.call_count)
+
+    def test_store_persist(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'watermarks.json')
+            store = WatermarkStore(path)
+            t = TorrentInfo()
+            t.id = 123
+            t.publish_date = datetime.datetime(2022, 10, 1, 8, 0)
+            store.update('demo', [t])
+            self.assertEqual(Watermark(123, t.publish_date), WatermarkStore(path).get('demo'))
+            self.assertIsNone(WatermarkStore(path).get('other'))
+
+    def test_searcher_list_delta(self):
+        tracker = ListTracker()
+        store = WatermarkStore()
+
+        async def poll():
+            return await TrackerSearcher(tracker, watermark_store=store).list()
+
+        tracker.ids = [3, 2, 1]
+        self.assertEqual([3, 2, 1], [t.id for t in asyncio.run(poll())])
+        tracker.ids = [5, 4, 3, 2, 1]
+        self.assertEqual([5, 4], [t.id for t in asyncio.run(poll())])
+        self.assertEqual([], asyncio.run(poll()))
+        self.assertEqual(5, store.get('demo').max_id)